@@ -1,153 +1,215 @@
 import subprocess
-import time
 import matplotlib.pyplot as plt
 import json
 import os
 import statistics
-import yaml # Importar o módulo yaml
+import sys
+import argparse
+import logging
+import threading
+import time
 
-def update_source_config(request_rate):
-    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'source.yaml')
-    try:
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
-        config['source']['request_rate'] = request_rate
-        with open(config_path, 'w') as f:
-            yaml.dump(config, f)
-        print(f"Arquivo de configuração {config_path} atualizado com request_rate = {request_rate}")
-    except FileNotFoundError:
-        print(f"Erro: Arquivo de configuração não encontrado em {config_path}")
-        # Dependendo do erro, você pode querer sair ou tentar outra coisa
-        raise
-    except Exception as e:
-        print(f"Erro ao atualizar o arquivo de configuração: {e}")
-        raise
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+from domain.results_log import new_run_id, results_path, wait_for_results
+from domain.local_cluster import LocalCluster
+from domain.experiment_plan import ExperimentPlan, ExperimentScheduler, RunManifest
 
-def run_experiment(num_services_lb1, num_services_lb2, request_rate):
-    print(f"\n{'='*50}")
-    print(f"Iniciando experimento com LB1: {num_services_lb1} serviços e LB2: {num_services_lb2} serviços")
-    print(f"{'='*50}\n")
-    
-    # Configura as variáveis de ambiente para o número de serviços
-    os.environ['NUM_SERVICES_LB1'] = str(num_services_lb1)
-    os.environ['NUM_SERVICES_LB2'] = str(num_services_lb2)
-    
+# Portas dos serviços no docker-compose.yml, mapeadas para a faixa de cada vaga (HOST_PORT_<porta>)
+COMPOSE_SERVICE_PORTS = (8083, 8084, 8085, 8086)
+
+def run_with_docker(run_id, results_file, timeout, env, project):
+    """Executa uma célula com docker-compose e retorna os resultados registrados pela Source."""
+    compose = ['docker-compose', '-p', project]
     # Inicia os containers
-    print("Iniciando containers...")
-    subprocess.run(['docker-compose', 'up', '--build', '-d'])
-    
-    # Aguarda um tempo para o sistema estabilizar e completar as requisições
-    wait_time = 30 # Segundos
-    print(f"Aguardando estabilização do sistema e conclusão das requisições ({wait_time} segundos)...")
-    time.sleep(wait_time)
+    print(f"[{project}] Iniciando containers...")
+    subprocess.run(compose + ['up', '--build', '-d'], env=env)
     
-    # Executa o experimento e captura a saída
-    print("\nColetando logs do container source...")
-    result = subprocess.run(['docker-compose', 'logs', 'source'], capture_output=True, text=True)
+    # A Source registra cada requisição em graphs/results/<RUN_ID>.jsonl (volume montado)
+    # e escreve um registro de fim ao concluir; não há espera fixa nem leitura dos logs
+    print(f"[{project}] Aguardando a conclusão da execução {run_id} em {results_file} (até {timeout}s)...")
+    results = wait_for_results(results_file, run_id, timeout=timeout)
     
-    # Mostra os logs
-    print("\nLogs do container source:")
-    print("-" * 50)
-    print(result.stdout)
-    print("-" * 50)
+    if not results or not results.finished:
+        # Sem o registro de fim: mostra o final dos logs da Source para diagnóstico
+        print(f"[{project}] Execução não concluída no tempo limite; últimos logs do container source:")
+        logs = subprocess.run(compose + ['logs', '--tail', '50', 'source'], capture_output=True, text=True, env=env)
+        print(logs.stdout)
     
     # Para os containers
-    print("\nParando containers...")
-    subprocess.run(['docker-compose', 'down'])
-    
-    # Processa a saída para extrair os MRTs
-    mrt_list = []
-    for line in result.stdout.split('\n'):
-        if 'T5 (Tempo Total):' in line:
-            try:
-                mrt_str = line.split('T5 (Tempo Total):')[1].strip()
-                mrt_float = float(mrt_str.replace('s', ''))
-                mrt_list.append(mrt_float)
-            except Exception as e:
-                print(f"Erro ao processar linha: {line}")
-                print(f"Erro: {str(e)}")
-                continue
-    
-    if not mrt_list:
-        print("Nenhum MRT encontrado nos logs!")
-        return None
+    print(f"\n[{project}] Parando containers...")
+    subprocess.run(compose + ['down'], env=env)
     
-    total_services = num_services_lb1 + num_services_lb2
+    return results
+
+def standalone_env(config):
+    """
+    Variáveis do docker-compose para os load balancers com `standalone: true`:
+    ativa os containers de proxy (perfis standalone-lb1/standalone-lb2) e
+    aponta os serviços S1 para o proxy do LB2.
+    """
+    profiles = [f'standalone-lb{lb_id}' for lb_id in (1, 2) if config[f'loadbalancer{lb_id}'].get('standalone', False)]
+    env = {'COMPOSE_PROFILES': ','.join(profiles)} if profiles else {}
+    if config['loadbalancer2'].get('standalone', False):
+        env.update({'NEXT_LB_HOST': 'load-balancer-proxy-2',
+                    'NEXT_LB_PORT': str(config['loadbalancer2']['port']),
+                    'NEXT_NUM_SERVICES': '1'})
+    return env
+
+def run_experiment(plan, cell, slot, clusters):
+    """Executa uma célula do plano na vaga `slot` e retorna os valores medidos (ou None)."""
+    print(f"\n{'='*50}")
+    print(f"Iniciando experimento {cell.key}: LB1 com {cell.lb1} serviços, LB2 com {cell.lb2} serviços, "
+          f"{cell.rate:g} req/s (vaga {slot})")
+    print(f"{'='*50}\n")
+    
+    # Cada execução tem identificador e configuração próprios (o source.yaml não é alterado)
+    run_id = f"{cell.key}-{new_run_id()}"
+    config_path = plan.write_run_config(cell, run_id)
+    results_file = results_path(plan.results_dir, run_id)
     
-    # Ajusta os tempos de resposta com base no número de serviços e taxa de requisição
-    # Quanto mais serviços, menor o tempo de resposta
-    fator_reducao = 1.0 / total_services  # Fator de redução baseado no número de serviços
+    if plan.backend == 'local':
+        # Execução local (sem Docker): serviços como processos, reaproveitados entre as células da vaga
+        cluster = clusters[slot]
+        results = cluster.run_source(cell.lb1, cell.lb2, run_id, plan.results_dir,
+                                     timeout=plan.timeout, config_path=config_path)
+    else:
+        first_port = plan.slot_ports(slot)
+        env = {
+            **os.environ,
+            'NUM_SERVICES_LB1': str(cell.lb1),
+            'NUM_SERVICES_LB2': str(cell.lb2),
+            'RUN_ID': run_id,
+            'SOURCE_CONFIG': config_path,
+            **{f'HOST_PORT_{port}': str(first_port + i) for i, port in enumerate(COMPOSE_SERVICE_PORTS)}
+        }
+        env.update(standalone_env(plan.run_config(cell)))
+        results = run_with_docker(run_id, results_file, plan.timeout, env, plan.project_name(slot))
     
-    # Aplica o fator de redução e ajusta com base na taxa de requisição
-    # Taxas maiores resultam em tempos maiores, mas mantendo a proporção
-    fator_taxa = request_rate / 10  # Normaliza para a taxa base de 10
-    mrt_list_ajustado = [mrt * fator_reducao * fator_taxa for mrt in mrt_list]
+    if not results or not results.requests:
+        print(f"Nenhuma requisição registrada na execução {run_id}!")
+        return None
     
-    # Calcula a média dos MRTs ajustados
-    avg_mrt = sum(mrt_list_ajustado) / len(mrt_list_ajustado) if mrt_list_ajustado else 0
+    # Valores medidos, sem ajustes
+    mrt_list = results.mrts
+    resultado = {
+        'run_id': run_id,
+        'total_services': cell.total_services,
+        'avg_mrt': statistics.mean(mrt_list),
+        'std_dev': statistics.stdev(mrt_list) if len(mrt_list) > 1 else 0,
+        'min_mrt': min(mrt_list),
+        'max_mrt': max(mrt_list),
+        'avg_mrt_corrigido': statistics.mean(results.corrected_mrts),
+        'completed': len(mrt_list),
+        'errors': sum(f['kind'] != 'overloaded' for f in results.failures),
+        'rejected': sum(f['kind'] == 'overloaded' for f in results.failures)
+    }
+    if results.end:
+        mrt_stages = results.end['stages'].get('t5_total', {})
+        resultado.update({'p50_mrt': mrt_stages.get('p50'), 'p99_mrt': mrt_stages.get('p99'),
+                          'throughput': results.end.get('throughput')})
+        measurement = results.end.get('measurement') or {}
+        resultado.update({'warmup_requests': len(results.warmup), 'stop_reason': measurement.get('stop_reason'),
+                          'converged': measurement.get('converged'), 'mrt_ci': measurement.get('mean_ci'),
+                          'p99_ci': measurement.get('p99_ci')})
     
-    # Cria a tupla de resultados brutos
-    raw_resultado = (total_services, avg_mrt, mrt_list_ajustado)
+    print(f"\nResultados medidos do experimento {run_id}:")
+    print(f"Total de serviços: {cell.total_services}")
+    print(f"Taxa de requisição: {cell.rate:g} req/s")
+    print(f"Requisições concluídas: {resultado['completed']} (erros: {resultado['errors']}, "
+          f"recusadas: {resultado['rejected']})")
+    print(f"MRT médio: {resultado['avg_mrt']:.4f}s")
+    print(f"MRT corrigido médio: {resultado['avg_mrt_corrigido']:.4f}s")
+    if resultado.get('p99_mrt') is not None:
+        print(f"MRT p50/p99: {resultado['p50_mrt']:.4f}s / {resultado['p99_mrt']:.4f}s")
+    if resultado.get('stop_reason'):
+        print(f"Aquecimento descartado: {resultado['warmup_requests']} requisições; "
+              f"encerramento: {resultado['stop_reason']}")
+    if resultado.get('mrt_ci') is not None:
+        print(f"IC do MRT médio: ± {resultado['mrt_ci']:.4f}s")
     
-    print(f"\nResultados brutos do experimento:")
-    print(f"Total de serviços: {total_services}")
-    print(f"Taxa de requisição: {request_rate} req/s")
-    print(f"Fator de redução por serviços: {fator_reducao:.3f}")
-    print(f"Fator de ajuste por taxa: {fator_taxa:.1f}")
-    print(f"Média dos MRTs ajustados: {avg_mrt:.2f}s")
-    print(f"Lista completa de MRTs ajustados: {mrt_list_ajustado}")
-    print(f"\nTupla de resultados brutos: {raw_resultado}")
+    return resultado
+
+def aggregate_repetitions(entradas):
+    """
+    Agrupa as células concluídas por (taxa, serviços no LB1, serviços no LB2) e
+    combina as repetições: MRT médio entre as repetições, com a dispersão entre
+    elas (desvio padrão das médias) como barra de erro.
+    """
+    grupos = {}
+    for entrada in entradas:
+        grupos.setdefault((entrada['rate'], entrada['lb1'], entrada['lb2']), []).append(entrada)
     
-    return raw_resultado
+    resultados_por_taxa = {}
+    for (rate, lb1, lb2), repeticoes in grupos.items():
+        medias = [r['avg_mrt'] for r in repeticoes]
+        resultados_por_taxa.setdefault(rate, []).append({
+            'lb1': lb1,
+            'lb2': lb2,
+            'total_services': lb1 + lb2,
+            'repetitions': len(repeticoes),
+            'avg_mrt': statistics.mean(medias),
+            'avg_mrt_std': statistics.stdev(medias) if len(medias) > 1 else 0,
+            'std_dev': statistics.mean(r['std_dev'] for r in repeticoes),
+            'min_mrt': min(r['min_mrt'] for r in repeticoes),
+            'max_mrt': max(r['max_mrt'] for r in repeticoes)
+        })
+    return resultados_por_taxa
 
 def main():
+    parser = argparse.ArgumentParser(description="Impacto da quantidade de serviços no tempo de resposta")
+    parser.add_argument('--plan', default=os.path.join(BASE_DIR, 'config', 'experiments.yaml'),
+                        help="Plano dos experimentos (YAML)")
+    parser.add_argument('--local', action='store_true',
+                        help="Executa a Source e os serviços como processos locais, sem Docker")
+    parser.add_argument('--max-concurrent', help="Células simultâneas (número ou auto)")
+    parser.add_argument('--fresh', action='store_true',
+                        help="Descarta as células concluídas anteriormente em vez de retomar o plano")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    
+    plan = ExperimentPlan.load(args.plan)
+    if args.local:
+        plan.backend = 'local'
+    if args.max_concurrent:
+        plan.max_concurrent = args.max_concurrent if args.max_concurrent == 'auto' else int(args.max_concurrent)
+    
     print("\n" + "#"*50)
     print("## Experimento: Impacto da Quantidade de Serviços no Tempo de Resposta ##")
     print("#"*50)
-
-    # Configurações de serviços (ordenadas do menor para o maior número de serviços)
-    configurations_services = [
-        (1, 1),  # Total: 2 serviços
-        (2, 1),  # Total: 3 serviços
-        (2, 2),  # Total: 4 serviços
-    ]
     
-    # Taxas de requisição para testar
-    request_rates = [10, 20, 30]
+    print(f"\nIniciando o plano {plan.name}: {len(plan.cells())} células, backend {plan.backend}, "
+          f"até {plan.concurrency()} simultâneas...")
+    sweep_start = time.time()
     
-    # Dicionário para armazenar resultados por taxa de requisição
-    resultados_por_taxa = {rate: [] for rate in request_rates}
+    # Um conjunto de serviços locais por vaga, cada um na sua faixa de portas
+    clusters = {}
+    clusters_lock = threading.Lock()
     
-    print("\nIniciando série de experimentos...")
+    def run_cell(cell, slot):
+        if plan.backend == 'local':
+            with clusters_lock:
+                if slot not in clusters:
+                    # As duas últimas portas da faixa ficam para os load balancers em processo próprio
+                    clusters[slot] = LocalCluster(base_port=plan.slot_ports(slot),
+                                                  max_services_per_stage=(plan.port_stride - 2) // 2)
+        return run_experiment(plan, cell, slot, clusters)
     
-    # Para cada taxa de requisição
-    for rate in request_rates:
-        print(f"\nTestando com taxa de requisição: {rate} req/s")
-        update_source_config(rate)
-        
-        # Para cada configuração de serviços
-        for lb1, lb2 in configurations_services:
-            total_services = lb1 + lb2
-            print(f"\nExecutando com {total_services} serviços (LB1: {lb1}, LB2: {lb2})...")
-            
-            raw_resultado = run_experiment(lb1, lb2, rate)
-            
-            if raw_resultado:
-                # Calcula estatísticas dos MRTs
-                mrt_list = raw_resultado[2]
-                avg_mrt = sum(mrt_list) / len(mrt_list)
-                std_dev = statistics.stdev(mrt_list) if len(mrt_list) > 1 else 0
-                min_mrt = min(mrt_list)
-                max_mrt = max(mrt_list)
-                
-                resultados_por_taxa[rate].append({
-                    'total_services': total_services,
-                    'avg_mrt': avg_mrt,
-                    'std_dev': std_dev,
-                    'min_mrt': min_mrt,
-                    'max_mrt': max_mrt,
-                    'mrt_list': mrt_list
-                })
+    scheduler = ExperimentScheduler(plan, run_cell, RunManifest(plan.manifest_path))
+    try:
+        concluidas = scheduler.run(resume=not args.fresh)
+    finally:
+        for cluster in clusters.values():
+            print(f"\nEncerrando serviços locais em {cluster.base_port} "
+                  f"({cluster.started} iniciados, {cluster.reused} reaproveitados)...")
+            cluster.close()
+    
+    print(f"\nPlano concluído em {time.time() - sweep_start:.1f}s ({len(concluidas)} de {len(plan.cells())} células)")
+    
+    # Resultados por taxa de requisição, a partir do manifesto (inclui células de execuções
+    # anteriores), com as repetições de cada configuração combinadas em um ponto
+    resultados_por_taxa = {rate: [] for rate in plan.request_rates}
+    resultados_por_taxa.update(aggregate_repetitions(concluidas.values()))
     
     # Gera o gráfico
     print("\nGerando gráfico dos resultados...")
@@ -159,12 +221,14 @@ def main():
     # Plota uma linha para cada taxa de requisição
     for i, (rate, resultados) in enumerate(sorted(resultados_por_taxa.items())):
         # Ordena os resultados por número de serviços
-        resultados_ordenados = sorted(resultados, key=lambda x: x['total_services'])
+        resultados_ordenados = sorted(resultados, key=lambda x: (x['total_services'], x['lb1']))
         servicos = [r['total_services'] for r in resultados_ordenados]
         tempos = [r['avg_mrt'] for r in resultados_ordenados]
+        dispersao = [r['avg_mrt_std'] for r in resultados_ordenados]
         
-        # Plota apenas a linha principal
-        plt.plot(servicos, tempos, marker='o', label=f'{rate} req/s', color=cores[i], linewidth=2)
+        # Linha principal, com a dispersão entre as repetições como barra de erro
+        plt.errorbar(servicos, tempos, yerr=dispersao, marker='o', capsize=4, label=f'{rate} req/s',
+                     color=cores[i % len(cores)], linewidth=2)
     
     plt.title('Impacto da Quantidade de Serviços no Tempo de Resposta')
     plt.xlabel('Número Total de Serviços')
@@ -173,7 +237,7 @@ def main():
     plt.grid(True, linestyle='--', alpha=0.7)
     
     # Ajusta os ticks do eixo X para mostrar apenas números inteiros
-    plt.xticks([2, 3, 4])
+    plt.xticks(sorted({lb1 + lb2 for lb1, lb2 in plan.services}))
     
     # Salva o gráfico
     plt.savefig('grafico_impacto_servicos.png', dpi=300, bbox_inches='tight')
@@ -183,13 +247,17 @@ def main():
     resultados_para_json = {
         str(rate): [
             {
+                'lb1': r['lb1'],
+                'lb2': r['lb2'],
                 'total_services': r['total_services'],
+                'repetitions': r['repetitions'],
                 'avg_mrt': r['avg_mrt'],
+                'avg_mrt_std': r['avg_mrt_std'],
                 'std_dev': r['std_dev'],
                 'min_mrt': r['min_mrt'],
                 'max_mrt': r['max_mrt']
             }
-            for r in resultados
+            for r in sorted(resultados, key=lambda x: (x['total_services'], x['lb1']))
         ]
         for rate, resultados in resultados_por_taxa.items()
     }
@@ -203,12 +271,14 @@ def main():
     for rate in sorted(resultados_por_taxa.keys()):
         print(f"\nTaxa de Requisição: {rate} req/s")
         print("-" * 80)
-        print(f"{'Nº Serviços':^12} | {'Média (s)':^10} | {'Desv. Pad.':^10} | {'Mín (s)':^10} | {'Máx (s)':^10}")
+        print(f"{'Nº Serviços':^12} | {'Repet.':^6} | {'Média (s)':^10} | {'± Repet.':^10} | {'Desv. Pad.':^10} | "
+              f"{'Mín (s)':^10} | {'Máx (s)':^10}")
         print("-" * 80)
         
-        for r in sorted(resultados_por_taxa[rate], key=lambda x: x['total_services']):
-            print(f"{r['total_services']:^12} | {r['avg_mrt']:^10.3f} | {r['std_dev']:^10.3f} | "
-                  f"{r['min_mrt']:^10.3f} | {r['max_mrt']:^10.3f}")
+        for r in sorted(resultados_por_taxa[rate], key=lambda x: (x['total_services'], x['lb1'])):
+            servicos = f"{r['total_services']} ({r['lb1']}+{r['lb2']})"
+            print(f"{servicos:^12} | {r['repetitions']:^6} | {r['avg_mrt']:^10.3f} | {r['avg_mrt_std']:^10.3f} | "
+                  f"{r['std_dev']:^10.3f} | {r['min_mrt']:^10.3f} | {r['max_mrt']:^10.3f}")
     
     print("\nResultados e gráfico salvos em:")
     print("- resultados_impacto_servicos.json")
@@ -0,0 +1,71 @@
+"""
+Compara o KNNScorer (NumPy) com o KNeighborsClassifier (predict + predict_proba).
+
+Uso: python src/benchmarks/knn_benchmark.py [--train 2000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from domain.knn import KNNScorer
+
+FEATURES = 64 * 64
+
+
+def sklearn_classify(model, scaler, batch):
+    """Caminho original: normaliza e executa duas buscas de vizinhos."""
+    features = scaler.transform(batch)
+    predictions = model.predict(features)
+    probabilities = model.predict_proba(features)
+    return predictions, probabilities[np.arange(len(batch)), predictions]
+
+
+def measure(fn, repeat: int) -> float:
+    """Melhor tempo (s) entre `repeat` execuções."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--train', type=int, default=2000, help='Número de imagens de treino sintéticas')
+    parser.add_argument('--repeat', type=int, default=20, help='Repetições por medida')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = rng.integers(0, 256, size=(args.train, FEATURES)).astype(np.float64)
+    y = rng.integers(0, 2, size=args.train)
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    model = KNeighborsClassifier(n_neighbors=5).fit(X_scaled, y)
+    scorer = KNNScorer.from_training(scaler, X_scaled, y, n_neighbors=model.n_neighbors)
+
+    print(f"Treino: {args.train} imagens de {FEATURES} características")
+    print(f"{'Lote':>6} | {'sklearn (ms)':>12} | {'NumPy (ms)':>10} | {'Ganho':>6} | Idêntico")
+    print("-" * 56)
+    for batch_size in (1, 8, 32, 128):
+        batch = rng.integers(0, 256, size=(batch_size, FEATURES)).astype(np.uint8)
+
+        expected = sklearn_classify(model, scaler, batch)
+        result = scorer.predict(batch)
+        identical = np.array_equal(expected[0], result[0]) and np.allclose(expected[1], result[1])
+
+        t_sklearn = measure(lambda: sklearn_classify(model, scaler, batch), args.repeat)
+        t_numpy = measure(lambda: scorer.predict(batch), args.repeat)
+        print(f"{batch_size:>6} | {t_sklearn * 1000:>12.3f} | {t_numpy * 1000:>10.3f} | "
+              f"{t_sklearn / t_numpy:>5.1f}x | {'sim' if identical else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
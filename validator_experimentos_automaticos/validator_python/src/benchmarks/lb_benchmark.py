@@ -0,0 +1,80 @@
+"""
+Mede a vazão de escolha do LoadBalancerProxy com 1..N threads concorrentes.
+
+Cada thread repete o ciclo de uma requisição sem rede: escolhe o serviço,
+marca o início, registra o sucesso e marca o fim. Ao final confere que os
+contadores de requisições em andamento voltaram a zero e que o total de
+requisições contadas bate com o de escolhas.
+
+Uso: python src/benchmarks/lb_benchmark.py [--services 4] [--threads 1 2 4 8] [--duration 1.0]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from domain.balancing import POLICIES
+from domain.load_balancer_proxy import LoadBalancerProxy
+
+
+def stress(balancer: LoadBalancerProxy, threads: int, duration: float) -> int:
+    """Executa o ciclo de escolha em `threads` threads por `duration` segundos; retorna o total de escolhas."""
+    counts = [0] * threads
+    start = threading.Barrier(threads + 1)
+    stop = threading.Event()
+
+    def worker(index: int):
+        choose = balancer.get_available_service
+        backends = balancer.backends
+        count = 0
+        start.wait()
+        while not stop.is_set():
+            balancer.increment_request_count()
+            backend = backends[choose()]
+            backend.begin()
+            balancer.mark_service_success(backend.address, 0.001)
+            backend.end()
+            count += 1
+        counts[index] = count
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+    return sum(counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--services', type=int, default=4, help='Serviços atrás do balanceador')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='Números de threads')
+    parser.add_argument('--duration', type=float, default=1.0, help='Duração de cada medida (s)')
+    args = parser.parse_args()
+
+    services = [f"127.0.0.1:{20000 + i}" for i in range(args.services)]
+    print(f"{args.services} serviços, {args.duration:.1f}s por medida (escolhas por segundo)")
+    print(f"{'Política':>20} | " + " | ".join(f"{n:>4} thr" for n in args.threads) + " | Consistente")
+    print("-" * (36 + 11 * len(args.threads)))
+    for algorithm in POLICIES:
+        rates = []
+        consistent = True
+        for threads in args.threads:
+            # Sem verificação ativa: os endereços não existem
+            balancer = LoadBalancerProxy(services, algorithm=algorithm, health_check_interval=0)
+            selections = stress(balancer, threads, args.duration)
+            rates.append(selections / args.duration)
+            consistent &= balancer.request_count == selections and all(
+                backend.outstanding == 0 for backend in balancer.backends.values())
+            balancer.close()
+        print(f"{algorithm:>20} | " + " | ".join(f"{rate / 1000:>6.0f}k" for rate in rates) +
+              f" | {'sim' if consistent else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
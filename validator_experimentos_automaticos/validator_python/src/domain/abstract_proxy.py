@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any
+import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime
@@ -16,6 +17,7 @@ class AbstractProxy(ABC):
     def __init__(self, target_address: str):
         self.target_address = target_address
         self._request_count = 0
+        self._count_lock = threading.Lock()
         self._timing_metrics = TimingMetrics()
 
     @property
@@ -23,7 +25,8 @@ class AbstractProxy(ABC):
         return self._request_count
 
     def increment_request_count(self) -> None:
-        self._request_count += 1
+        with self._count_lock:
+            self._request_count += 1
 
     def record_timing(self, stage: str, start_time: float = None) -> float:
         """
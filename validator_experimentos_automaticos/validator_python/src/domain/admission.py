@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class AdmissionController:
+    """
+    Controle de admissão de requisições de um serviço.
+
+    Até `max_in_flight` requisições são processadas ao mesmo tempo; as
+    seguintes esperam em uma fila de até `max_queue` posições, por no máximo
+    `queue_timeout_ms`. Com a fila cheia (ou a espera esgotada) a requisição é
+    recusada imediatamente, para que a sobrecarga vire recusas rápidas em vez
+    de latência e memória sem limite.
+
+    No servidor asyncio o event loop não pode esperar: ele reserva a posição
+    sem bloquear (`reserve`) antes de entregar a requisição ao executor, e a
+    thread do executor converte a reserva em vaga (`acquire_reserved`),
+    recusando-a se a espera desde a reserva passou de `queue_timeout_ms`.
+    """
+
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 64, queue_timeout_ms: float = 1000.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout_ms / 1000.0
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+
+    def acquire(self) -> bool:
+        """Admite a requisição (esperando na fila se preciso); False se ela deve ser recusada."""
+        with self._condition:
+            if self.in_flight < self.max_in_flight and not self.queued:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.queued >= self.max_queue:
+                self.rejected_queue_full += 1
+                return False
+
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+            return self._wait_for_slot(time.monotonic() + self.queue_timeout)
+
+    def reserve(self) -> Optional[float]:
+        """
+        Reserva, sem bloquear, uma posição entre as `max_in_flight + max_queue`
+        disponíveis. Retorna o instante da reserva (a passar a acquire_reserved)
+        ou None se a requisição deve ser recusada.
+        """
+        with self._condition:
+            if self.in_flight + self.queued >= self.max_in_flight + self.max_queue:
+                self.rejected_queue_full += 1
+                return None
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+            return time.monotonic()
+
+    def acquire_reserved(self, reserved_at: float) -> bool:
+        """Converte uma reserva em vaga de processamento; False se a espera total esgotou queue_timeout_ms."""
+        with self._condition:
+            return self._wait_for_slot(reserved_at + self.queue_timeout)
+
+    def _wait_for_slot(self, deadline: float) -> bool:
+        """Aguarda (com a trava) uma vaga para uma requisição já contada na fila."""
+        try:
+            while self.in_flight >= self.max_in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if self.in_flight < self.max_in_flight:
+                        break
+                    self.rejected_timeout += 1
+                    return False
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        """Libera a vaga de uma requisição admitida."""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Ocupação atual e contadores de admissão e recusa."""
+        with self._condition:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'max_queue_depth': self.max_queue_depth,
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout
+            }
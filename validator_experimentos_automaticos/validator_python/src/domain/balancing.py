@@ -0,0 +1,97 @@
+import itertools
+import random
+from abc import ABC, abstractmethod
+from typing import Sequence
+
+# Peso da amostra mais recente na média móvel exponencial (EWMA) da latência
+EWMA_ALPHA = 0.3
+
+
+class BalancingPolicy(ABC):
+    """
+    Política de escolha do serviço de destino.
+
+    `choose` recebe o estado dos serviços disponíveis (BackendState do
+    LoadBalancerProxy: outstanding, ewma, response_time...) e retorna o
+    escolhido. As políticas só leem o estado, sem travas, e podem ser usadas
+    por várias threads ao mesmo tempo.
+    """
+
+    name = ''
+
+    @abstractmethod
+    def choose(self, candidates: Sequence['BackendState']) -> 'BackendState':
+        """Escolhe um dos serviços candidatos (lista não vazia)."""
+        pass
+
+
+class RoundRobinPolicy(BalancingPolicy):
+    """Revezamento circular entre os serviços disponíveis."""
+
+    name = 'round-robin'
+
+    def __init__(self):
+        # next() em itertools.count é atômico no CPython: dispensa trava
+        self._counter = itertools.count()
+
+    def choose(self, candidates: Sequence['BackendState']) -> 'BackendState':
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class LeastOutstandingPolicy(BalancingPolicy):
+    """Serviço com menos requisições em andamento (empates decididos ao acaso)."""
+
+    name = 'least-outstanding'
+
+    def choose(self, candidates: Sequence['BackendState']) -> 'BackendState':
+        return min(candidates, key=lambda b: (b.outstanding, random.random()))
+
+
+class PowerOfTwoChoicesPolicy(BalancingPolicy):
+    """Sorteia dois serviços e fica com o que tem menos requisições em andamento."""
+
+    name = 'p2c'
+
+    def choose(self, candidates: Sequence['BackendState']) -> 'BackendState':
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+
+class EwmaLatencyPolicy(BalancingPolicy):
+    """
+    Menor latência esperada: EWMA da latência multiplicada pelas requisições
+    em andamento (+1). Serviços ainda sem medida são experimentados primeiro.
+    """
+
+    name = 'ewma'
+
+    def choose(self, candidates: Sequence['BackendState']) -> 'BackendState':
+        def cost(backend: 'BackendState') -> float:
+            ewma = backend.ewma
+            if ewma is None:
+                return -1.0
+            return ewma * (backend.outstanding + 1)
+        return min(candidates, key=lambda b: (cost(b), random.random()))
+
+
+class LeastResponseTimePolicy(BalancingPolicy):
+    """Serviço com o menor tempo da última resposta (comportamento original do proxy)."""
+
+    name = 'least-response-time'
+
+    def choose(self, candidates: Sequence['BackendState']) -> 'BackendState':
+        return min(candidates, key=lambda b: b.response_time)
+
+
+POLICIES = {policy.name: policy for policy in (
+    RoundRobinPolicy, LeastOutstandingPolicy, PowerOfTwoChoicesPolicy, EwmaLatencyPolicy, LeastResponseTimePolicy
+)}
+
+
+def create_policy(name: str) -> BalancingPolicy:
+    """Cria a política pelo nome usado nas configurações (campo `algorithm`)."""
+    if name not in POLICIES:
+        raise ValueError(f"Algoritmo de balanceamento desconhecido: {name} (use {', '.join(POLICIES)})")
+    return POLICIES[name]()
@@ -0,0 +1,90 @@
+import bisect
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Limites (ms) das faixas do histograma de tempo de espera na fila
+WAIT_BUCKETS_MS = [0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100]
+
+
+class BatchingClassifier:
+    """
+    Fachada de micro-lotes para o ImageClassifierService.
+
+    Requisições concorrentes entram em uma fila e são agrupadas até
+    `max_batch_size` itens ou até o primeiro item esperar `max_wait_ms`. O lote
+    é normalizado e classificado como uma única matriz e cada resultado volta
+    para quem o pediu. Troca um aumento limitado de latência por vazão.
+    """
+
+    def __init__(self, classifier, max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.batch_size_counts = [0] * (max_batch_size + 1)  # Índice = tamanho do lote
+        self.wait_counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self._worker = threading.Thread(target=self._run, name='batching', daemon=True)
+        self._worker.start()
+
+    def classify_features(self, features: np.ndarray) -> Tuple[str, float]:
+        """Enfileira um vetor de características e aguarda o resultado do seu lote."""
+        future: Future = Future()
+        self._queue.put((features, future, time.perf_counter()))
+        return future.result()
+
+    def _next_batch(self) -> List[Tuple[np.ndarray, Future, float]]:
+        """Aguarda o primeiro item e agrupa os seguintes até o limite de tamanho ou de espera."""
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                results = self.classifier.classify_batch(np.vstack([features for features, _, _ in batch]))
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Erro ao classificar lote de {len(batch)} imagens: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            self._record(batch, started)
+
+    def _record(self, batch: List[Tuple[np.ndarray, Future, float]], started: float):
+        """Atualiza os histogramas de tamanho de lote e de tempo de espera."""
+        with self._lock:
+            self.batch_size_counts[len(batch)] += 1
+            for _, _, enqueued in batch:
+                wait_ms = (started - enqueued) * 1000
+                self.wait_counts[bisect.bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Histogramas de tamanho de lote e de espera na fila (faixas em ms)."""
+        with self._lock:
+            batches = sum(self.batch_size_counts)
+            items = sum(size * count for size, count in enumerate(self.batch_size_counts))
+            labels = [f"<={edge}" for edge in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}"]
+            return {
+                'batches': batches,
+                'items': items,
+                'mean_batch_size': items / batches if batches else 0.0,
+                'batch_size_histogram': {size: count for size, count in enumerate(self.batch_size_counts) if count},
+                'wait_ms_histogram': {label: count for label, count in zip(labels, self.wait_counts) if count}
+            }
@@ -0,0 +1,134 @@
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from .framing import send_frame, recv_frame, ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+
+class StaleConnection(ConnectionClosed):
+    """
+    A conexão ociosa já tinha sido encerrada pelo servidor: o envio falhou ou
+    a conexão terminou antes de qualquer byte da resposta. Só nesse caso a
+    requisição é reenviada, pois o servidor não chegou a processá-la.
+    """
+
+
+class ConnectionPool:
+    """
+    Pool limitado de conexões TCP persistentes por destino ("host:porta").
+
+    Cada destino aceita no máximo `max_per_target` conexões simultâneas; as
+    conexões ociosas são reaproveitadas pelas próximas requisições, evitando
+    o custo do handshake e o acúmulo de sockets em TIME_WAIT.
+    """
+
+    def __init__(self, max_per_target: int = 8, timeout: float = 10.0,
+                 retry_attempts: int = 3, retry_delay: float = 1.0):
+        self.max_per_target = max_per_target
+        self.timeout = timeout
+        self.retry_attempts = retry_attempts
+        self.retry_delay = retry_delay
+        self._idle: Dict[str, Deque[socket.socket]] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self.connects = 0  # Conexões novas abertas (para comparar com o número de requisições)
+
+    def _target_state(self, target: str):
+        with self._lock:
+            if target not in self._slots:
+                self._slots[target] = threading.BoundedSemaphore(self.max_per_target)
+                self._idle[target] = deque()
+            return self._slots[target], self._idle[target]
+
+    def _connect(self, target: str) -> socket.socket:
+        """Abre uma nova conexão com o destino, com novas tentativas."""
+        host, port = target.split(':')
+        for attempt in range(self.retry_attempts):
+            try:
+                s = socket.create_connection((host, int(port)), timeout=self.timeout)
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with self._lock:
+                    self.connects += 1
+                return s
+            except Exception as e:
+                if attempt < self.retry_attempts - 1:
+                    logger.warning(f"Tentativa {attempt + 1} de {self.retry_attempts} falhou ao conectar em {target}. Aguardando {self.retry_delay} segundos...")
+                    time.sleep(self.retry_delay)
+                else:
+                    raise Exception(f"Não foi possível conectar em {target} após {self.retry_attempts} tentativas: {str(e)}")
+
+    def request(self, target: str, payload: bytes) -> bytes:
+        """Envia uma mensagem ao destino por uma conexão do pool e retorna a resposta."""
+        slots, idle = self._target_state(target)
+        if not slots.acquire(timeout=self.timeout):
+            raise Exception(f"Tempo esgotado aguardando conexão livre para {target}")
+        try:
+            try:
+                sock = idle.pop()
+                reused = True
+            except IndexError:
+                sock = self._connect(target)
+                reused = False
+
+            try:
+                response = self._exchange(sock, payload)
+            except StaleConnection as e:
+                sock.close()
+                if not reused:
+                    raise
+                # Timeouts e respostas interrompidas não chegam aqui: o servidor pode
+                # já ter processado a requisição, e reenviá-la a duplicaria
+                logger.debug(f"Conexão reaproveitada com {target} inválida ({str(e)}), reconectando")
+                sock = self._connect(target)
+                try:
+                    response = self._exchange(sock, payload)
+                except Exception:
+                    sock.close()
+                    raise
+            except Exception:
+                sock.close()
+                raise
+
+            idle.append(sock)
+            return response
+        finally:
+            slots.release()
+
+    @staticmethod
+    def _exchange(sock: socket.socket, payload: bytes) -> bytes:
+        """
+        Envia a mensagem e lê a resposta. Levanta StaleConnection quando a
+        conexão já estava encerrada; timeouts e respostas incompletas são
+        repassados como estão.
+        """
+        try:
+            send_frame(sock, payload)
+        except socket.timeout:
+            raise
+        except OSError as e:
+            # Um servidor no limite de conexões responde 'overloaded' e fecha a
+            # conexão antes de ler a requisição: a recusa pode já estar no buffer
+            try:
+                response = recv_frame(sock)
+            except OSError:
+                response = None
+            if response is None:
+                raise StaleConnection(f"Falha ao enviar: {str(e)}") from e
+            return response
+        response = recv_frame(sock)
+        if response is None:
+            raise StaleConnection("Conexão encerrada antes da resposta")
+        return response
+
+    def close_all(self):
+        """Fecha todas as conexões ociosas."""
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop().close()
+        logger.info("Conexões do pool fechadas")
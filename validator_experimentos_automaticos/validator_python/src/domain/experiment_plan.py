@@ -0,0 +1,233 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Raiz do projeto: caminhos relativos do plano (e SOURCE_CONFIG) partem dela
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@dataclass(frozen=True)
+class Cell:
+    """Uma célula da matriz de experimentos: serviços atrás de cada LB e taxa de requisições."""
+    lb1: int
+    lb2: int
+    rate: float
+    repetition: int = 0
+
+    @property
+    def key(self) -> str:
+        key = f"lb{self.lb1}x{self.lb2}-r{self.rate:g}"
+        return f"{key}-{self.repetition}" if self.repetition else key
+
+    @property
+    def total_services(self) -> int:
+        return self.lb1 + self.lb2
+
+
+def _deep_merge(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class ExperimentPlan:
+    """
+    Plano declarativo dos experimentos (config/experiments.yaml): matriz de
+    serviços x taxas, backend, paralelismo e ajustes da configuração da
+    Source. Cada execução recebe o seu próprio arquivo de configuração, sem
+    alterar o source.yaml.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        plan = data['experiment']
+        self.name = plan.get('name', 'experimento')
+        self.backend = plan.get('backend', 'docker')
+        if self.backend not in ('docker', 'local'):
+            raise ValueError(f"Backend desconhecido: {self.backend} (use docker ou local)")
+        self.max_concurrent = plan.get('max_concurrent', 1)
+        self.base_port = plan.get('base_port', 18000)
+        self.port_stride = plan.get('port_stride', 100)
+        self.timeout = plan.get('timeout', 300)
+        self.repetitions = plan.get('repetitions', 1)
+        self.services = [tuple(pair) for pair in plan['services']]
+        self.request_rates = list(plan['request_rates'])
+        self.source_config = os.path.join(BASE_DIR, plan.get('source_config', os.path.join('config', 'source.yaml')))
+        self.source_overrides = plan.get('source', {}) or {}
+        # Opções comuns dos serviços (lidas por start_services.py em todos os backends)
+        self.service_config = os.path.join(BASE_DIR, 'config', 'service.yaml')
+        self.results_dir = os.path.join(BASE_DIR, plan.get('results_dir', os.path.join('graphs', 'results')))
+
+    @classmethod
+    def load(cls, path: str) -> 'ExperimentPlan':
+        with open(path, 'r') as f:
+            return cls(yaml.safe_load(f))
+
+    def cells(self) -> List[Cell]:
+        """Células na ordem de execução: por configuração de serviços e, dentro dela, por taxa."""
+        return [Cell(lb1, lb2, rate, repetition)
+                for lb1, lb2 in self.services
+                for rate in self.request_rates
+                for repetition in range(self.repetitions)]
+
+    def concurrency(self) -> int:
+        """
+        Células simultâneas. 'auto' reparte as CPUs entre as células para que uma
+        não distorça as medidas da outra: cada célula usa até um processo por
+        serviço mais a Source.
+        """
+        if self.max_concurrent == 'auto':
+            busiest = max(lb1 + lb2 for lb1, lb2 in self.services) + 1
+            return max(1, (os.cpu_count() or 1) // busiest)
+        return max(1, int(self.max_concurrent))
+
+    def slot_ports(self, slot: int) -> int:
+        """Primeira porta da faixa exclusiva de uma vaga de execução."""
+        return self.base_port + slot * self.port_stride
+
+    def project_name(self, slot: int) -> str:
+        """Nome do projeto docker-compose de uma vaga (containers e redes isolados)."""
+        return f"{self.name}_{slot}".lower().replace('-', '_')
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.results_dir, self.name, 'manifest.jsonl')
+
+    def run_config(self, cell: Cell) -> Dict[str, Any]:
+        """Configuração efetiva da Source para uma célula: source.yaml + ajustes do plano + taxa da célula."""
+        with open(self.source_config, 'r') as f:
+            config = _deep_merge(yaml.safe_load(f), self.source_overrides)
+        config['source']['request_rate'] = cell.rate
+        # Os resultados vão para o diretório do plano, onde o run_experiments.py os procura
+        config['source'].setdefault('results', {}).update(
+            {'enabled': True, 'directory': os.path.relpath(self.results_dir, BASE_DIR)})
+        return config
+
+    def config_hash(self, cell: Cell) -> str:
+        """
+        Hash da configuração efetiva da célula (Source, serviços e backend): um
+        resultado só é reaproveitado se ela não mudou.
+        """
+        with open(self.service_config, 'r') as f:
+            service = yaml.safe_load(f)
+        effective = {'backend': self.backend, 'source': self.run_config(cell), 'service': service}
+        encoded = json.dumps(effective, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+    def write_run_config(self, cell: Cell, run_id: str) -> str:
+        """Grava a configuração da Source de uma execução e retorna o caminho relativo à raiz do projeto."""
+        config = self.run_config(cell)
+        relative = os.path.relpath(os.path.join(self.results_dir, self.name, 'configs', f"{run_id}.yaml"), BASE_DIR)
+        path = os.path.join(BASE_DIR, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            yaml.safe_dump(config, f)
+        return relative
+
+
+class RunManifest:
+    """
+    Registro (JSON-lines, só acrescentado) das células concluídas de um plano,
+    com o hash da configuração efetiva de cada uma. Ao retomar após uma falha,
+    só são puladas as células registradas com a mesma configuração.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def completed(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        entries = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.endswith('\n'):
+                    entry = json.loads(line)
+                    entries[entry['cell']] = entry
+        return entries
+
+    def add(self, cell: Cell, result: Dict[str, Any], config_hash: Optional[str] = None):
+        entry = {'cell': cell.key, 'lb1': cell.lb1, 'lb2': cell.lb2, 'rate': cell.rate,
+                 'repetition': cell.repetition, 'config_hash': config_hash, **result}
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def reset(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class ExperimentScheduler:
+    """
+    Executa as células de um plano com até `plan.concurrency()` delas ao mesmo
+    tempo. Cada célula ocupa uma vaga (slot) com faixa de portas e nome de
+    projeto exclusivos; `run_cell(cell, slot)` retorna o resultado da célula
+    (ou None se ela falhou), que é registrado no manifesto.
+    """
+
+    def __init__(self, plan: ExperimentPlan, run_cell: Callable[[Cell, int], Optional[Dict[str, Any]]],
+                 manifest: Optional[RunManifest] = None):
+        self.plan = plan
+        self.run_cell = run_cell
+        self.manifest = manifest or RunManifest(plan.manifest_path)
+
+    def run(self, resume: bool = True) -> Dict[str, Dict[str, Any]]:
+        """Executa as células pendentes e retorna os resultados de todas as células concluídas."""
+        if not resume:
+            self.manifest.reset()
+        hashes = {cell.key: self.plan.config_hash(cell) for cell in self.plan.cells()}
+        done = self._completed(hashes)
+        pending = [cell for cell in self.plan.cells() if cell.key not in done]
+        stale = sum(1 for key, entry in self.manifest.completed().items()
+                    if key in hashes and key not in done)
+        if stale:
+            logger.info(f"{stale} células concluídas com outra configuração serão executadas novamente")
+        if done:
+            logger.info(f"Retomando o plano {self.plan.name}: {len(done)} células já concluídas, {len(pending)} pendentes")
+        if not pending:
+            return done
+
+        workers = min(self.plan.concurrency(), len(pending))
+        slots: 'queue.Queue[int]' = queue.Queue()
+        for slot in range(workers):
+            slots.put(slot)
+
+        def task(cell: Cell):
+            slot = slots.get()
+            try:
+                result = self.run_cell(cell, slot)
+            except Exception as e:
+                logger.error(f"Célula {cell.key} falhou: {str(e)}")
+                result = None
+            finally:
+                slots.put(slot)
+            if result:
+                self.manifest.add(cell, result, hashes[cell.key])
+
+        logger.info(f"Executando {len(pending)} células com até {workers} simultâneas")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='experiment') as executor:
+            list(executor.map(task, pending))
+        return self._completed(hashes)
+
+    def _completed(self, hashes: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Células do plano concluídas com a configuração atual."""
+        return {key: entry for key, entry in self.manifest.completed().items()
+                if entry.get('config_hash') == hashes.get(key)}
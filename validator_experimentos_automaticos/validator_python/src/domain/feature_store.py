@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEATURES_FILE = 'features.npy'
+MANIFEST_FILE = 'manifest.json'
+
+
+class FeatureStore:
+    """
+    Armazena em disco as características pré-processadas das imagens de treinamento.
+
+    A matriz fica em um .npy (carregado com memória mapeada) e o manifesto
+    guarda, para cada linha, o caminho, o mtime, o tamanho e o rótulo da
+    imagem. Em cada sincronização apenas as imagens novas ou alteradas são
+    processadas; as demais linhas são reaproveitadas.
+    """
+
+    def __init__(self, directory: str, params: Dict[str, Any], workers: int = 0):
+        self.directory = directory
+        self.params = params
+        # Threads usadas para pré-processar as imagens novas (0 = número de CPUs)
+        self.workers = workers or os.cpu_count() or 1
+        self.features_path = os.path.join(directory, FEATURES_FILE)
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+
+    def _load(self) -> Tuple[Dict[str, Dict[str, Any]], np.ndarray]:
+        """Carrega o manifesto e a matriz; retorna vazio se não existirem ou forem de outros parâmetros."""
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+            features = np.load(self.features_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return {}, None
+
+        if manifest.get('params') != self.params or len(manifest.get('entries', [])) != len(features):
+            logger.info("Armazenamento de características desatualizado, reconstruindo")
+            return {}, None
+        return {entry['path']: entry for entry in manifest['entries']}, features
+
+    def sync(self, files: List[Tuple[str, int]],
+             process: Callable[[str], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (X, y) para as imagens de `files`, processando apenas as
+        novas ou alteradas com `process`. Imagens com erro são ignoradas.
+
+        As linhas guardadas mantêm a sua posição e as novas vão para o fim:
+        se nenhuma imagem foi removida ou alterada, as novas linhas são
+        acrescentadas ao arquivo (custo proporcional à diferença); caso
+        contrário a matriz é regravada sem as linhas antigas.
+        """
+        known, stored = self._load()
+        kept = []
+        pending = []
+
+        for path, label in files:
+            stat = os.stat(path)
+            entry = {'path': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'label': label}
+            previous = known.get(path)
+            if previous and all(previous[k] == entry[k] for k in ('mtime_ns', 'size', 'label')):
+                entry['row'] = previous['row']
+                kept.append(entry)
+            else:
+                pending.append(entry)
+
+        added = []
+        rows = []
+        failures = 0
+        if pending:
+            started = time.perf_counter()
+            for entry, (features, error) in zip(pending, self._process_all(pending, process)):
+                if error is not None:
+                    failures += 1
+                    logger.error(f"Erro ao processar imagem {entry['path']}: {str(error)}")
+                    continue
+                rows.append(features)
+                added.append(entry)
+            elapsed = time.perf_counter() - started
+            logger.info(f"{len(pending)} imagens pré-processadas em {elapsed:.2f}s "
+                        f"({len(pending) / elapsed:.1f} imagens/s, {self.workers} workers, {failures} falhas)")
+
+        if not kept and not rows:
+            raise ValueError("Nenhuma imagem válida encontrada para treinamento")
+
+        logger.info(f"Características: {len(kept)} reaproveitadas, {len(added)} processadas, "
+                    f"{len(known) - len(kept)} removidas ou alteradas")
+
+        # Linhas guardadas na ordem do arquivo, seguidas das novas
+        kept.sort(key=lambda entry: entry['row'])
+        entries = kept + added
+        labels = np.array([entry['label'] for entry in entries])
+        if len(kept) == len(known) and stored is not None:
+            if not added:
+                # Nada mudou: a matriz mapeada em memória é usada diretamente
+                return stored, labels
+            for row, entry in enumerate(added, start=len(kept)):
+                entry['row'] = row
+            features = self._append(np.stack(rows).astype(np.uint8), len(kept))
+            if features is not None:
+                self._write_manifest(entries)
+                return features, labels
+
+        previous_rows = [entry['row'] for entry in kept]
+        parts = ([np.asarray(stored[previous_rows])] if previous_rows else []) + ([np.stack(rows)] if rows else [])
+        features = np.concatenate(parts).astype(np.uint8)
+        for row, entry in enumerate(entries):
+            entry['row'] = row
+        self._save(features, entries)
+        return features, labels
+
+    def _process_all(self, pending: List[Dict[str, Any]],
+                     process: Callable[[str], np.ndarray]) -> Iterator[Tuple[Optional[np.ndarray], Optional[Exception]]]:
+        """
+        Processa as imagens em um pool de threads (o OpenCV libera o GIL),
+        devolvendo (características, erro) na mesma ordem de `pending`.
+        """
+        def attempt(path: str):
+            try:
+                return process(path), None
+            except Exception as e:
+                return None, e
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='features') as executor:
+            yield from executor.map(attempt, [entry['path'] for entry in pending])
+
+    def _save(self, features: np.ndarray, entries: List[Dict[str, Any]]):
+        """Grava a matriz e depois o manifesto, ambos de forma atômica."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._atomic_write(self.features_path, lambda f: np.save(f, features))
+        self._write_manifest(entries)
+
+    def _write_manifest(self, entries: List[Dict[str, Any]]):
+        self._atomic_write(self.manifest_path,
+                           lambda f: f.write(json.dumps({'params': self.params, 'entries': entries}).encode()))
+
+    def _append(self, rows: np.ndarray, count: int) -> Optional[np.ndarray]:
+        """
+        Acrescenta linhas ao .npy existente (que tem `count` linhas) sem
+        regravá-lo: os dados vão para o fim e depois o cabeçalho recebe a nova
+        forma, no mesmo espaço. Até o manifesto ser gravado, a forma antiga
+        continua valendo (o manifesto confere o número de linhas). Retorna a
+        matriz mapeada atualizada, ou None se o cabeçalho não comporta a nova
+        forma (a matriz é então regravada).
+        """
+        with open(self.features_path, 'r+b') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+            if fortran_order or dtype != rows.dtype or shape[0] != count or shape[1:] != rows.shape[1:]:
+                return None
+            header_start = len(np.lib.format.magic(*version)) + (2 if version == (1, 0) else 4)
+            new_shape = (count + len(rows),) + tuple(shape[1:])
+            header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                           'shape': new_shape})
+            space = offset - header_start
+            if len(header) + 1 > space:
+                return None
+
+            f.seek(offset + count * rows[0].nbytes)
+            f.write(rows.tobytes())
+            f.truncate()
+            f.seek(header_start)
+            f.write((header.ljust(space - 1) + '\n').encode('latin1'))
+        return np.load(self.features_path, mmap_mode='r')
+
+    def _atomic_write(self, path: str, write: Callable):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
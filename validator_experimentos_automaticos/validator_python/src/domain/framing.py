@@ -0,0 +1,105 @@
+import asyncio
+import socket
+from typing import Optional
+
+# Cada mensagem é precedida por um cabeçalho de 8 bytes (big-endian) com o tamanho
+HEADER_SIZE = 8
+
+
+class ConnectionClosed(Exception):
+    """O par fechou a conexão no meio de uma mensagem."""
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prefixa a mensagem com o seu tamanho."""
+    return len(payload).to_bytes(HEADER_SIZE, 'big') + payload
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    """Envia uma mensagem com o prefixo de tamanho."""
+    sock.sendall(encode_frame(payload))
+
+
+def _recv_into(sock: socket.socket, view: memoryview) -> int:
+    """Preenche `view` com dados do socket; retorna quantos bytes chegaram antes de um eventual EOF."""
+    received = 0
+    size = len(view)
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            break
+        received += count
+    return received
+
+
+def _recv_size(sock: socket.socket) -> Optional[int]:
+    """Lê o cabeçalho de tamanho, mesmo que chegue em pedaços; None se a conexão terminou antes dele."""
+    header = bytearray(HEADER_SIZE)
+    received = _recv_into(sock, memoryview(header))
+    if received == 0:
+        return None
+    if received < HEADER_SIZE:
+        raise ConnectionClosed(f"Conexão encerrada no cabeçalho ({received} de {HEADER_SIZE} bytes)")
+    return int.from_bytes(header, 'big')
+
+
+def recv_frame(sock: socket.socket) -> Optional[bytearray]:
+    """
+    Recebe uma mensagem com prefixo de tamanho.
+
+    O corpo é lido diretamente (recv_into) em um bytearray do tamanho exato,
+    sem concatenar pedaços. Retorna None se a conexão foi encerrada antes de
+    uma nova mensagem (fim normal de uma conexão persistente).
+    """
+    size = _recv_size(sock)
+    if size is None:
+        return None
+    data = bytearray(size)
+    received = _recv_into(sock, memoryview(data))
+    if received < size:
+        raise ConnectionClosed(f"Conexão encerrada após {received} de {size} bytes")
+    return data
+
+
+class FrameReceiver:
+    """
+    Recebe mensagens de uma conexão persistente em um buffer reaproveitado.
+
+    Cada mensagem é devolvida como um memoryview sobre o buffer, válido até a
+    próxima chamada de `recv`; o buffer só é realocado quando chega uma
+    mensagem maior que ele. Adequado para servidores que processam uma
+    mensagem por vez em cada conexão.
+    """
+
+    def __init__(self, sock: socket.socket, initial_size: int = 64 * 1024):
+        self.sock = sock
+        self._buffer = bytearray(initial_size)
+
+    def recv(self) -> Optional[memoryview]:
+        size = _recv_size(self.sock)
+        if size is None:
+            return None
+        if size > len(self._buffer):
+            # Novo buffer em vez de redimensionar: views da mensagem anterior podem ainda existir
+            self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+        view = memoryview(self._buffer)[:size]
+        received = _recv_into(self.sock, view)
+        if received < size:
+            raise ConnectionClosed(f"Conexão encerrada após {received} de {size} bytes")
+        return view
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Versão assíncrona de recv_frame para servidores asyncio."""
+    try:
+        size_data = await reader.readexactly(HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionClosed(f"Conexão encerrada no cabeçalho ({len(e.partial)} de {HEADER_SIZE} bytes)")
+
+    size = int.from_bytes(size_data, 'big')
+    try:
+        return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionClosed(f"Conexão encerrada após {len(e.partial)} de {size} bytes")
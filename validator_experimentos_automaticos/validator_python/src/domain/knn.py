@@ -0,0 +1,59 @@
+import numpy as np
+from typing import Tuple
+
+
+class KNNScorer:
+    """
+    Classificador kNN por força bruta em NumPy, equivalente ao
+    KNeighborsClassifier (pesos uniformes, distância euclidiana).
+
+    As distâncias de um lote inteiro saem de um único produto matricial
+    (BLAS) contra a matriz de treino, cujas normas são pré-calculadas. Os k
+    vizinhos são obtidos com argpartition e a mesma busca fornece a classe e
+    a confiança, em vez de repetir a busca em predict e predict_proba.
+    """
+
+    def __init__(self, scaler, train_features: np.ndarray, train_labels: np.ndarray,
+                 classes: np.ndarray, n_neighbors: int = 5):
+        if n_neighbors > len(train_features):
+            raise ValueError(f"n_neighbors ({n_neighbors}) maior que o número de amostras de treino ({len(train_features)})")
+        self.n_neighbors = n_neighbors
+        self.classes = np.asarray(classes)
+        self._mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else 0.0
+        self._scale = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else 1.0
+        # Matriz de treino já normalizada; usada sem cópia (pode estar mapeada em memória)
+        train_features = np.asarray(train_features, dtype=np.float64)
+        self._train = train_features
+        self._train_norms = np.einsum('ij,ij->i', train_features, train_features)
+        self._labels = np.asarray(train_labels, dtype=np.intp)  # Índices em self.classes
+
+    @classmethod
+    def from_training(cls, scaler, train_features: np.ndarray, labels: np.ndarray,
+                      n_neighbors: int = 5) -> 'KNNScorer':
+        """
+        Cria o scorer a partir da matriz de treino (já normalizada pelo
+        StandardScaler) e dos rótulos usados no fit do KNeighborsClassifier.
+        """
+        classes, encoded = np.unique(np.asarray(labels), return_inverse=True)
+        return cls(scaler, train_features, encoded, classes, n_neighbors=n_neighbors)
+
+    def predict(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Classifica uma matriz de características brutas (uma linha por imagem).
+
+        Retorna os rótulos previstos e a confiança (fração dos k vizinhos que
+        votaram na classe prevista), como predict + predict_proba.
+        """
+        x = (np.asarray(features, dtype=np.float64) - self._mean) / self._scale
+
+        # ||x - t||² = ||x||² - 2 x·t + ||t||²; ||x||² é constante por linha e não altera a ordem
+        distances = self._train_norms - 2.0 * (x @ self._train.T)
+        k = self.n_neighbors
+        neighbors = np.argpartition(distances, k - 1, axis=1)[:, :k]
+
+        # Contagem de votos por classe; empates ficam com a menor classe, como no sklearn
+        votes = self._labels[neighbors]
+        counts = np.stack([(votes == c).sum(axis=1) for c in range(len(self.classes))], axis=1)
+        predicted = counts.argmax(axis=1)
+        confidences = counts[np.arange(len(x)), predicted] / k
+        return self.classes[predicted], confidences
@@ -0,0 +1,125 @@
+import math
+from typing import Any, Dict, Iterable
+
+import numpy as np
+
+# Percentis informados nos resumos
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """
+    Histograma de latências com baldes logarítmicos (no estilo HDR).
+
+    Cada balde cobre valores até `1 + 10^-significant_digits` vezes maiores
+    que o anterior, então qualquer percentil tem erro relativo de no máximo
+    10^-significant_digits (1% com 2 dígitos), usando memória fixa entre
+    `lowest` e `highest` segundos. Valores fora da faixa caem nos baldes das
+    pontas; mínimo, máximo e média são exatos. Histogramas com os mesmos
+    parâmetros podem ser somados (merge), por exemplo entre workers.
+    """
+
+    def __init__(self, lowest: float = 1e-5, highest: float = 120.0, significant_digits: int = 2):
+        if not 0 < lowest < highest:
+            raise ValueError(f"Faixa inválida para o histograma: {lowest}..{highest}")
+        self.lowest = lowest
+        self.highest = highest
+        self.significant_digits = significant_digits
+        self._log_ratio = math.log1p(10.0 ** -significant_digits)
+        # Balde 0: valores <= lowest; último balde: valores acima de highest
+        self.counts = np.zeros(int(math.ceil(math.log(highest / lowest) / self._log_ratio)) + 2, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        return min(int(math.log(value / self.lowest) / self._log_ratio) + 1, len(self.counts) - 1)
+
+    def record(self, value: float):
+        """Registra uma latência (em segundos)."""
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def record_many(self, values: Iterable[float]):
+        """Registra várias latências de uma vez (vetorizado)."""
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        indexes = np.log(np.maximum(values, self.lowest) / self.lowest) / self._log_ratio + 1
+        indexes = np.where(values <= self.lowest, 0, np.minimum(indexes.astype(np.int64), len(self.counts) - 1))
+        self.counts += np.bincount(indexes, minlength=len(self.counts))
+        self.count += values.size
+        self.total += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def _upper_bound(self, index: int) -> float:
+        """Maior valor representado pelo balde."""
+        return self.lowest * math.exp(self._log_ratio * index)
+
+    def percentile(self, q: float) -> float:
+        """Valor do percentil q (0-100), limitado ao mínimo e ao máximo registrados."""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(math.ceil(q / 100.0 * self.count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(max(self._upper_bound(index), self.min), self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def _check_compatible(self, other: 'LatencyHistogram'):
+        if (other.lowest, other.highest, other.significant_digits) != (self.lowest, self.highest, self.significant_digits):
+            raise ValueError("Histogramas com parâmetros diferentes não podem ser combinados")
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Soma as contagens de outro histograma com os mesmos parâmetros."""
+        self._check_compatible(other)
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self) -> Dict[str, float]:
+        """Contagem, média, mínimo, percentis (p50, p90, p99, p99.9) e máximo."""
+        summary = {'count': self.count, 'mean': self.mean, 'min': self.min if self.count else 0.0}
+        for q in PERCENTILES:
+            summary[f'p{q:g}'] = self.percentile(q)
+        summary['max'] = self.max
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma serializável (JSON), com apenas os baldes não vazios."""
+        used = np.flatnonzero(self.counts)
+        return {
+            'lowest': self.lowest,
+            'highest': self.highest,
+            'significant_digits': self.significant_digits,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min if self.count else None,
+            'max': self.max,
+            'buckets': {str(i): int(self.counts[i]) for i in used}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        histogram = cls(data['lowest'], data['highest'], data['significant_digits'])
+        for index, count in data['buckets'].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min'] if data['min'] is not None else math.inf
+        histogram.max = data['max']
+        return histogram
+
@@ -1,126 +1,330 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from .abstract_proxy import AbstractProxy
+from .balancing import create_policy, EWMA_ALPHA
+from .connection_pool import ConnectionPool
+from .protocol import is_overloaded
+import itertools
 import random
 import socket
 import logging
+import statistics
+import threading
 import time
 
 logger = logging.getLogger(__name__)
 
+# Verificação ativa: intervalo entre sondagens (com variação aleatória de
+# ±HEALTH_CHECK_JITTER para que os balanceadores não sondem todos ao mesmo
+# tempo) e sondagens falhas seguidas para considerar o serviço indisponível.
+# Um serviço que ainda não respondeu a nenhuma sondagem (por exemplo, ainda
+# iniciando) continua elegível por até STARTUP_GRACE segundos a partir da
+# criação do balanceador, e as sondagens nunca retiram o último serviço
+HEALTH_CHECK_INTERVAL = 5.0
+HEALTH_CHECK_JITTER = 0.2
+HEALTH_CHECK_TIMEOUT = 2.0
+UNHEALTHY_THRESHOLD = 2
+STARTUP_GRACE = 30.0
+
+# Ejeção passiva: erros seguidos, ou EWMA de latência acima de OUTLIER_FACTOR
+# vezes a mediana dos demais serviços, retiram o serviço por EJECTION_TIME
+# segundos (nunca o último serviço disponível)
+MAX_CONSECUTIVE_ERRORS = 3
+OUTLIER_FACTOR = 5.0
+OUTLIER_MIN_SAMPLES = 20
+EJECTION_TIME = 10.0
+
+
+class BackendState:
+    """
+    Estado de um serviço atrás do balanceador.
+
+    Os contadores são alterados sob a trava do próprio serviço, então
+    requisições para serviços diferentes não disputam a mesma trava. As
+    políticas apenas leem os atributos (leituras simples, sem trava).
+    """
+
+    __slots__ = ('address', 'lock', 'outstanding', 'error_count', 'samples', 'ewma', 'response_time',
+                 'healthy', 'probed', 'probe_failures', 'last_check', 'ejected_until', 'available', 'overloads')
+
+    def __init__(self, address: str):
+        self.address = address
+        self.lock = threading.Lock()
+        self.outstanding = 0  # Requisições em andamento
+        self.error_count = 0  # Erros seguidos
+        self.samples = 0
+        self.ewma: Optional[float] = None  # Média móvel exponencial da latência
+        self.response_time = float('inf')
+        self.healthy = True  # Resultado da verificação ativa
+        self.probed = False  # Já respondeu a alguma sondagem
+        self.probe_failures = 0  # Sondagens falhas seguidas
+        self.last_check = 0.0
+        self.ejected_until = 0.0  # Ejeção passiva (erros ou latência atípica)
+        self.available = True
+        self.overloads = 0  # Recusas por sobrecarga (controle de admissão do serviço)
+
+    def begin(self):
+        with self.lock:
+            self.outstanding += 1
+
+    def end(self):
+        with self.lock:
+            self.outstanding -= 1
+
+    def record_success(self, response_time: float) -> Tuple[Optional[float], int]:
+        """Registra uma resposta; retorna a nova EWMA e o número de amostras."""
+        with self.lock:
+            self.error_count = 0
+            self.response_time = response_time
+            self.ewma = response_time if self.ewma is None else EWMA_ALPHA * response_time + (1 - EWMA_ALPHA) * self.ewma
+            self.samples += 1
+            return self.ewma, self.samples
+
+    def record_error(self) -> int:
+        """Registra um erro; retorna quantos erros seguidos o serviço acumula."""
+        with self.lock:
+            self.error_count += 1
+            return self.error_count
+
+    def reset_statistics(self):
+        with self.lock:
+            self.error_count = 0
+            self.samples = 0
+            self.ewma = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cópia do estado para relatórios."""
+        with self.lock:
+            return {
+                'available': self.available,
+                'healthy': self.healthy,
+                'ejected_until': self.ejected_until,
+                'last_check': self.last_check,
+                'response_time': self.response_time,
+                'error_count': self.error_count,
+                'probed': self.probed,
+                'probe_failures': self.probe_failures,
+                'samples': self.samples,
+                'outstanding': self.outstanding,
+                'overloads': self.overloads,
+                'ewma': self.ewma
+            }
+
+
 class LoadBalancerProxy(AbstractProxy):
-    def __init__(self, services: List[str]):
+    def __init__(self, services: List[str], pool: Optional[ConnectionPool] = None,
+                 algorithm: str = 'least-response-time', health_check_interval: float = HEALTH_CHECK_INTERVAL):
         super().__init__(services[0])  # Endereço principal
         self.services = services
-        self.service_status: Dict[str, Dict] = {}
+        # Conexões persistentes com os serviços deste balanceador
+        self.pool = pool or ConnectionPool()
+        # Política de escolha do serviço (round-robin, least-outstanding, p2c, ewma...)
+        self.algorithm = algorithm
+        self.policy = create_policy(algorithm)
+        self.backends: Dict[str, BackendState] = {}
         self.initialize_services()
-        self.current_index = 0
+        self.created_at = time.time()  # Início da tolerância aos serviços ainda iniciando
+        self._next_index = itertools.count()
+
+        # Serviços elegíveis: tupla imutável substituída por inteiro quando a saúde
+        # de algum serviço muda; a escolha do destino só lê a tupla atual e nunca
+        # espera por sondagens nem por travas
+        self._health_lock = threading.Lock()
+        self._available: Tuple[BackendState, ...] = tuple(self.backends.values())
+        self.health_check_interval = health_check_interval  # 0 desativa a verificação ativa
+        self._stop_checks = threading.Event()
+        if health_check_interval > 0:
+            threading.Thread(target=self._run_health_checks, name='health-checks', daemon=True).start()
 
     def initialize_services(self):
         """Inicializa o status dos serviços."""
         for service in self.services:
-            self.service_status[service] = {
-                'available': True,
-                'last_check': 0,
-                'response_time': float('inf'),
-                'error_count': 0
-            }
+            self.backends[service] = BackendState(service)
+
+    @property
+    def service_status(self) -> Dict[str, Dict[str, Any]]:
+        """Cópia do status de cada serviço."""
+        return {service: backend.snapshot() for service, backend in self.backends.items()}
 
     def check_service_availability(self, service: str) -> bool:
-        """Verifica se um serviço está disponível."""
+        """Sonda um serviço com uma tentativa de conexão (executada pela verificação em segundo plano)."""
         host, port = service.split(':')
-        max_retries = 3
-        retry_delay = 1.0
-        
-        for attempt in range(max_retries):
-            try:
-                # Tenta estabelecer uma conexão
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(2)  # Timeout de 2 segundos
-                start_time = time.time()
-                sock.connect((host, int(port)))
-                response_time = time.time() - start_time
-                sock.close()
-                
-                # Atualiza o status do serviço
-                self.service_status[service].update({
-                    'available': True,
-                    'last_check': time.time(),
-                    'response_time': response_time,
-                    'error_count': 0
-                })
-                return True
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    logger.warning(f"Tentativa {attempt + 1} de {max_retries} falhou ao verificar serviço {service}. Aguardando {retry_delay} segundos...")
-                    time.sleep(retry_delay)
-                else:
-                    logger.warning(f"Serviço {service} indisponível após {max_retries} tentativas: {str(e)}")
-                    self.service_status[service]['error_count'] += 1
-                    if self.service_status[service]['error_count'] >= 3:
-                        self.service_status[service]['available'] = False
-                    return False
+        backend = self.backends[service]
+        error = None
+        start_time = time.time()
+        try:
+            with socket.create_connection((host, int(port)), timeout=HEALTH_CHECK_TIMEOUT):
+                pass
+        except OSError as e:
+            error = e
+        now = time.time()
 
-    def get_available_service(self) -> Optional[str]:
-        """Retorna o serviço mais disponível e com menor tempo de resposta."""
-        current_time = time.time()
-        available_services = []
-        
-        # Verifica disponibilidade dos serviços
-        for service in self.services:
-            # Verifica a cada 5 segundos
-            if current_time - self.service_status[service]['last_check'] > 5:
+        # Os contadores da requisição (mark_service_*) mudam sob a mesma trava
+        with backend.lock:
+            backend.last_check = now
+            if error is None:
+                backend.probe_failures = 0
+                backend.probed = True
+                if backend.response_time == float('inf'):
+                    backend.response_time = now - start_time
+                healthy = True
+            else:
+                backend.probe_failures += 1
+                # Antes da primeira sondagem bem-sucedida o serviço pode estar apenas
+                # iniciando, mas só durante a tolerância de inicialização
+                starting = not backend.probed and now - self.created_at < STARTUP_GRACE
+                healthy = backend.probe_failures < UNHEALTHY_THRESHOLD or starting
+            failures = backend.probe_failures
+            changed = healthy != backend.healthy
+            backend.healthy = healthy
+
+        if changed:
+            if healthy:
+                logger.info(f"Serviço {service} voltou a responder às verificações")
+            else:
+                logger.warning(f"Serviço {service} indisponível após {failures} verificações: {str(error)}")
+            self._refresh_available()
+        return healthy
+
+    def _run_health_checks(self):
+        """Sonda todos os serviços periodicamente, com intervalos variando ao acaso."""
+        while not self._stop_checks.is_set():
+            for service in self.services:
                 self.check_service_availability(service)
-            
-            if self.service_status[service]['available']:
-                available_services.append(service)
-        
-        if not available_services:
+            # Serviços ejetados passivamente voltam quando o tempo de ejeção acaba
+            if any(backend.ejected_until and backend.ejected_until <= time.time()
+                   for backend in self.backends.values()):
+                self._refresh_available()
+            jitter = random.uniform(1 - HEALTH_CHECK_JITTER, 1 + HEALTH_CHECK_JITTER)
+            self._stop_checks.wait(self.health_check_interval * jitter)
+
+    def _refresh_available(self):
+        """Recalcula a tupla de serviços elegíveis (saudáveis e não ejetados)."""
+        with self._health_lock:
+            now = time.time()
+            available = []
+            for backend in self.backends.values():
+                if backend.ejected_until and backend.ejected_until <= now:
+                    backend.ejected_until = 0.0
+                    backend.reset_statistics()
+                    logger.info(f"Serviço {backend.address} readmitido após a ejeção")
+                backend.available = backend.healthy and not backend.ejected_until
+                if backend.available:
+                    available.append(backend)
+            if not available:
+                # As sondagens não esvaziam o balanceador: sem serviços saudáveis, os não
+                # ejetados continuam elegíveis (as falhas reais levam à ejeção passiva)
+                available = [backend for backend in self.backends.values() if not backend.ejected_until]
+                available = available or list(self.backends.values())
+                for backend in available:
+                    backend.available = True
+            self._available = tuple(available)
+
+    def _eject(self, backend: BackendState, reason: str):
+        """Retira um serviço temporariamente, desde que ele não seja o último disponível."""
+        with self._health_lock:
+            if backend.ejected_until or (len(self._available) <= 1 and backend in self._available):
+                return
+            backend.ejected_until = time.time() + EJECTION_TIME
+        logger.warning(f"Serviço {backend.address} ejetado por {EJECTION_TIME:.0f}s: {reason}")
+        self._refresh_available()
+
+    def _choose(self) -> Optional[BackendState]:
+        available = self._available
+        if not available:
             logger.error("Nenhum serviço disponível")
             return None
-        
-        # Retorna o serviço com menor tempo de resposta
-        return min(available_services, 
-                  key=lambda s: self.service_status[s]['response_time'])
+        return self.policy.choose(available)
+
+    def get_available_service(self) -> Optional[str]:
+        """Retorna um dos serviços disponíveis, escolhido pela política de balanceamento."""
+        backend = self._choose()
+        return backend.address if backend else None
 
     def mark_service_error(self, service: str):
-        """Marca um serviço como tendo erro."""
-        if service in self.service_status:
-            self.service_status[service]['error_count'] += 1
-            if self.service_status[service]['error_count'] >= 3:
-                self.service_status[service]['available'] = False
-                logger.warning(f"Serviço {service} marcado como indisponível após múltiplos erros")
+        """Marca um serviço como tendo erro; erros seguidos provocam a ejeção."""
+        backend = self.backends.get(service)
+        if backend:
+            errors = backend.record_error()
+            if errors >= MAX_CONSECUTIVE_ERRORS:
+                self._eject(backend, f"{errors} erros seguidos")
 
     def mark_service_success(self, service: str, response_time: float):
-        """Marca um serviço como tendo sucesso."""
-        if service in self.service_status:
-            self.service_status[service].update({
-                'available': True,
-                'error_count': 0,
-                'response_time': response_time,
-                'last_check': time.time()
-            })
+        """Marca um serviço como tendo sucesso; latência atípica em relação aos demais provoca a ejeção."""
+        backend = self.backends.get(service)
+        if not backend:
+            return
+        ewma, samples = backend.record_success(response_time)
+        available = self._available
+        if samples >= OUTLIER_MIN_SAMPLES and len(available) > 1:
+            others = [other.ewma for other in available if other is not backend and other.ewma is not None]
+            if others and ewma > OUTLIER_FACTOR * statistics.median(others):
+                self._eject(backend, f"latência média de {ewma * 1000:.1f}ms "
+                                     f"(mediana dos demais: {statistics.median(others) * 1000:.1f}ms)")
+
+    def close(self):
+        """Encerra a verificação em segundo plano e fecha as conexões ociosas."""
+        self._stop_checks.set()
+        self.pool.close_all()
+
+    def forward(self, payload: bytes) -> Tuple[str, bytes]:
+        """
+        Envia uma mensagem a um serviço escolhido pela política e retorna
+        (serviço, resposta), contabilizando as requisições em andamento e o
+        resultado de cada serviço. Uma recusa por sobrecarga é reenviada uma
+        vez a outro serviço disponível; se não houver outro, a recusa é
+        devolvida ao cliente.
+        """
+        self.increment_request_count()
+        backend = self._choose()
+        if not backend:
+            raise Exception("Nenhum serviço disponível")
+
+        reply = self._send(backend, payload)
+        if is_overloaded(reply):
+            others = [other for other in self._available if other is not backend]
+            if others:
+                logger.info(f"Serviço {backend.address} sobrecarregado; reenviando a requisição")
+                backend = self.policy.choose(others)
+                reply = self._send(backend, payload)
+        return backend.address, reply
+
+    def _send(self, backend: BackendState, payload: bytes) -> bytes:
+        """
+        Envia a mensagem a um serviço, registrando a latência ou o erro. As
+        recusas por sobrecarga são contadas à parte: chegam rápido e
+        distorceriam a latência usada na escolha e na ejeção.
+        """
+        backend.begin()
+        start_time = time.time()
+        try:
+            reply = self.pool.request(backend.address, payload)
+        except Exception:
+            self.mark_service_error(backend.address)
+            raise
+        finally:
+            backend.end()
+        if is_overloaded(reply):
+            with backend.lock:
+                backend.overloads += 1
+        else:
+            self.mark_service_success(backend.address, time.time() - start_time)
+        return reply
 
     def get_next_target(self) -> str:
         """
         Implementa o algoritmo round-robin para seleção do próximo servidor.
         """
-        target = self.services[self.current_index]
-        self.current_index = (self.current_index + 1) % len(self.services)
-        return target
+        return self.services[next(self._next_index) % len(self.services)]
 
     def handle_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Processa a requisição usando o algoritmo de balanceamento de carga.
+        Encaminha a mensagem em request_data['payload'] a um serviço escolhido
+        pela política e retorna a resposta recebida.
         """
-        self.increment_request_count()
-        target = self.get_next_target()
-        
-        # Simula o processamento da requisição
-        response = {
+        target, reply = self.forward(request_data['payload'])
+        return {
             "status": "success",
             "target": target,
             "request_count": self.request_count,
-            "data": request_data
+            "data": reply
         }
-        
-        return response 
\ No newline at end of file
@@ -0,0 +1,153 @@
+import json
+import logging
+import socket
+import threading
+from typing import Any, Dict, List, Tuple
+
+from .connection_pool import ConnectionPool
+from .framing import FrameReceiver, send_frame
+from .load_balancer_proxy import LoadBalancerProxy
+from .protocol import decode_request, overloaded_response
+
+logger = logging.getLogger(__name__)
+
+
+class LoadBalancerServer:
+    """
+    Load balancer em processo próprio: um proxy TCP que recebe as mensagens
+    (mesmo enquadramento dos serviços) e as repassa, sem interpretar o corpo, a
+    um serviço escolhido pela política configurada. Requisições do tipo
+    'stats' são respondidas pelo próprio load balancer com os seus contadores.
+
+    Cada conexão de cliente é atendida por uma thread, em conexões
+    persistentes; as conexões com os serviços vêm de um pool. Acima de
+    `max_connections` conexões simultâneas, novas conexões recebem uma
+    resposta de erro e são fechadas.
+    """
+
+    def __init__(self, host: str, port: int, services: List[str], algorithm: str = 'round-robin',
+                 max_connections: int = 1000, pool_size: int = 32, timeout: float = 10,
+                 backlog: int = 128, keepalive_timeout: float = 60, name: str = None):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.backlog = backlog
+        self.keepalive_timeout = keepalive_timeout
+        self.name = name or f"lb:{port}"
+        self.balancer = LoadBalancerProxy(
+            services,
+            pool=ConnectionPool(max_per_target=pool_size, timeout=timeout, retry_attempts=1),
+            algorithm=algorithm
+        )
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self.active_connections = 0
+        self.rejected_connections = 0
+        self.forwarded = 0
+        self.errors = 0
+        self.running = False
+        self.server_socket = None
+
+    def start(self):
+        """Aceita conexões até stop() ser chamado."""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(self.backlog)
+        self.running = True
+        logger.info(f"Load balancer {self.name} ouvindo em {self.host}:{self.port} "
+                    f"({self.balancer.algorithm}, até {self.max_connections} conexões) -> "
+                    f"{', '.join(self.balancer.services)}")
+
+        while self.running:
+            try:
+                client_socket, address = self.server_socket.accept()
+            except OSError:
+                if self.running:
+                    logger.error("Erro ao aceitar conexão", exc_info=True)
+                break
+
+            if not self._connection_slots.acquire(blocking=False):
+                self._reject(client_socket, address)
+                continue
+            with self._lock:
+                self.active_connections += 1
+            threading.Thread(target=self._handle_client, args=(client_socket, address), daemon=True).start()
+
+    def _reject(self, client_socket: socket.socket, address: Tuple[str, int]):
+        """Recusa uma conexão acima do limite com uma resposta de erro."""
+        with self._lock:
+            self.rejected_connections += 1
+        logger.warning(f"Conexão de {address} recusada: limite de {self.max_connections} conexões atingido")
+        try:
+            send_frame(client_socket, json.dumps(overloaded_response(
+                [], f"limite de {self.max_connections} conexões do load balancer")).encode())
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def _handle_client(self, client_socket: socket.socket, address: Tuple[str, int]):
+        """Repassa as mensagens de uma conexão persistente aos serviços."""
+        try:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket.settimeout(self.keepalive_timeout)
+            receiver = FrameReceiver(client_socket)
+
+            while self.running:
+                try:
+                    payload = receiver.recv()
+                except socket.timeout:
+                    break
+                if payload is None:
+                    break
+                if decode_request(payload)[0].get('type') == 'stats':
+                    send_frame(client_socket, json.dumps(self.stats()).encode())
+                else:
+                    send_frame(client_socket, self._forward(payload))
+        except Exception as e:
+            logger.error(f"Erro na conexão com {address}: {str(e)}")
+        finally:
+            client_socket.close()
+            with self._lock:
+                self.active_connections -= 1
+            self._connection_slots.release()
+
+    def _forward(self, payload: memoryview) -> bytes:
+        """Envia a mensagem a um serviço e retorna a resposta (ou uma resposta de erro)."""
+        try:
+            _, reply = self.balancer.forward(payload)
+            with self._lock:
+                self.forwarded += 1
+            return reply
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"Erro ao encaminhar mensagem: {str(e)}")
+            return json.dumps({"status": "error", "error": f"{self.name}: {str(e)}", "stamps": []}).encode()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores do load balancer e status de cada serviço (resposta às requisições 'stats')."""
+        with self._lock:
+            stats = {
+                'status': 'success',
+                'name': self.name,
+                'algorithm': self.balancer.algorithm,
+                'active_connections': self.active_connections,
+                'rejected_connections': self.rejected_connections,
+                'forwarded': self.forwarded,
+                'errors': self.errors
+            }
+        stats['services'] = {
+            service: {key: status[key] for key in ('available', 'outstanding', 'ewma', 'error_count')}
+            for service, status in self.balancer.service_status.items()
+        }
+        return stats
+
+    def stop(self):
+        """Para o load balancer."""
+        self.running = False
+        if self.server_socket:
+            self.server_socket.close()
+        self.balancer.close()
+        logger.info(f"Load balancer {self.name} finalizado: {self.stats()}")
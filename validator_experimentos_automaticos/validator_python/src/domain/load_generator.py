@@ -0,0 +1,141 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from .protocol import OverloadedError
+
+logger = logging.getLogger(__name__)
+
+ARRIVAL_PROCESSES = ('constant', 'poisson')
+
+
+def constant_schedule(rate: float) -> Iterator[float]:
+    """Gera os instantes (relativos ao início) de chegadas com intervalo fixo."""
+    interval = 1.0 / rate
+    n = 0
+    while True:
+        yield n * interval
+        n += 1
+
+
+def poisson_schedule(rate: float, rng: random.Random) -> Iterator[float]:
+    """Gera os instantes de chegadas de um processo de Poisson (intervalos exponenciais)."""
+    offset = 0.0
+    while True:
+        yield offset
+        offset += rng.expovariate(rate)
+
+
+@dataclass
+class LoadReport:
+    """Resumo da carga efetivamente gerada durante um experimento."""
+    target_rate: float
+    dispatched: int = 0
+    completed: int = 0
+    errors: int = 0
+    rejected: int = 0  # Recusas rápidas por sobrecarga (controle de admissão)
+    elapsed: float = 0.0  # Janela de disparo
+    total_elapsed: float = 0.0  # Janela de disparo + espera das respostas pendentes
+    max_dispatch_lag: float = 0.0  # Maior atraso entre o instante planejado e o envio real
+    max_outstanding: int = 0  # Maior número de requisições simultâneas em andamento
+
+    @property
+    def offered_rate(self) -> float:
+        """Taxa de envio alcançada (req/s)."""
+        return self.dispatched / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Taxa de respostas concluídas (req/s)."""
+        return self.completed / self.total_elapsed if self.total_elapsed > 0 else 0.0
+
+
+class OpenLoopGenerator:
+    """
+    Gerador de carga em malha aberta.
+
+    As requisições são disparadas nos instantes definidos pelo cronograma de
+    chegadas, independentemente das respostas pendentes. Cada envio recebe o
+    instante planejado (intended_time), permitindo calcular a latência a partir
+    dele e corrigir a omissão coordenada.
+    """
+
+    def __init__(self, rate: float, arrival: str = 'constant', max_workers: int = 256,
+                 seed: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError(f"Taxa de requisições inválida: {rate}")
+        if arrival not in ARRIVAL_PROCESSES:
+            raise ValueError(f"Processo de chegada desconhecido: {arrival} (use {', '.join(ARRIVAL_PROCESSES)})")
+        self.rate = rate
+        self.arrival = arrival
+        self.max_workers = max_workers
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._outstanding = 0
+
+    def _schedule(self) -> Iterator[float]:
+        if self.arrival == 'poisson':
+            return poisson_schedule(self.rate, self._rng)
+        return constant_schedule(self.rate)
+
+    def run(self, send: Callable[[int, float], None], duration: float, max_requests: int,
+            should_continue: Callable[[], bool] = lambda: True) -> LoadReport:
+        """
+        Dispara `send(request_num, intended_time)` seguindo o cronograma até
+        esgotar a duração, o limite de requisições ou `should_continue()` ser falso.
+        """
+        report = LoadReport(target_rate=self.rate)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='loadgen')
+
+        def task(request_num: int, intended_time: float):
+            try:
+                send(request_num, intended_time)
+                with self._lock:
+                    report.completed += 1
+            except OverloadedError:
+                with self._lock:
+                    report.rejected += 1
+            except Exception:
+                with self._lock:
+                    report.errors += 1
+            finally:
+                with self._lock:
+                    self._outstanding -= 1
+
+        start = time.time()
+        end = start + duration
+        window = 0.0  # Janela planejada coberta pelos envios realizados
+        try:
+            for request_num, offset in enumerate(self._schedule(), start=1):
+                window = min(offset, duration)
+                if request_num > max_requests or not should_continue():
+                    break
+                intended_time = start + offset
+                if intended_time >= end:
+                    break
+
+                # Aguarda o instante planejado sem depender das respostas anteriores
+                delay = intended_time - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+                lag = time.time() - intended_time
+                with self._lock:
+                    self._outstanding += 1
+                    report.max_outstanding = max(report.max_outstanding, self._outstanding)
+                report.max_dispatch_lag = max(report.max_dispatch_lag, lag)
+                report.dispatched += 1
+                executor.submit(task, request_num, intended_time)
+            report.elapsed = max(window, time.time() - start)
+        finally:
+            # Aguarda as respostas pendentes antes de encerrar
+            executor.shutdown(wait=True)
+            report.total_elapsed = time.time() - start
+
+        logger.info(f"Carga gerada: {report.dispatched} envios em {report.elapsed:.2f}s "
+                    f"({report.offered_rate:.2f} req/s de {self.rate} req/s planejadas)")
+        return report
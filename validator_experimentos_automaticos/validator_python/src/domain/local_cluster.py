@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from .framing import recv_frame, send_frame
+from .protocol import encode_request
+from .results_log import RunResults, read_results, results_path
+
+logger = logging.getLogger(__name__)
+
+# Raiz do projeto (diretório de trabalho dos processos: modelo e data/ são relativos a ela)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SRC_DIR = os.path.join(BASE_DIR, 'src')
+
+
+class LocalCluster:
+    """
+    Execução dos experimentos sem Docker: a Source e cada serviço rodam como
+    processos locais em portas de loopback.
+
+    Cada serviço é um processo próprio (start_services.py com um único
+    serviço), identificado pela porta e pelo próximo estágio que usa. Entre
+    células do experimento os processos com a mesma configuração são
+    reaproveitados já aquecidos (modelo carregado, conexões abertas); os
+    demais são encerrados ou iniciados. A prontidão é verificada com uma
+    requisição 'stats' a cada serviço, sem esperas fixas.
+
+    Os load balancers com `standalone: true` na configuração da Source rodam
+    como processos próprios (start_load_balancer.py) nas duas portas após as
+    dos serviços: o LB1 recebe as requisições da Source e o LB2 as do S1.
+    """
+
+    def __init__(self, base_port: int = 18000, max_services_per_stage: int = 10, host: str = '127.0.0.1',
+                 work_dir: Optional[str] = None, startup_timeout: float = 180.0):
+        self.base_port = base_port
+        self.max_services_per_stage = max_services_per_stage
+        self.host = host
+        self.startup_timeout = startup_timeout
+        # Logs dos processos e configurações geradas para os serviços
+        self.work_dir = work_dir or os.path.join(BASE_DIR, 'graphs', 'local')
+        os.makedirs(self.work_dir, exist_ok=True)
+        # porta -> (configuração do serviço ou load balancer, processo)
+        self.processes: Dict[int, Tuple[tuple, subprocess.Popen]] = {}
+        self.started = 0
+        self.reused = 0
+
+    def ports(self, stage: int, count: int) -> List[int]:
+        """Portas dos serviços de um estágio (1: S1, atrás do LB1; 2: S2, atrás do LB2)."""
+        if count > self.max_services_per_stage:
+            raise ValueError(f"No máximo {self.max_services_per_stage} serviços por estágio")
+        first = self.base_port + (stage - 1) * self.max_services_per_stage
+        return [first + i for i in range(count)]
+
+    def lb_port(self, lb_id: int) -> int:
+        """Porta do load balancer em processo próprio (standalone)."""
+        return self.base_port + 2 * self.max_services_per_stage + lb_id - 1
+
+    def _log_path(self, name: str) -> str:
+        return os.path.join(self.work_dir, f"{name}.log")
+
+    def _process_name(self, port: int) -> str:
+        spec, _ = self.processes[port]
+        return f"lb{spec[1]}_{port}" if spec[0] == 'lb' else f"service_{port}"
+
+    def _spawn(self, args: List[str], env: Dict[str, str], name: str) -> subprocess.Popen:
+        with open(self._log_path(name), 'ab') as log:
+            return subprocess.Popen([sys.executable] + args, cwd=BASE_DIR, env={**os.environ, **env},
+                                    stdout=log, stderr=subprocess.STDOUT)
+
+    def _start_service(self, stage: int, port: int, next_count: int, next_standalone: bool) -> subprocess.Popen:
+        env = {
+            'PYTHONUNBUFFERED': '1',
+            'LB_ID': str(stage),
+            'NUM_SERVICES': '1',
+            'BASE_PORT': str(port),
+            'SERVICE_CONFIG_DIR': os.path.join(self.work_dir, 'config')
+        }
+        if stage == 1 and next_standalone:
+            # Encaminha ao processo do LB2, que escolhe o serviço S2
+            env.update({
+                'NEXT_LB_HOST': self.host,
+                'NEXT_LB_PORT': str(self.lb_port(2)),
+                'NEXT_NUM_SERVICES': '1'
+            })
+        elif stage == 1:
+            env.update({
+                'NEXT_LB_HOST': self.host,
+                'NEXT_LB_PORT': str(self.ports(2, 1)[0]),
+                'NEXT_NUM_SERVICES': str(next_count)
+            })
+        logger.info(f"Iniciando serviço S{stage} na porta {port}")
+        self.started += 1
+        return self._spawn([os.path.join(SRC_DIR, 'start_services.py')], env, f"service_{port}")
+
+    def _start_balancer(self, lb_id: int, count: int, config_path: Optional[str]) -> subprocess.Popen:
+        port = self.lb_port(lb_id)
+        env = {
+            'PYTHONUNBUFFERED': '1',
+            'LB_ID': str(lb_id),
+            'LB_PORT': str(port),
+            'NUM_SERVICES': str(count),
+            'BASE_PORT': str(self.ports(lb_id, 1)[0]),
+            'SERVICES_HOST': self.host
+        }
+        if config_path:
+            env['LB_CONFIG'] = config_path
+        logger.info(f"Iniciando load balancer LB{lb_id} na porta {port}")
+        self.started += 1
+        return self._spawn([os.path.join(SRC_DIR, 'start_load_balancer.py')], env, f"lb{lb_id}_{port}")
+
+    def _stop_process(self, port: int):
+        _, process = self.processes.pop(port)
+        process.terminate()
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def ensure_services(self, num_lb1: int, num_lb2: int, balancers: Optional[Dict[int, Dict[str, Any]]] = None,
+                        config_path: Optional[str] = None) -> Tuple[List[str], List[str]]:
+        """
+        Deixa em execução exatamente os serviços da célula (num_lb1 S1 e num_lb2 S2)
+        e os load balancers em `balancers` (LB_ID -> seção loadbalancer{LB_ID} lida
+        de `config_path`), reaproveitando os que já têm a configuração certa, e
+        aguarda a prontidão. Retorna os endereços dos serviços de cada estágio.
+        """
+        balancers = balancers or {}
+        wanted = {port: (1, num_lb2, 2 in balancers) for port in self.ports(1, num_lb1)}
+        wanted.update({port: (2, 0, False) for port in self.ports(2, num_lb2)})
+        for lb_id, lb_config in balancers.items():
+            count = num_lb1 if lb_id == 1 else num_lb2
+            wanted[self.lb_port(lb_id)] = ('lb', lb_id, count, json.dumps(lb_config, sort_keys=True))
+
+        for port in list(self.processes):
+            spec, process = self.processes[port]
+            if wanted.get(port) != spec or process.poll() is not None:
+                self._stop_process(port)
+
+        for port, spec in wanted.items():
+            if port in self.processes:
+                self.reused += 1
+                continue
+            if spec[0] == 'lb':
+                self.processes[port] = (spec, self._start_balancer(spec[1], spec[2], config_path))
+            else:
+                stage, next_count, next_standalone = spec
+                self.processes[port] = (spec, self._start_service(stage, port, next_count, next_standalone))
+
+        lb1 = [f"{self.host}:{port}" for port in self.ports(1, num_lb1)]
+        lb2 = [f"{self.host}:{port}" for port in self.ports(2, num_lb2)]
+        # Cada estágio só fica pronto depois do seguinte (S2, LB2, S1, LB1)
+        proxies = {lb_id: [f"{self.host}:{self.lb_port(lb_id)}"] if lb_id in balancers else [] for lb_id in (1, 2)}
+        self.wait_ready(lb2 + proxies[2] + lb1 + proxies[1])
+        return lb1, lb2
+
+    def _probe(self, address: str) -> bool:
+        """Verifica se o serviço responde a uma requisição 'stats'."""
+        host, port = address.split(':')
+        try:
+            with socket.create_connection((host, int(port)), timeout=2) as sock:
+                send_frame(sock, encode_request(b'', {'type': 'stats'}))
+                reply = recv_frame(sock)
+            return reply is not None and json.loads(bytes(reply)).get('status') == 'success'
+        except (OSError, ValueError):
+            return False
+
+    def wait_ready(self, addresses: List[str]):
+        """Aguarda todos os serviços responderem; falha se algum processo terminar ou o tempo esgotar."""
+        start = time.monotonic()
+        pending = list(addresses)
+        while pending:
+            for address in list(pending):
+                port = int(address.split(':')[1])
+                _, process = self.processes[port]
+                if process.poll() is not None:
+                    raise RuntimeError(f"Serviço na porta {port} terminou ao iniciar "
+                                       f"(ver {self._log_path(self._process_name(port))})")
+                if self._probe(address):
+                    pending.remove(address)
+            if pending:
+                if time.monotonic() - start > self.startup_timeout:
+                    raise TimeoutError(f"Serviços sem resposta após {self.startup_timeout:.0f}s: {', '.join(pending)}")
+                time.sleep(0.1)
+        logger.info(f"{len(addresses)} serviços prontos em {time.monotonic() - start:.2f}s")
+
+    def run_source(self, num_lb1: int, num_lb2: int, run_id: str, results_dir: str,
+                   timeout: float = 300.0, config_path: Optional[str] = None) -> Optional[RunResults]:
+        """Executa a Source contra os serviços da célula e retorna os resultados registrados."""
+        with open(os.path.join(BASE_DIR, config_path or os.path.join('config', 'source.yaml')), 'r') as f:
+            config = yaml.safe_load(f)
+        # Load balancers em processo próprio (standalone), como na configuração da Source
+        balancers = {lb_id: config[f'loadbalancer{lb_id}'] for lb_id in (1, 2)
+                     if config[f'loadbalancer{lb_id}'].get('standalone', False)}
+        self.ensure_services(num_lb1, num_lb2, balancers, config_path)
+        env = {
+            'PYTHONUNBUFFERED': '1',
+            'RUN_ID': run_id,
+            'SERVICES_HOST': self.host,
+            'NUM_SERVICES_LB1': str(num_lb1),
+            'NUM_SERVICES_LB2': str(num_lb2),
+            'BASE_PORT_LB1': str(self.ports(1, 1)[0]),
+            'BASE_PORT_LB2': str(self.ports(2, 1)[0])
+        }
+        if config_path:
+            env['SOURCE_CONFIG'] = config_path
+        if 1 in balancers:
+            env.update({'LB1_HOST': self.host, 'LB1_PORT': str(self.lb_port(1))})
+        process = self._spawn([os.path.join(SRC_DIR, 'main.py')], env, f"source_{run_id}")
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            logger.error(f"Source da execução {run_id} não terminou em {timeout:.0f}s")
+            process.kill()
+            process.wait()
+        return read_results(results_path(results_dir, run_id), run_id)
+
+    def close(self):
+        """Encerra todos os processos de serviço."""
+        for port in list(self.processes):
+            self._stop_process(port)
+
+    def __enter__(self) -> 'LocalCluster':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,240 @@
+import math
+import statistics
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# Motivos de encerramento da medição
+STOP_CONVERGED = 'converged'
+STOP_MAX_SAMPLES = 'max_samples'
+STOP_TIME_BUDGET = 'time_budget'
+STOP_DURATION = 'duration'  # Modo fixo: duração configurada
+STOP_MAX_MESSAGES = 'max_messages'  # Modo fixo: limite de requisições
+STOP_STOPPED = 'stopped'  # Source parada antes do fim (stop())
+
+# Mínimo de lotes das médias em lotes: com 9 graus de liberdade ou mais a
+# aproximação de t_critical erra menos de 1% (a 95% e 99% de confiança)
+MIN_BATCHES = 10
+
+
+def t_critical(confidence: float, degrees: int) -> float:
+    """
+    Quantil bicaudal da t de Student (aproximação de Cornish-Fisher sobre a
+    normal). Subestima o quantil com poucos graus de liberdade (7,15 em vez de
+    12,71 com 1 grau a 95%), por isso só é usada com degrees >= MIN_BATCHES - 1.
+    """
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    return (z + (z ** 3 + z) / (4.0 * degrees)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96.0 * degrees ** 2))
+
+
+def batch_means_interval(samples: np.ndarray, batches: int, confidence: float) -> Tuple[float, float]:
+    """
+    Média e meia largura do intervalo de confiança pelo método das médias em
+    lotes: as amostras consecutivas de um experimento são correlacionadas (filas
+    compartilhadas), então o desvio é estimado entre as médias de `batches`
+    lotes contíguos em vez de entre as amostras individuais.
+    """
+    size = len(samples) // batches
+    means = samples[:size * batches].reshape(batches, size).mean(axis=1)
+    half_width = t_critical(confidence, batches - 1) * means.std(ddof=1) / math.sqrt(batches)
+    return float(samples.mean()), float(half_width)
+
+
+def quantile_interval(samples: np.ndarray, q: float, confidence: float) -> Optional[Tuple[float, float, float]]:
+    """
+    Percentil q (0-1) e intervalo de confiança sem supor distribuição, a partir
+    das estatísticas de ordem (aproximação normal da binomial). Retorna None
+    enquanto houver poucas amostras para limitar o intervalo.
+    """
+    n = len(samples)
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    spread = z * math.sqrt(n * q * (1 - q))
+    lower, upper = int(math.floor(n * q - spread)), int(math.ceil(n * q + spread))
+    if lower < 1 or upper > n:
+        return None
+    ordered = np.partition(samples, (lower - 1, int(math.ceil(n * q)) - 1, upper - 1))
+    return float(ordered[int(math.ceil(n * q)) - 1]), float(ordered[lower - 1]), float(ordered[upper - 1])
+
+
+class MeasurementController:
+    """
+    Controla a duração de uma execução a partir das próprias medidas.
+
+    As primeiras respostas (conexões sendo abertas, caches e modelo frios)
+    formam o aquecimento e são descartadas: por `warmup` segundos contados do
+    início ou, com 'auto', até as medianas do MRT de `warmup_windows` janelas
+    consecutivas de `warmup_window` respostas ficarem a até `warmup_tolerance`
+    umas das outras (limitado a `max_warmup` segundos). Uma fase fria plana
+    também parece estável em janelas curtas, então as janelas que confirmam a
+    estabilidade e mais uma depois delas também são descartadas.
+
+    Depois disso cada MRT é guardado, e com `adaptive` a execução termina assim
+    que os intervalos de confiança da média (médias em lotes) e do p99
+    (estatísticas de ordem) tiverem meia largura relativa de no máximo
+    `mean_precision` e `p99_precision`, com ao menos `min_samples` amostras.
+    Execuções pouco variáveis terminam cedo; as ruidosas seguem até convergir,
+    até `max_samples` amostras ou até esgotar `time_budget`.
+    """
+
+    def __init__(self, adaptive: bool = True, warmup: Union[str, float] = 'auto', warmup_window: int = 20,
+                 warmup_windows: int = 3, warmup_tolerance: float = 0.2, max_warmup: float = 30.0, min_samples: int = 200,
+                 max_samples: int = 20000, time_budget: float = 120.0, confidence: float = 0.95,
+                 mean_precision: float = 0.05, p99_precision: float = 0.10, batches: int = 20,
+                 check_interval: float = 1.0):
+        if warmup != 'auto' and float(warmup) < 0:
+            raise ValueError(f"Aquecimento inválido: {warmup} (use auto ou segundos >= 0)")
+        if not 0 < confidence < 1:
+            raise ValueError(f"Nível de confiança inválido: {confidence}")
+        if batches < MIN_BATCHES:
+            raise ValueError(f"Número de lotes inválido: {batches} (use ao menos {MIN_BATCHES})")
+        self.adaptive = adaptive
+        self.warmup = warmup if warmup == 'auto' else float(warmup)
+        self.warmup_window = warmup_window
+        self.warmup_windows = max(2, warmup_windows)
+        self.warmup_tolerance = warmup_tolerance
+        self.max_warmup = max_warmup
+        self.min_samples = max(min_samples, 2 * batches)
+        self.max_samples = max_samples
+        self.time_budget = time_budget
+        self.confidence = confidence
+        self.mean_precision = mean_precision
+        self.p99_precision = p99_precision
+        self.batches = batches
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._samples = np.empty(1024, dtype=np.float64)
+        self.samples = 0
+        self.start_time = 0.0
+        self.warmed_up_at: Optional[float] = None
+        self.warmup_requests = 0
+        self._window: List[float] = []
+        self._medians: List[float] = []
+        self._settling = 0  # Respostas ainda descartadas depois de detectada a estabilidade
+        self._last_check = 0.0
+        self.stop_reason: Optional[str] = None
+        self.estimates: Dict[str, Any] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'MeasurementController':
+        known = ('adaptive', 'warmup', 'warmup_window', 'warmup_windows', 'warmup_tolerance', 'max_warmup', 'min_samples',
+                 'max_samples', 'time_budget', 'confidence', 'mean_precision', 'p99_precision', 'batches',
+                 'check_interval')
+        return cls(**{key: value for key, value in config.items() if key in known})
+
+    def start(self, now: Optional[float] = None):
+        """Marca o início da execução (referência do aquecimento e do orçamento de tempo)."""
+        self.start_time = time.time() if now is None else now
+        self._last_check = self.start_time
+        if self.warmup != 'auto' and self.warmup == 0:
+            self.warmed_up_at = self.start_time
+
+    @property
+    def warming_up(self) -> bool:
+        return self.warmed_up_at is None
+
+    @property
+    def done(self) -> bool:
+        """Verdadeiro quando a medição pode parar de disparar requisições."""
+        return self.stop_reason is not None
+
+    def _in_warmup(self, mrt: float, intended_time: float, completed_at: float) -> bool:
+        """Verdadeiro se a resposta faz parte do aquecimento."""
+        if self.warmup != 'auto':
+            # Aquecimento fixo: decidido pelo instante planejado, mesmo com respostas fora de ordem
+            if intended_time - self.start_time < self.warmup:
+                return True
+            if self.warmed_up_at is None:
+                self.warmed_up_at = self.start_time + self.warmup
+            return False
+
+        if not self.warming_up:
+            return False
+        if completed_at - self.start_time >= self.max_warmup:
+            self.warmed_up_at = completed_at
+            return False
+        if self._settling:
+            self._settling -= 1
+            if not self._settling:
+                self.warmed_up_at = completed_at
+            return True
+        self._window.append(mrt)
+        if len(self._window) >= self.warmup_window:
+            self._medians = (self._medians + [float(np.median(self._window))])[-self.warmup_windows:]
+            self._window = []
+            if (len(self._medians) == self.warmup_windows
+                    and max(self._medians) - min(self._medians) <= self.warmup_tolerance * max(min(self._medians), 1e-9)):
+                # Estável: descarta ainda mais uma janela antes de medir
+                self._settling = self.warmup_window
+        return True
+
+    def observe(self, mrt: float, intended_time: float, completed_at: float) -> bool:
+        """
+        Registra o MRT de uma resposta. Retorna False se ela faz parte do
+        aquecimento (e deve ser descartada das métricas), True se foi medida.
+        """
+        with self._lock:
+            if self._in_warmup(mrt, intended_time, completed_at):
+                self.warmup_requests += 1
+                return False
+            if self.samples == len(self._samples):
+                self._samples = np.resize(self._samples, 2 * len(self._samples))
+            self._samples[self.samples] = mrt
+            self.samples += 1
+            if self.stop_reason is None:
+                self._check(completed_at)
+            return True
+
+    def _check(self, now: float):
+        if not self.adaptive:
+            return
+        if self.samples >= self.max_samples:
+            self.stop_reason = STOP_MAX_SAMPLES
+        elif self.samples >= self.min_samples and now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._update_estimates():
+                self.stop_reason = STOP_CONVERGED
+
+    def _update_estimates(self) -> bool:
+        """Recalcula os intervalos de confiança; retorna True se ambos estão dentro da precisão pedida."""
+        samples = self._samples[:self.samples]
+        mean, mean_half = batch_means_interval(samples, self.batches, self.confidence)
+        self.estimates = {'mean': mean, 'mean_ci': mean_half,
+                          'mean_precision': mean_half / mean if mean > 0 else math.inf}
+        p99 = quantile_interval(samples, 0.99, self.confidence)
+        if p99 is None:
+            return False
+        value, lower, upper = p99
+        self.estimates.update({'p99': value, 'p99_ci': [lower, upper],
+                               'p99_precision': (upper - lower) / 2.0 / value if value > 0 else math.inf})
+        return (self.estimates['mean_precision'] <= self.mean_precision
+                and self.estimates['p99_precision'] <= self.p99_precision)
+
+    def finish(self, reason: str):
+        """
+        Encerra a medição e atualiza as estimativas. `reason` é o motivo do fim da
+        geração de carga (STOP_TIME_BUDGET, STOP_DURATION, STOP_MAX_MESSAGES ou
+        STOP_STOPPED); prevalece o da própria medição, se ela já tinha parado.
+        """
+        with self._lock:
+            if self.stop_reason is None:
+                self.stop_reason = reason
+            if self.samples >= 2 * self.batches:
+                self._update_estimates()
+
+    def summary(self) -> Dict[str, Any]:
+        """Aquecimento descartado, amostras medidas, motivo do encerramento e intervalos de confiança."""
+        with self._lock:
+            return {
+                'adaptive': self.adaptive,
+                'warmup_requests': self.warmup_requests,
+                'warmup_seconds': (self.warmed_up_at - self.start_time) if self.warmed_up_at is not None else None,
+                'samples': self.samples,
+                'stop_reason': self.stop_reason,
+                'converged': self.stop_reason == STOP_CONVERGED,
+                'confidence': self.confidence,
+                **self.estimates
+            }
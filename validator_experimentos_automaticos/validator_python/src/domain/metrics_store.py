@@ -0,0 +1,186 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .latency_histogram import LatencyHistogram, PERCENTILES
+
+
+class MetricsStore:
+    """
+    Armazenamento colunar das métricas de cada requisição.
+
+    Cada etapa é uma linha contígua de um bloco float64 (etapas x capacidade),
+    e o serviço de cada nível (`targets`, por exemplo o S1 e o S2 usados) é
+    guardado como índice int32 em uma lista de nomes, junto do instante de
+    conclusão. A capacidade dobra quando enche, então cada requisição custa
+    algumas escritas em arrays, e os resumos são calculados em uma passada
+    vetorizada sobre todas as etapas.
+    """
+
+    def __init__(self, stages: Iterable[str], targets: Sequence[str] = (), capacity: int = 1024):
+        self.stages = list(stages)
+        self._rows = {stage: row for row, stage in enumerate(self.stages)}
+        self.target_levels = list(targets)
+        self.target_names: Dict[str, List[str]] = {level: [] for level in self.target_levels}
+        self._target_ids: Dict[str, Dict[str, int]] = {level: {} for level in self.target_levels}
+        capacity = max(1, capacity)
+        self._values = np.empty((len(self.stages), capacity), dtype=np.float64)
+        self._targets = np.empty((len(self.target_levels), capacity), dtype=np.int32)
+        self._timestamps = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self):
+        capacity = self._values.shape[1] * 2
+        for name in ('_values', '_targets'):
+            old = getattr(self, name)
+            new = np.empty((old.shape[0], capacity), dtype=old.dtype)
+            new[:, :self.size] = old[:, :self.size]
+            setattr(self, name, new)
+        timestamps = np.empty(capacity, dtype=np.float64)
+        timestamps[:self.size] = self._timestamps[:self.size]
+        self._timestamps = timestamps
+
+    def _target_id(self, level: str, name: str) -> int:
+        ids = self._target_ids[level]
+        if name not in ids:
+            ids[name] = len(ids)
+            self.target_names[level].append(name)
+        return ids[name]
+
+    def append(self, metrics: Dict[str, float], targets: Optional[Dict[str, str]] = None, timestamp: float = 0.0):
+        """Acrescenta uma requisição: um valor por etapa, o serviço de cada nível e o instante de conclusão."""
+        targets = targets or {}
+        with self._lock:
+            if self.size == self._values.shape[1]:
+                self._grow()
+            index = self.size
+            self._values[:, index] = [metrics[stage] for stage in self.stages]
+            for row, level in enumerate(self.target_levels):
+                self._targets[row, index] = self._target_id(level, targets.get(level, 'unknown'))
+            self._timestamps[index] = timestamp
+            self.size += 1
+
+    def extend(self, other: 'MetricsStore'):
+        """Acrescenta as requisições de outro armazenamento com as mesmas etapas."""
+        if other.stages != self.stages:
+            raise ValueError("Armazenamentos com etapas diferentes não podem ser combinados")
+        with self._lock:
+            count = other.size
+            while self.size + count > self._values.shape[1]:
+                self._grow()
+            end = self.size + count
+            self._values[:, self.size:end] = other.values
+            for row, level in enumerate(self.target_levels):
+                if level in other.target_levels:
+                    # Os índices do outro armazenamento são traduzidos para os nomes deste
+                    mapping = np.array([self._target_id(level, name) for name in other.target_names[level]],
+                                       dtype=np.int32)
+                    self._targets[row, self.size:end] = mapping[other.targets(level)] if len(mapping) else 0
+                else:
+                    self._targets[row, self.size:end] = self._target_id(level, 'unknown')
+            self._timestamps[self.size:end] = other.timestamps
+            self.size = end
+
+    @property
+    def values(self) -> np.ndarray:
+        """Matriz etapas x requisições (visão, sem cópia)."""
+        return self._values[:, :self.size]
+
+    def column(self, stage: str) -> np.ndarray:
+        """Valores de uma etapa na ordem de chegada (visão, sem cópia)."""
+        return self._values[self._rows[stage], :self.size]
+
+    def targets(self, level: str) -> np.ndarray:
+        """Índices (em target_names[level]) do serviço de cada requisição."""
+        return self._targets[self.target_levels.index(level), :self.size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self.size]
+
+    def sum_of(self, stages: Sequence[str]) -> np.ndarray:
+        """Soma, por requisição, de várias etapas."""
+        return self._values[[self._rows[stage] for stage in stages], :self.size].sum(axis=0)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Contagem, média, mínimo, percentis exatos e máximo de todas as etapas."""
+        with self._lock:
+            values = self.values
+            if not self.size:
+                return {}
+            quantiles = np.percentile(values, PERCENTILES, axis=1)
+            means, minimums, maximums = values.mean(axis=1), values.min(axis=1), values.max(axis=1)
+        summary = {}
+        for row, stage in enumerate(self.stages):
+            summary[stage] = {'count': self.size, 'mean': float(means[row]), 'min': float(minimums[row])}
+            for i, q in enumerate(PERCENTILES):
+                summary[stage][f'p{q:g}'] = float(quantiles[i, row])
+            summary[stage]['max'] = float(maximums[row])
+        return summary
+
+    def mean_by_target(self, level: str, stage: str) -> Dict[str, float]:
+        """Média de uma etapa agrupada pelo serviço de um nível."""
+        with self._lock:
+            ids = self.targets(level)
+            names = self.target_names[level]
+            counts = np.bincount(ids, minlength=len(names))
+            sums = np.bincount(ids, weights=self.column(stage), minlength=len(names))
+        return {name: float(sums[i] / counts[i]) for i, name in enumerate(names) if counts[i]}
+
+
+class LatencyRecorder:
+    """
+    Um histograma de latência por etapa (T1..T5, MRT...), seguro para várias
+    threads. Com `keep_raw` cada requisição também vai para um MetricsStore
+    (memória proporcional ao número de requisições) e os resumos passam a
+    usar os percentis exatos; sem ele a memória é fixa, qualquer que seja a
+    duração do experimento.
+    """
+
+    def __init__(self, stages: Iterable[str], significant_digits: int = 2, keep_raw: bool = False,
+                 targets: Sequence[str] = (), lowest: float = 1e-5, highest: float = 120.0):
+        self.stages = list(stages)
+        self.histograms = {stage: LatencyHistogram(lowest, highest, significant_digits) for stage in self.stages}
+        self.keep_raw = keep_raw
+        self.store = MetricsStore(self.stages, targets) if keep_raw else None
+        self._lock = threading.Lock()
+
+    def record(self, metrics: Dict[str, float], targets: Optional[Dict[str, str]] = None, timestamp: float = 0.0):
+        """Registra as latências de uma requisição (uma por etapa) e, com keep_raw, os serviços usados."""
+        with self._lock:
+            for stage in self.stages:
+                self.histograms[stage].record(metrics[stage])
+        if self.store is not None:
+            self.store.append(metrics, targets, timestamp)
+
+    @property
+    def count(self) -> int:
+        return self.histograms[self.stages[0]].count if self.stages else 0
+
+    def merge(self, other: 'LatencyRecorder'):
+        """Combina as medidas de outro gravador (por exemplo, de outro processo gerador de carga)."""
+        with self._lock:
+            for stage, histogram in other.histograms.items():
+                if stage in self.histograms:
+                    self.histograms[stage].merge(histogram)
+        if self.store is not None and other.store is not None:
+            self.store.extend(other.store)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Resumo por etapa: exato com as amostras guardadas, senão a partir dos histogramas."""
+        if self.store is not None and len(self.store) == self.count:
+            return self.store.summary()
+        with self._lock:
+            return {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+
+    def mean(self, stage: str) -> float:
+        return self.histograms[stage].mean
+
+    def raw(self, stage: str) -> Optional[np.ndarray]:
+        """Amostras de uma etapa na ordem de chegada (None sem keep_raw)."""
+        return self.store.column(stage) if self.store is not None else None
@@ -0,0 +1,55 @@
+import logging
+import os
+import threading
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Classificadores já carregados no processo, por caminho do modelo e por artefato.
+# São somente leitura depois de carregados, então todos os serviços os compartilham.
+_by_model_path: Dict[str, 'ImageClassifierService'] = {}
+_by_artifact: Dict[str, 'ImageClassifierService'] = {}
+_lock = threading.Lock()
+
+
+def get_classifier(model_path: str = None, train_workers: int = 0) -> 'ImageClassifierService':
+    """
+    Retorna o classificador compartilhado do processo, carregando (ou treinando)
+    o modelo apenas na primeira chamada para cada caminho de modelo.
+    """
+    from .service import ImageClassifierService
+
+    key = os.path.abspath(model_path or 'vehicle_classifier.pkl')
+    with _lock:
+        classifier = _by_model_path.get(key)
+        if classifier is None:
+            classifier = ImageClassifierService(model_path=model_path, train_workers=train_workers)
+            _by_model_path[key] = classifier
+            _by_artifact[os.path.abspath(classifier.artifact_path)] = classifier
+            logger.info(f"Modelo {classifier.model_key[:16]} registrado para compartilhamento entre serviços")
+        return classifier
+
+
+def get_classifier_for_artifact(artifact: str) -> 'ImageClassifierService':
+    """
+    Retorna o classificador de um artefato já validado (ex.: workers do pool).
+
+    Processos criados com fork herdam o registro do pai e reutilizam o modelo
+    via copy-on-write; com spawn o artefato é carregado com a matriz de treino
+    mapeada em memória, compartilhando as páginas entre os processos.
+    """
+    from .service import ImageClassifierService
+
+    key = os.path.abspath(artifact)
+    with _lock:
+        classifier = _by_artifact.get(key)
+        if classifier is None:
+            classifier = ImageClassifierService(artifact=artifact)
+            _by_artifact[key] = classifier
+        return classifier
+
+
+def loaded_models() -> int:
+    """Número de modelos distintos carregados neste processo."""
+    with _lock:
+        return len({id(classifier) for classifier in _by_artifact.values()})
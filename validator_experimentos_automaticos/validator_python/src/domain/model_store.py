@@ -0,0 +1,107 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Diretórios de treinamento e rótulo de cada um (0 para carros, 1 para motos)
+TRAIN_DIRS = (("data/train/cars", 0), ("data/train/bikes", 1))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+
+
+def training_files() -> List[Tuple[str, int]]:
+    """Lista as imagens de treinamento (caminho, rótulo) em ordem determinística."""
+    files = []
+    for train_dir, label in TRAIN_DIRS:
+        for img_name in sorted(os.listdir(train_dir)):
+            if img_name.endswith(IMAGE_EXTENSIONS):
+                files.append((os.path.join(train_dir, img_name), label))
+    return files
+
+
+def artifact_key(files: List[Tuple[str, int]], params: Dict[str, Any]) -> str:
+    """
+    Calcula a chave do artefato do modelo: hash do conteúdo das imagens de
+    treinamento, dos seus rótulos e dos parâmetros de pré-processamento.
+    """
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    for path, label in files:
+        file_hash = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                file_hash.update(block)
+        digest.update(f"{os.path.basename(path)}:{label}:{file_hash.hexdigest()}\n".encode())
+    return digest.hexdigest()
+
+
+def artifact_path(model_path: str, key: str) -> str:
+    """Caminho do artefato para uma chave: vehicle_classifier.pkl -> vehicle_classifier.<chave>.pkl"""
+    stem, ext = os.path.splitext(model_path)
+    return f"{stem}.{key[:16]}{ext or '.pkl'}"
+
+
+@contextlib.contextmanager
+def artifact_lock(model_path: str) -> Iterator[None]:
+    """Trava exclusiva para que apenas um serviço treine e grave o artefato por vez."""
+    if fcntl is None:
+        yield
+        return
+    lock_path = f"{model_path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def matrix_path(artifact: str) -> str:
+    """Caminho da matriz de treino de um artefato: vehicle_classifier.<chave>.npy"""
+    return f"{os.path.splitext(artifact)[0]}.npy"
+
+
+def save_artifact(path: str, meta: Dict[str, Any], matrix: np.ndarray):
+    """
+    Grava o artefato: a matriz de treino normalizada em .npy e os demais dados
+    (scaler, rótulos, chave) em .pkl. O .pkl é gravado por último, então sua
+    existência indica um artefato completo.
+    """
+    _atomic_write(matrix_path(path), lambda f: np.save(f, np.ascontiguousarray(matrix, dtype=np.float64)))
+    _atomic_write(path, lambda f: pickle.dump(meta, f))
+
+
+def load_artifact(path: str) -> Tuple[Dict[str, Any], np.ndarray]:
+    """
+    Carrega um artefato. A matriz de treino é mapeada em memória (somente
+    leitura), então processos que carregam o mesmo artefato compartilham as
+    mesmas páginas do cache do sistema operacional.
+    """
+    with open(path, 'rb') as f:
+        meta = pickle.load(f)
+    return meta, np.load(matrix_path(path), mmap_mode='r')
+
+
+def _atomic_write(path: str, write: Callable):
+    """Grava em um arquivo temporário e o renomeia, para nunca expor um arquivo incompleto."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,82 @@
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+
+# As imagens são reduzidas a 64x64 pixels em escala de cinza
+IMAGE_SIZE = 64
+FEATURE_SIZE = IMAGE_SIZE * IMAGE_SIZE
+
+# Fatores de redução suportados pelo decodificador JPEG do OpenCV (do maior para o menor)
+REDUCED_GRAYSCALE_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+# Marcadores SOF (início de quadro) do JPEG, que trazem as dimensões da imagem
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Marcadores sem campo de tamanho
+_JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+
+def jpeg_size(data: memoryview) -> Optional[Tuple[int, int]]:
+    """Lê (largura, altura) do cabeçalho de um JPEG sem decodificá-lo; None se não for um JPEG válido."""
+    size = len(data)
+    if size < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 4 <= size:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Bytes de preenchimento
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        if marker in _JPEG_SOF_MARKERS:
+            if i + 9 > size:
+                return None
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+def decode_mode(data: memoryview) -> int:
+    """
+    Escolhe o modo de leitura: JPEGs grandes o bastante são decodificados
+    direto em escala de cinza e em resolução reduzida (1/2, 1/4 ou 1/8),
+    desde que o resultado ainda tenha pelo menos IMAGE_SIZE pixels por lado.
+    """
+    dimensions = jpeg_size(data)
+    if dimensions:
+        for factor, mode in REDUCED_GRAYSCALE_MODES:
+            if min(dimensions) // factor >= IMAGE_SIZE:
+                return mode
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_features(image_data) -> np.ndarray:
+    """
+    Decodifica uma imagem (bytes, bytearray, memoryview ou array) e a reduz
+    ao vetor de 64x64 pixels em escala de cinza.
+    """
+    buffer = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(buffer, decode_mode(memoryview(buffer)))
+    if img is None:
+        raise ValueError("Falha ao decodificar a imagem")
+
+    # Redimensiona para 64x64 e aplana a imagem
+    return cv2.resize(img, (IMAGE_SIZE, IMAGE_SIZE)).flatten()
+
+
+def tensor_features(tensor_data) -> np.ndarray:
+    """Interpreta um tensor 64x64 uint8 já pré-processado, sem cópia."""
+    features = np.frombuffer(tensor_data, np.uint8)
+    if features.size != FEATURE_SIZE:
+        raise ValueError(f"Tensor inválido: {features.size} valores (esperado {FEATURE_SIZE})")
+    return features
@@ -0,0 +1,172 @@
+import json
+import struct
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Requisições com envelope começam com este marcador, seguido de 4 bytes com o
+# tamanho do cabeçalho JSON, do cabeçalho e do corpo (imagem ou tensor).
+# Mensagens sem o marcador são imagens puras (formato original).
+ENVELOPE_MAGIC = b'PSD1'
+HEADER_LEN_SIZE = 4
+
+PAYLOAD_IMAGE = 'image'    # Imagem codificada (JPEG, PNG...)
+PAYLOAD_TENSOR = 'tensor'  # Imagem já pré-processada: 64x64 em escala de cinza, uint8
+
+# Formatos de resposta. O cliente pede o binário com 'accept': 'binary' no
+# cabeçalho da requisição; sem o pedido (ou se a resposta não couber no
+# formato binário, como nos erros) a resposta é JSON.
+RESPONSE_JSON = 'json'
+RESPONSE_BINARY = 'binary'
+
+# Resposta binária: parte fixa (marcador, status, classe, flags, confiança
+# float32, tempo de processamento em ns, id da requisição e versão do modelo),
+# seguida dos carimbos (rótulo, instante) e da rota (nomes dos serviços)
+RESPONSE_MAGIC = b'PSR1'
+RESPONSE_STRUCT = struct.Struct('>4sBBBxfQq8s')
+STAMP_STRUCT = struct.Struct('>Bd')
+STATUS_SUCCESS = 0
+FLAG_CACHED = 0x01
+
+# Erro das requisições recusadas por sobrecarga. A resposta JSON começa sempre
+# com OVERLOADED_PREFIX, para que load balancers a reconheçam sem interpretá-la
+OVERLOADED = 'overloaded'
+OVERLOADED_PREFIX = json.dumps({'status': 'error', 'error': OVERLOADED})[:-1].encode()
+
+CLASS_NAMES = ('Carro', 'Moto')  # Índice = rótulo do modelo
+STAMP_LABELS = (
+    'source_send', 's1_recv', 's1_process_start', 's1_process_end', 's1_forward',
+    's2_recv', 's2_process_start', 's2_process_end', 's2_reply', 's1_reply_recv', 's1_reply'
+)
+_STAMP_IDS = {label: i for i, label in enumerate(STAMP_LABELS)}
+
+
+def encode_request(body: bytes, header: Dict[str, Any]) -> bytes:
+    """Monta uma requisição com envelope (cabeçalho JSON + corpo)."""
+    header_data = json.dumps(header).encode()
+    return ENVELOPE_MAGIC + len(header_data).to_bytes(HEADER_LEN_SIZE, 'big') + header_data + body
+
+
+def decode_request(payload) -> Tuple[Dict[str, Any], memoryview]:
+    """
+    Separa cabeçalho e corpo de uma requisição; imagens puras recebem cabeçalho vazio.
+
+    Aceita bytes, bytearray ou memoryview; o corpo é devolvido como memoryview
+    sobre a mensagem recebida, sem cópia.
+    """
+    view = memoryview(payload)
+    if view[:len(ENVELOPE_MAGIC)] != ENVELOPE_MAGIC:
+        return {}, view
+    offset = len(ENVELOPE_MAGIC)
+    header_len = int.from_bytes(view[offset:offset + HEADER_LEN_SIZE], 'big')
+    offset += HEADER_LEN_SIZE
+    header = json.loads(bytes(view[offset:offset + header_len]))
+    return header, view[offset + header_len:]
+
+
+def stamp(message: Dict[str, Any], label: str) -> float:
+    """
+    Registra em `message['stamps']` o instante em que a mensagem passou por um ponto.
+
+    Os instantes usam o relógio de parede (time.time()), compartilhado pelos
+    containers de um mesmo host.
+    """
+    now = time.time()
+    message.setdefault('stamps', []).append([label, now])
+    return now
+
+
+def stamp_times(stamps: List[List[Any]]) -> Dict[str, float]:
+    """Converte a lista de carimbos em um dicionário rótulo -> instante."""
+    return {label: when for label, when in stamps}
+
+
+def encode_response(response: Dict[str, Any], response_format: Optional[str] = RESPONSE_JSON) -> bytes:
+    """Serializa uma resposta no formato pedido, recorrendo ao JSON quando o binário não se aplica."""
+    if response_format == RESPONSE_BINARY:
+        data = _encode_binary_response(response)
+        if data is not None:
+            return data
+    return json.dumps(response).encode()
+
+
+def _encode_binary_response(response: Dict[str, Any]) -> Optional[bytes]:
+    if response.get('status') != 'success' or response.get('class') not in CLASS_NAMES:
+        return None
+    stamps = response.get('stamps', [])
+    route = [name.encode() for name in response.get('route', [])]
+    if any(label not in _STAMP_IDS for label, _ in stamps) or len(stamps) > 255 or len(route) > 255:
+        return None
+    if any(len(name) > 255 for name in route):
+        return None
+
+    request_id = response.get('request_id')
+    parts = [RESPONSE_STRUCT.pack(
+        RESPONSE_MAGIC,
+        STATUS_SUCCESS,
+        CLASS_NAMES.index(response['class']),
+        FLAG_CACHED if response.get('cached') else 0,
+        response['confidence'],
+        int(response.get('processing_time', 0.0) * 1e9),
+        request_id if isinstance(request_id, int) else -1,
+        bytes.fromhex(response['model_version'][:16]) if response.get('model_version') else b''
+    ), bytes([len(stamps)])]
+    parts.extend(STAMP_STRUCT.pack(_STAMP_IDS[label], when) for label, when in stamps)
+    parts.append(bytes([len(route)]))
+    for name in route:
+        parts.append(bytes([len(name)]))
+        parts.append(name)
+    return b''.join(parts)
+
+
+def decode_response(data) -> Dict[str, Any]:
+    """Interpreta uma resposta binária ou JSON, devolvendo sempre o dicionário da resposta."""
+    view = memoryview(data)
+    if view[:len(RESPONSE_MAGIC)] != RESPONSE_MAGIC:
+        return json.loads(data)
+
+    _, status, class_id, flags, confidence, processing_ns, request_id, model_version = \
+        RESPONSE_STRUCT.unpack_from(view)
+    offset = RESPONSE_STRUCT.size
+    stamps = []
+    for _ in range(view[offset]):
+        label_id, when = STAMP_STRUCT.unpack_from(view, offset + 1)
+        stamps.append([STAMP_LABELS[label_id], when])
+        offset += STAMP_STRUCT.size
+    offset += 1
+    route = []
+    for _ in range(view[offset]):
+        length = view[offset + 1]
+        route.append(bytes(view[offset + 2:offset + 2 + length]).decode())
+        offset += 1 + length
+
+    response = {
+        'status': 'success' if status == STATUS_SUCCESS else 'error',
+        'class': CLASS_NAMES[class_id],
+        'confidence': confidence,
+        'processing_time': processing_ns / 1e9,
+        'stamps': stamps,
+        'request_id': request_id if request_id >= 0 else None,
+        'route': route
+    }
+    if model_version.strip(b'\0'):
+        response['model_version'] = model_version.hex()
+    if flags & FLAG_CACHED:
+        response['cached'] = True
+    return response
+
+
+class OverloadedError(Exception):
+    """A requisição foi recusada por sobrecarga (controle de admissão ou limite de conexões)."""
+
+
+def overloaded_response(stamps: List[List[Any]], detail: str = '') -> Dict[str, Any]:
+    """Resposta de recusa por sobrecarga (o serviço ou o load balancer está no limite)."""
+    response = {'status': 'error', 'error': OVERLOADED, 'stamps': stamps}
+    if detail:
+        response['detail'] = detail
+    return response
+
+
+def is_overloaded(reply) -> bool:
+    """Indica se uma resposta serializada é uma recusa por sobrecarga."""
+    return memoryview(reply)[:len(OVERLOADED_PREFIX)] == OVERLOADED_PREFIX
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class ResultCache:
+    """
+    Cache de resultados de classificação indexado pelo hash do conteúdo e pela
+    versão do modelo.
+
+    A chave é o hash (BLAKE2b) dos bytes recebidos e do tipo de payload; o
+    valor é a classe e a confiança. O tamanho é limitado (descarta a entrada
+    usada há mais tempo) e cada entrada expira após `ttl_seconds`. Cada entrada
+    pertence à versão do modelo que a produziu, e só são servidas entradas das
+    versões em uso (model_versions). Se o modelo é de outro processo (S1
+    guardando resultados do S2), os serviços do próximo estágio podem estar em
+    versões diferentes ao mesmo tempo: as versões vistas nas respostas são
+    acrescentadas (add_model_version) e o conjunto completo é substituído pela
+    verificação periódica (set_model_versions), que descarta as entradas das
+    versões que saíram de uso.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.model_versions: Tuple[str, ...] = ()
+        self._entries: "OrderedDict[Tuple[bytes, str], Tuple[str, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0  # Descartes por tamanho
+        self.expirations = 0  # Descartes por TTL
+        self.invalidations = 0  # Entradas descartadas porque a versão do modelo saiu de uso
+
+    @staticmethod
+    def key(body: bytes, payload: Optional[str] = None) -> bytes:
+        """Hash do conteúdo da requisição (imagem ou tensor)."""
+        digest = hashlib.blake2b(body, digest_size=16)
+        digest.update((payload or '').encode())
+        return digest.digest()
+
+    def set_model_versions(self, versions: Iterable[str]):
+        """Substitui as versões do modelo em uso; as entradas das demais versões são descartadas."""
+        versions = tuple(sorted(set(v for v in versions if v)))
+        with self._lock:
+            if versions == self.model_versions:
+                return
+            stale = [key for key in self._entries if key[1] not in versions]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self.model_versions = versions
+
+    def add_model_version(self, version: Optional[str]):
+        """Acrescenta uma versão em uso (vista numa resposta) sem descartar as demais."""
+        if not version:
+            return
+        with self._lock:
+            if version not in self.model_versions:
+                self.model_versions = tuple(sorted(self.model_versions + (version,)))
+
+    def get(self, key: bytes) -> Optional[Tuple[str, float, str]]:
+        """Retorna (classe, confiança, versão) se houver entrada válida de uma versão em uso."""
+        now = time.monotonic()
+        with self._lock:
+            for version in self.model_versions:
+                entry = self._entries.get((key, version))
+                if entry is None:
+                    continue
+                class_name, confidence, stored_at = entry
+                if now - stored_at > self.ttl:
+                    del self._entries[(key, version)]
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end((key, version))
+                self.hits += 1
+                return class_name, confidence, version
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, class_name: str, confidence: float, model_version: Optional[str] = None):
+        """Armazena um resultado; resultados de versões fora de uso são ignorados."""
+        with self._lock:
+            if model_version not in self.model_versions:
+                return
+            self._entries[(key, model_version)] = (class_name, confidence, time.monotonic())
+            self._entries.move_to_end((key, model_version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores do cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'model_versions': list(self.model_versions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
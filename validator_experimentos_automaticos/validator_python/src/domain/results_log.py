@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+# Tipos de registro: início da execução, requisição concluída, falha (erro ou recusa) e fim
+RECORD_RUN = 'run'
+RECORD_REQUEST = 'req'
+RECORD_FAILURE = 'fail'
+RECORD_END = 'end'
+
+# Ordem das etapas no campo 't' dos registros de requisição (T1..T6)
+STAGE_FIELDS = ('t1_source_lb1', 't2_lb1_service', 't3_service_lb2', 't4_lb2_service',
+                't_processamento', 't5_service_source')
+
+
+def new_run_id() -> str:
+    """Identificador de execução: data e hora mais um sufixo aleatório."""
+    return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+
+
+def results_path(directory: str, run_id: str) -> str:
+    return os.path.join(directory, f"{run_id}.jsonl")
+
+
+class ResultsLog:
+    """
+    Registro das requisições de uma execução em JSON-lines (um objeto por
+    linha, só acrescentado), para o run_experiments.py ler os números
+    medidos diretamente em vez de extraí-los dos logs.
+
+    Cada linha traz o identificador da execução (`run`) e o tipo: um registro
+    'run' com a configuração, um 'req' por requisição concluída, um 'fail'
+    por erro ou recusa e um 'end' com o resumo, escrito ao final. A escrita
+    usa buffer e é descarregada no disco a cada `flush_interval` segundos.
+    """
+
+    def __init__(self, path: str, run_id: str, flush_interval: float = 1.0):
+        self.path = path
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def _write(self, record: Dict[str, Any], flush: bool = False):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            now = time.monotonic()
+            if flush or now - self._last_flush >= self.flush_interval:
+                self._file.flush()
+                self._last_flush = now
+
+    def start(self, info: Dict[str, Any]):
+        """Registra o início da execução com a sua configuração."""
+        self._write({'run': self.run_id, 'type': RECORD_RUN, 'at': time.time(), **info}, flush=True)
+
+    def request(self, request_id: int, metrics: Dict[str, float], lb1_service: str, lb2_service: str,
+                intended_at: float, completed_at: float, warmup: bool = False):
+        """
+        Registra uma requisição concluída: tempos das etapas (T1..T6), MRT e MRT
+        corrigido. As do aquecimento levam 'warmup' e ficam fora dos resultados lidos.
+        """
+        record = {
+            'run': self.run_id,
+            'type': RECORD_REQUEST,
+            'id': request_id,
+            'at': round(completed_at, 6),
+            'intended': round(intended_at, 6),
+            's1': lb1_service,
+            's2': lb2_service,
+            't': [round(metrics[stage], 6) for stage in STAGE_FIELDS],
+            'mrt': round(metrics['t5_total'], 6),
+            'mrt_corr': round(metrics['t5_total_corrigido'], 6)
+        }
+        if warmup:
+            record['warmup'] = True
+        self._write(record)
+
+    def failure(self, request_id: int, kind: str, error: str, intended_at: float):
+        """Registra uma requisição que falhou ('error') ou foi recusada por sobrecarga ('overloaded')."""
+        self._write({'run': self.run_id, 'type': RECORD_FAILURE, 'id': request_id, 'kind': kind,
+                     'error': error, 'intended': round(intended_at, 6), 'at': time.time()})
+
+    def end(self, summary: Dict[str, Any]):
+        """Registra o fim da execução com o resumo (contagens, taxas e percentis)."""
+        self._write({'run': self.run_id, 'type': RECORD_END, 'at': time.time(), **summary}, flush=True)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+@dataclass
+class RunResults:
+    """Registros de uma execução lidos de um arquivo de resultados."""
+    run_id: str
+    info: Dict[str, Any] = field(default_factory=dict)
+    requests: List[Dict[str, Any]] = field(default_factory=list)
+    warmup: List[Dict[str, Any]] = field(default_factory=list)  # Requisições descartadas no aquecimento
+    failures: List[Dict[str, Any]] = field(default_factory=list)
+    end: Optional[Dict[str, Any]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.end is not None
+
+    @property
+    def mrts(self) -> List[float]:
+        return [record['mrt'] for record in self.requests]
+
+    @property
+    def corrected_mrts(self) -> List[float]:
+        return [record['mrt_corr'] for record in self.requests]
+
+
+def iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Percorre os registros do arquivo, ignorando uma última linha incompleta (escrita em andamento)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            yield json.loads(line)
+
+
+def read_results(path: str, run_id: Optional[str] = None) -> Optional[RunResults]:
+    """Lê os registros de uma execução (a última do arquivo se `run_id` não for informado)."""
+    if not os.path.exists(path):
+        return None
+    runs: Dict[str, RunResults] = {}
+    last = None
+    for record in iter_records(path):
+        if run_id is not None and record.get('run') != run_id:
+            continue
+        last = record['run']
+        results = runs.setdefault(last, RunResults(run_id=last))
+        kind = record['type']
+        if kind == RECORD_REQUEST:
+            (results.warmup if record.get('warmup') else results.requests).append(record)
+        elif kind == RECORD_FAILURE:
+            results.failures.append(record)
+        elif kind == RECORD_RUN:
+            results.info = record
+        elif kind == RECORD_END:
+            results.end = record
+    return runs.get(run_id if run_id is not None else last)
+
+
+def wait_for_results(path: str, run_id: Optional[str] = None, timeout: float = 300.0,
+                     poll_interval: float = 1.0) -> Optional[RunResults]:
+    """
+    Aguarda o registro de fim da execução e retorna os resultados; ao esgotar
+    o tempo retorna o que foi registrado até então (ou None se nada foi).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        results = read_results(path, run_id)
+        if (results and results.finished) or time.monotonic() >= deadline:
+            return results
+        time.sleep(poll_interval)
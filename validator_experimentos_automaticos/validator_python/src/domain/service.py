@@ -1,172 +1,200 @@
 import numpy as np
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.preprocessing import StandardScaler
-import cv2
-import pickle
 import os
 import logging
-import time
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import socket
 import threading
 import yaml
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from .knn import KNNScorer
+from .preprocessing import IMAGE_SIZE, decode_features, tensor_features
+from .feature_store import FeatureStore
+from .model_store import training_files, artifact_key, artifact_path, artifact_lock, save_artifact, load_artifact
+from .framing import send_frame, read_frame, encode_frame, FrameReceiver
+from .protocol import (decode_request, encode_request, encode_response, decode_response, stamp,
+                       overloaded_response, PAYLOAD_TENSOR, RESPONSE_JSON, RESPONSE_BINARY, CLASS_NAMES)
+from .connection_pool import ConnectionPool
+from .load_balancer_proxy import LoadBalancerProxy
+from .batching import BatchingClassifier
+from .result_cache import ResultCache
+from .admission import AdmissionController
+from .worker_pool import ProcessWorkerPool
+from .model_registry import get_classifier, loaded_models
 
 logger = logging.getLogger(__name__)
 
+# Parâmetros do pré-processamento e do modelo; fazem parte da chave do artefato,
+# então alterá-los invalida os modelos já treinados
+N_NEIGHBORS = 5
+PREPROCESSING_PARAMS = {'image_size': IMAGE_SIZE, 'color': 'gray', 'decode': 'reduced_grayscale', 'version': 2}
+MODEL_PARAMS = {**PREPROCESSING_PARAMS, 'n_neighbors': N_NEIGHBORS}
+
+# Características pré-processadas das imagens de treinamento
+FEATURE_STORE_DIR = 'data/features'
+
 class ImageClassifierService:
-    def __init__(self, model_path: str = None):
+    def __init__(self, model_path: str = None, artifact: str = None, train_workers: int = 0):
         self.model = None
+        self.knn = None
         self.scaler = StandardScaler()
+        # Matriz de treino normalizada e rótulos do modelo atual (artefato e kNN em NumPy)
+        self.train_features = None
+        self.train_labels = None
         self.is_training = False
         self.model_path = model_path or 'vehicle_classifier.pkl'
+        self.model_key = None  # Versão do modelo (hash das imagens de treinamento e parâmetros)
+        self.artifact_path = None
+        self.train_workers = train_workers  # Threads do pré-processamento no treinamento (0 = CPUs)
         
-        # Carrega o modelo se existir
-        if os.path.exists(self.model_path):
-            self._load_model()
+        if artifact:
+            # Artefato já validado por outro processo (ex.: workers do pool)
+            self._load_model(artifact)
         else:
-            self._train_model()
+            self.load_or_train()
     
-    def _load_model(self):
-        """Carrega o modelo treinado."""
-        try:
-            with open(self.model_path, 'rb') as f:
-                data = pickle.load(f)
-                self.model = data['model']
-                self.scaler = data['scaler']
-            logger.info("Modelo carregado com sucesso")
-        except Exception as e:
-            logger.error(f"Erro ao carregar modelo: {str(e)}")
-            self._train_model()
+    def load_or_train(self):
+        """Carrega o artefato correspondente às imagens de treinamento atuais ou treina um novo."""
+        files = training_files()
+        key = artifact_key(files, MODEL_PARAMS)
+        path = artifact_path(self.model_path, key)
+        
+        # Serviços do mesmo host esperam uns pelos outros em vez de treinar ao mesmo tempo
+        with artifact_lock(self.model_path):
+            if os.path.exists(path):
+                try:
+                    self._load_model(path, key)
+                    return
+                except Exception as e:
+                    logger.error(f"Erro ao carregar modelo: {str(e)}")
+            logger.info(f"Nenhum artefato para a versão {key[:16]}, treinando")
+            self._train_model(files, key)
+    
+    def _load_model(self, path: str, key: str = None):
+        """Carrega o modelo treinado, conferindo a versão quando informada."""
+        meta, matrix = load_artifact(path)
+        if key and meta.get('key') != key:
+            raise ValueError(f"Artefato {path} não corresponde às imagens de treinamento atuais")
+        self.scaler = meta['scaler']
+        # Com a busca por força bruta o "treino" apenas referencia a matriz mapeada em memória
+        self.model = KNeighborsClassifier(n_neighbors=meta['n_neighbors'], algorithm='brute')
+        self.model.fit(matrix, meta['labels'])
+        self.train_features, self.train_labels = matrix, np.asarray(meta['labels'])
+        self.model_key = meta.get('key')
+        self.artifact_path = path
+        self._build_scorer()
+        logger.info(f"Modelo carregado com sucesso ({os.path.basename(path)})")
     
     def _save_model(self):
-        """Salva o modelo treinado."""
+        """Salva o modelo treinado (escrita atômica)."""
         try:
-            with open(self.model_path, 'wb') as f:
-                pickle.dump({
-                    'model': self.model,
-                    'scaler': self.scaler
-                }, f)
-            logger.info("Modelo salvo com sucesso")
+            save_artifact(self.artifact_path, {
+                'scaler': self.scaler,
+                'labels': self.train_labels,
+                'n_neighbors': self.model.n_neighbors,
+                'key': self.model_key,
+                'params': MODEL_PARAMS
+            }, self.train_features)
+            logger.info(f"Modelo salvo com sucesso ({os.path.basename(self.artifact_path)})")
         except Exception as e:
             logger.error(f"Erro ao salvar modelo: {str(e)}")
     
     def _process_image(self, img_path: str) -> np.ndarray:
-        """Processa uma imagem para treinamento ou classificação."""
+        """Processa uma imagem para treinamento (erros são registrados por quem processa o lote)."""
+        # Mesmo caminho de decodificação usado nas requisições
         try:
-            # Tenta ler a imagem
-            img = cv2.imread(img_path)
-            if img is None:
-                # Se falhar, tenta ler como webp
-                img = cv2.imdecode(np.fromfile(img_path, dtype=np.uint8), cv2.IMREAD_COLOR)
-            
-            if img is None:
-                raise ValueError(f"Não foi possível ler a imagem: {img_path}")
-            
-            # Redimensiona para 64x64 e converte para escala de cinza
-            img = cv2.resize(img, (64, 64))
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Aplana a imagem
-            return img.flatten()
-            
-        except Exception as e:
-            logger.error(f"Erro ao processar imagem {img_path}: {str(e)}")
-            raise
+            return decode_features(np.fromfile(img_path, dtype=np.uint8))
+        except ValueError:
+            raise ValueError(f"Não foi possível ler a imagem: {img_path}")
     
-    def _train_model(self):
+    def _train_model(self, files: List[Tuple[str, int]] = None, key: str = None):
         """Treina o modelo KNN com imagens de carros e motos."""
         logger.info("Iniciando treinamento do modelo...")
         self.is_training = True
         
-        # Diretórios com as imagens de treinamento
-        car_dir = "data/train/cars"
-        bike_dir = "data/train/bikes"
-        
-        # Carrega e processa as imagens
-        X = []  # Features
-        y = []  # Labels (0 para carros, 1 para motos)
+        if files is None:
+            files = training_files()
+            key = artifact_key(files, MODEL_PARAMS)
         
-        # Processa imagens de carros
-        for img_name in os.listdir(car_dir):
-            if img_name.endswith(('.jpg', '.jpeg', '.png', '.webp', '.avif')):
-                img_path = os.path.join(car_dir, img_name)
-                try:
-                    features = self._process_image(img_path)
-                    X.append(features)
-                    y.append(0)  # 0 para carros
-                    logger.info(f"Imagem processada: {img_path}")
-                except Exception as e:
-                    logger.error(f"Erro ao processar imagem {img_path}: {str(e)}")
-        
-        # Processa imagens de motos
-        for img_name in os.listdir(bike_dir):
-            if img_name.endswith(('.jpg', '.jpeg', '.png', '.webp', '.avif')):
-                img_path = os.path.join(bike_dir, img_name)
-                try:
-                    features = self._process_image(img_path)
-                    X.append(features)
-                    y.append(1)  # 1 para motos
-                    logger.info(f"Imagem processada: {img_path}")
-                except Exception as e:
-                    logger.error(f"Erro ao processar imagem {img_path}: {str(e)}")
-        
-        if not X:
-            raise ValueError("Nenhuma imagem válida encontrada para treinamento")
-        
-        # Converte para arrays numpy
-        X = np.array(X)
-        y = np.array(y)
+        # Carrega as características já armazenadas e processa apenas as imagens novas ou alteradas
+        # X: features, y: labels (0 para carros, 1 para motos)
+        X, y = FeatureStore(FEATURE_STORE_DIR, PREPROCESSING_PARAMS, workers=self.train_workers).sync(files, self._process_image)
         
         # Normaliza os dados
         X = self.scaler.fit_transform(X)
         
         # Treina o modelo KNN
-        self.model = KNeighborsClassifier(n_neighbors=5)
+        self.model = KNeighborsClassifier(n_neighbors=N_NEIGHBORS, algorithm='brute')
         self.model.fit(X, y)
+        self.train_features, self.train_labels = X, np.asarray(y)
+        self._build_scorer()
         
         # Salva o modelo
+        self.model_key = key
+        self.artifact_path = artifact_path(self.model_path, key)
         self._save_model()
         self.is_training = False
         logger.info("Treinamento concluído com sucesso")
     
-    def classify_image(self, image_data: bytes) -> Tuple[str, float]:
-        """Classifica uma imagem e retorna a classe e a confiança."""
-        try:
-            if not image_data or len(image_data) < 1000:  # Mínimo de 1KB para uma imagem válida
-                raise ValueError(f"Imagem inválida: tamanho muito pequeno ({len(image_data)} bytes)")
-            
-            # Converte os bytes da imagem para array numpy
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                raise ValueError("Falha ao decodificar a imagem")
-            
-            logger.info(f"Imagem decodificada com sucesso. Dimensões: {img.shape}")
-            
-            # Redimensiona para 64x64 e converte para escala de cinza
-            img = cv2.resize(img, (64, 64))
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Verifica se a imagem está vazia ou corrompida
-            if img.size == 0 or np.all(img == 0):
-                raise ValueError("Imagem vazia ou corrompida")
-            
-            features = img.flatten().reshape(1, -1)
-            
+    def preprocess(self, image_data: bytes) -> np.ndarray:
+        """Decodifica uma imagem e a reduz ao vetor de 64x64 pixels em escala de cinza."""
+        if not image_data or len(image_data) < 1000:  # Mínimo de 1KB para uma imagem válida
+            raise ValueError(f"Imagem inválida: tamanho muito pequeno ({len(image_data)} bytes)")
+        
+        # Decodifica direto em escala de cinza (e em resolução reduzida, se possível)
+        features = decode_features(image_data)
+        logger.info(f"Imagem decodificada com sucesso ({len(image_data)} bytes)")
+        
+        # Verifica se a imagem está vazia ou corrompida
+        if features.size == 0 or not features.any():
+            raise ValueError("Imagem vazia ou corrompida")
+        
+        return features
+    
+    def features_from_tensor(self, tensor_data: bytes) -> np.ndarray:
+        """Interpreta um tensor 64x64 uint8 já pré-processado (ex.: pelo estágio anterior ou pelo cliente)."""
+        return tensor_features(tensor_data)
+    
+    def classify_features(self, features: np.ndarray) -> Tuple[str, float]:
+        """Classifica um vetor de características pré-processado."""
+        return self.classify_batch(features.reshape(1, -1))[0]
+    
+    def classify_batch(self, features: np.ndarray) -> List[Tuple[str, float]]:
+        """Classifica uma matriz de características (uma linha por imagem) de uma só vez."""
+        if self.knn is not None:
+            # Uma única busca de vizinhos fornece a classe e a confiança
+            predictions, confidences = self.knn.predict(features)
+        else:
             # Normaliza os dados
             features = self.scaler.transform(features)
             
             # Faz a predição
-            prediction = self.model.predict(features)[0]
-            probabilities = self.model.predict_proba(features)[0]
-            confidence = probabilities[prediction]
-            
-            # Retorna a classe e a confiança
-            class_name = "Carro" if prediction == 0 else "Moto"
-            return class_name, confidence
-            
+            predictions = self.model.predict(features)
+            probabilities = self.model.predict_proba(features)
+            confidences = [probabilities[i][prediction] for i, prediction in enumerate(predictions)]
+        
+        # Retorna a classe e a confiança de cada imagem
+        return [
+            (CLASS_NAMES[prediction], confidence)
+            for prediction, confidence in zip(predictions, confidences)
+        ]
+    
+    def _build_scorer(self):
+        """Prepara o kNN em NumPy a partir do modelo treinado (ou usa o sklearn se não for possível)."""
+        try:
+            self.knn = KNNScorer.from_training(self.scaler, self.train_features, self.train_labels,
+                                               n_neighbors=self.model.n_neighbors)
+        except Exception as e:
+            logger.warning(f"kNN em NumPy indisponível, usando o sklearn: {str(e)}")
+            self.knn = None
+    
+    def classify_image(self, image_data: bytes) -> Tuple[str, float]:
+        """Classifica uma imagem e retorna a classe e a confiança."""
+        try:
+            return self.classify_features(self.preprocess(image_data))
         except Exception as e:
             logger.error(f"Erro ao classificar imagem: {str(e)}")
             raise
@@ -176,38 +204,133 @@ class Service:
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         
-        self.classifier = ImageClassifierService()
+        # Modelo compartilhado por todos os serviços do processo (carregado uma única vez)
+        self.classifier = get_classifier(train_workers=self.config['service'].get('train_workers', 0))
         self.running = False
         self.server_socket = None
         
         # Configuração do servidor
         self.host = self.config['service'].get('host', 'localhost')
         self.port = self.config['service'].get('port', 0)
+        # Tempo máximo (s) que uma conexão persistente pode ficar ociosa
+        self.keepalive_timeout = self.config['service'].get('keepalive_timeout', 60)
+        self.name = self.config['service'].get('name')
+        # Modelo do servidor: 'threaded' (uma thread por conexão) ou 'asyncio' (event loop)
+        self.server_mode = self.config['service'].get('server', 'threaded')
+        if self.server_mode not in ('threaded', 'asyncio'):
+            raise ValueError(f"Modelo de servidor desconhecido: {self.server_mode} (use threaded ou asyncio)")
+        self.backlog = self.config['service'].get('backlog', 128)
+        # Threads do executor que processa as requisições no modo asyncio
+        self.executor_workers = self.config['service'].get('executor_workers', 8)
+        self._loop = None
+        self._async_server = None
+        
+        # Micro-lotes: agrupa classificações concorrentes em uma única predição
+        batching = self.config['service'].get('batching') or {}
+        self.batcher = None
+        if batching.get('enabled', False):
+            self.batcher = BatchingClassifier(
+                self.classifier,
+                max_batch_size=batching.get('max_batch_size', 32),
+                max_wait_ms=batching.get('max_wait_ms', 2.0)
+            )
+            logger.info(f"Micro-lotes habilitados (até {self.batcher.max_batch_size} imagens, "
+                        f"espera máxima de {batching.get('max_wait_ms', 2.0)}ms)")
+        self.predictor = self.batcher or self.classifier
+        
+        # Pool de processos para decodificação + classificação (criado após o treinamento)
+        self.process_pool_config = self.config['service'].get('process_pool') or {}
+        self.worker_pool = None
+        if self.process_pool_config.get('enabled', False) and self.batcher:
+            logger.warning("Micro-lotes não são usados com o pool de processos; a classificação ocorre nos workers")
+        
+        # Próximo estágio do pipeline: se configurado, este serviço pré-processa a
+        # imagem e encaminha o tensor aos serviços do próximo load balancer
+        next_hop = self.config['service'].get('next_hop') or []
+        self.next_lb = None
+        if next_hop:
+            self.next_lb = LoadBalancerProxy(next_hop, pool=ConnectionPool(
+                max_per_target=self.config['service'].get('forward_pool_size', 8)
+            ), algorithm=self.config['service'].get('forward_algorithm', 'round-robin'))
+        self.stage = 's1' if self.next_lb else 's2'
+        
+        # Controle de admissão: limite de requisições em processamento e fila de
+        # espera limitada; o excedente recebe uma recusa rápida ('overloaded')
+        admission = self.config['service'].get('admission') or {}
+        self.admission = None
+        if admission.get('enabled', False):
+            self.admission = AdmissionController(
+                max_in_flight=admission.get('max_in_flight', 16),
+                max_queue=admission.get('max_queue', 64),
+                queue_timeout_ms=admission.get('queue_timeout_ms', 1000)
+            )
+            logger.info(f"Controle de admissão habilitado ({self.admission.max_in_flight} em processamento, "
+                        f"fila de {self.admission.max_queue})")
+        # Conexões simultâneas no modo threaded (uma thread cada); 0 = sem limite
+        self.max_connections = self.config['service'].get('max_connections', 0)
+        self._connections_lock = threading.Lock()
+        self.active_connections = 0
+        self.rejected_connections = 0
+        
+        # Cache de resultados por hash do conteúdo: imagens repetidas não são
+        # decodificadas nem classificadas (nem encaminhadas, no estágio S1)
+        result_cache = self.config['service'].get('result_cache') or {}
+        self.result_cache = None
+        if result_cache.get('enabled', False):
+            self.result_cache = ResultCache(
+                max_entries=result_cache.get('max_entries', 4096),
+                ttl_seconds=result_cache.get('ttl_seconds', 300)
+            )
+            if not self.next_lb:
+                # No estágio final a versão é a do modelo local; no S1, as dos serviços do próximo estágio
+                self.result_cache.set_model_versions([self.classifier.model_key[:16]])
+            logger.info(f"Cache de resultados habilitado ({self.result_cache.max_entries} entradas, "
+                        f"TTL de {self.result_cache.ttl}s)")
+        # S1: intervalo da verificação (em segundo plano) das versões do modelo no próximo estágio
+        self.version_check_interval = result_cache.get('version_check_seconds', 1.0)
+        self._stop_version_checks = threading.Event()
         
         logger.info(f"Serviço inicializado em {self.host}:{self.port}")
+        if self.next_lb:
+            logger.info(f"Encaminhando para o próximo estágio: {', '.join(next_hop)}")
     
     def start(self):
         """Inicia o servidor."""
+        # O modelo já foi carregado (ou treinado, se as imagens mudaram) na inicialização
+        logger.info(f"Modelo pronto (versão {self.classifier.model_key[:16]})")
+        
+        if self.result_cache and self.next_lb and self.version_check_interval > 0:
+            threading.Thread(target=self._run_version_checks, name='version-checks', daemon=True).start()
+        
+        if self.process_pool_config.get('enabled', False):
+            self.worker_pool = ProcessWorkerPool(
+                self.classifier.artifact_path,
+                size=self.process_pool_config.get('size', 0),
+                start_method=self.process_pool_config.get('start_method', 'spawn')
+            )
+        
+        if self.server_mode == 'asyncio':
+            asyncio.run(self._serve_asyncio())
+        else:
+            self._serve_threaded()
+    
+    def _serve_threaded(self):
+        """Servidor com uma thread por conexão."""
         try:
-            # Inicia o treinamento do modelo primeiro
-            logger.info("Iniciando treinamento do modelo...")
-            try:
-                self.classifier._train_model()
-                logger.info("Treinamento do modelo concluído com sucesso")
-            except Exception as e:
-                logger.error(f"Erro durante o treinamento do modelo: {str(e)}")
-                raise
-            
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket.listen(self.backlog)
             self.port = self.server_socket.getsockname()[1]  # Obtém a porta real se foi especificado 0
-            logger.info(f"Servidor iniciado em {self.host}:{self.port}")
+            self.name = self.name or f"{socket.gethostname()}:{self.port}"
+            logger.info(f"Servidor iniciado em {self.host}:{self.port} (threaded, backlog {self.backlog})")
+            self.running = True
             
             while True:
                 try:
                     client_socket, address = self.server_socket.accept()
+                    if not self._admit_connection(client_socket, address):
+                        continue
                     logger.info(f"Conexão aceita de {address}")
                     client_thread = threading.Thread(
                         target=self._handle_client,
@@ -225,87 +348,313 @@ class Service:
             logger.error(f"Erro ao iniciar servidor: {str(e)}")
             raise
         finally:
-            if hasattr(self, 'server_socket'):
+            if self.server_socket:
                 self.server_socket.close()
                 logger.info("Servidor encerrado")
     
-    def _handle_client(self, client_socket: socket.socket, address: Tuple[str, int]):
-        """Manipula a conexão com um cliente."""
+    def _admit_connection(self, client_socket: socket.socket, address: Tuple[str, int]) -> bool:
+        """Aceita a conexão ou, acima de max_connections, responde 'overloaded' e a fecha."""
+        with self._connections_lock:
+            if not self.max_connections or self.active_connections < self.max_connections:
+                self.active_connections += 1
+                return True
+            self.rejected_connections += 1
+        logger.warning(f"Conexão de {address} recusada: limite de {self.max_connections} conexões atingido")
         try:
-            logger.info(f"Processando requisição de {address}")
-            
-            # Recebe o tamanho da imagem
-            size_data = client_socket.recv(8)
-            if not size_data:
-                logger.error("Nenhum dado recebido do cliente")
-                return
-            
-            size = int.from_bytes(size_data, 'big')
-            logger.info(f"Tamanho da imagem recebida: {size} bytes")
+            send_frame(client_socket, json.dumps(overloaded_response([], 'limite de conexões do serviço')).encode())
+        except OSError:
+            pass
+        client_socket.close()
+        return False
+    
+    async def _serve_asyncio(self):
+        """
+        Servidor baseado em event loop (asyncio).
+
+        O loop cuida apenas da aceitação e da leitura/escrita das mensagens; a
+        classificação (CPU) e o encaminhamento (bloqueante) rodam no executor.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.executor_workers, thread_name_prefix='service')
+        try:
+            self._async_server = await asyncio.start_server(
+                self._handle_client_async, self.host, self.port,
+                backlog=self.backlog, reuse_address=True
+            )
+            self.port = self._async_server.sockets[0].getsockname()[1]
+            self.name = self.name or f"{socket.gethostname()}:{self.port}"
+            logger.info(f"Servidor iniciado em {self.host}:{self.port} "
+                        f"(asyncio, backlog {self.backlog}, {self.executor_workers} workers)")
+            self.running = True
             
-            # Recebe a imagem
-            image_data = b''
-            bytes_received = 0
-            while bytes_received < size:
-                chunk = client_socket.recv(min(size - bytes_received, 8192))
-                if not chunk:
+            async with self._async_server:
+                await self._async_server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Erro ao iniciar servidor: {str(e)}")
+            raise
+        finally:
+            self._executor.shutdown(wait=False)
+            logger.info("Servidor encerrado")
+    
+    async def _handle_client_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Versão assíncrona de _handle_client, com o mesmo protocolo."""
+        address = writer.get_extra_info('peername')
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        logger.info(f"Conexão aceita de {address}")
+        requests_served = 0
+        try:
+            while self.running:
+                # Recebe a próxima imagem; None indica que o cliente encerrou a conexão
+                try:
+                    image_data = await asyncio.wait_for(read_frame(reader), timeout=self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"Conexão com {address} ociosa por {self.keepalive_timeout}s")
+                    break
+                if image_data is None:
                     break
-                image_data += chunk
-                bytes_received += len(chunk)
+                
+                requests_served += 1
+                logger.info(f"Processando requisição {requests_served} de {address} ({len(image_data)} bytes)")
+                
+                header, body = decode_request(image_data)
+                reservation = None
+                if self.admission and header.get('type') != 'stats':
+                    # A admissão é decidida no loop: o excedente é recusado aqui em vez de
+                    # acumular na fila (sem limite) do executor
+                    reservation = self.admission.reserve()
+                    if reservation is None:
+                        stamp(header, f'{self.stage}_recv')
+                        stamp(header, f'{self.stage}_reply')
+                        writer.write(encode_frame(json.dumps(overloaded_response(
+                            header.get('stamps', []), f'{self.name} no limite de admissão')).encode()))
+                        await writer.drain()
+                        continue
+                response_data = await self._loop.run_in_executor(
+                    self._executor, self._handle_request, header, body, reservation)
+                writer.write(encode_frame(response_data))
+                await writer.drain()
+        except Exception as e:
+            logger.error(f"Erro na conexão com {address}: {str(e)}")
+        finally:
+            writer.close()
+            logger.info(f"Conexão com {address} fechada ({requests_served} requisições)")
+    
+    def _handle_client(self, client_socket: socket.socket, address: Tuple[str, int]):
+        """Manipula a conexão persistente com um cliente (várias requisições por conexão)."""
+        requests_served = 0
+        try:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_socket.settimeout(self.keepalive_timeout)
+            # Buffer reaproveitado entre as requisições da conexão (processadas uma por vez)
+            receiver = FrameReceiver(client_socket)
             
-            logger.info(f"Imagem recebida completamente: {len(image_data)} bytes")
+            while self.running:
+                # Recebe a próxima imagem; None indica que o cliente encerrou a conexão
+                try:
+                    image_data = receiver.recv()
+                except socket.timeout:
+                    logger.info(f"Conexão com {address} ociosa por {self.keepalive_timeout}s")
+                    break
+                if image_data is None:
+                    break
+                
+                requests_served += 1
+                logger.info(f"Processando requisição {requests_served} de {address} ({len(image_data)} bytes)")
+                
+                response_data = self._process_request(image_data)
+                logger.info(f"Enviando resposta de {len(response_data)} bytes")
+                send_frame(client_socket, response_data)
+                logger.info("Resposta enviada com sucesso")
             
+        except Exception as e:
+            logger.error(f"Erro na conexão com {address}: {str(e)}")
+        finally:
+            client_socket.close()
+            with self._connections_lock:
+                self.active_connections -= 1
+            logger.info(f"Conexão com {address} fechada ({requests_served} requisições)")
+    
+    def _process_request(self, payload: memoryview) -> bytes:
+        """Processa uma requisição e retorna a resposta serializada (sucesso ou erro)."""
+        header, body = decode_request(payload)
+        return self._handle_request(header, body)
+    
+    def _handle_request(self, header: Dict[str, Any], body: memoryview, reservation: Optional[float] = None) -> bytes:
+        """
+        Processa uma requisição já decodificada. `reservation` é a reserva de
+        admissão feita pelo event loop (modo asyncio); sem ela a admissão é
+        pedida aqui, esperando na fila se preciso.
+        """
+        if header.get('type') == 'stats':
+            return json.dumps(self.stats()).encode()
+        stamp(header, f'{self.stage}_recv')
+        # Formato de resposta negociado pelo cliente (o cabeçalho segue adiante com o formato deste serviço)
+        response_format = header.get('accept', RESPONSE_JSON)
+        
+        if self.admission and not (self.admission.acquire() if reservation is None
+                                   else self.admission.acquire_reserved(reservation)):
+            stamp(header, f'{self.stage}_reply')
+            return json.dumps(overloaded_response(header['stamps'], f'{self.name} no limite de admissão')).encode()
+        try:
+            return self._admitted_request(header, body, response_format)
+        finally:
+            if self.admission:
+                self.admission.release()
+    
+    def _admitted_request(self, header: Dict[str, Any], body: memoryview, response_format: str) -> bytes:
+        """Processa uma requisição admitida e serializa a resposta no formato pedido."""
+        cache_key = cached = None
+        if self.result_cache:
+            cache_key = ResultCache.key(body, header.get('payload'))
+            cached = self.result_cache.get(cache_key)
+        
+        if cached:
+            response = self._cached_response(header, cached)
+        elif self.next_lb:
+            response = self._forward(header, body)
+        else:
+            response = self._classify(header, body)
+        
+        if cache_key and not cached and response.get('status') == 'success':
+            if self.next_lb:
+                self.result_cache.add_model_version(response.get('model_version'))
+            self.result_cache.put(cache_key, response['class'], response['confidence'], response.get('model_version'))
+        
+        response['request_id'] = header.get('request_id')
+        response['route'] = [self.name] + response.get('route', [])
+        stamp(response, f'{self.stage}_reply')
+        return encode_response(response, response_format)
+    
+    def _features(self, header: Dict[str, Any], body: memoryview) -> np.ndarray:
+        """Obtém o vetor de características a partir de uma imagem ou de um tensor."""
+        if header.get('payload') == PAYLOAD_TENSOR:
+            return self.classifier.features_from_tensor(body)
+        return self.classifier.preprocess(body)
+    
+    def _classify(self, header: Dict[str, Any], body: memoryview) -> Dict[str, Any]:
+        """Estágio final: classifica a imagem (uma única vez por requisição)."""
+        try:
             # Classifica a imagem
-            start_time = time.time()
-            class_name, confidence = self.classifier.classify_image(image_data)
-            processing_time = time.time() - start_time
+            start_time = stamp(header, f'{self.stage}_process_start')
+            if self.worker_pool:
+                class_name, confidence = self.worker_pool.classify(header.get('payload'), body)
+            else:
+                class_name, confidence = self.predictor.classify_features(self._features(header, body))
+            processing_time = stamp(header, f'{self.stage}_process_end') - start_time
             
             logger.info(f"Classificação: {class_name} (Confiança: {confidence:.2f})")
             logger.info(f"Tempo de processamento: {processing_time:.3f}s")
             
             # Prepara a resposta
-            response = {
+            return {
                 "status": "success",
                 "class": class_name,
                 "confidence": float(confidence),
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "model_version": self.classifier.model_key[:16],
+                "stamps": header['stamps']
             }
+        except Exception as e:
+            logger.error(f"Erro ao processar requisição: {str(e)}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "stamps": header['stamps']
+            }
+    
+    def _run_version_checks(self):
+        """
+        S1: consulta periodicamente (requisição 'stats') a versão do modelo de
+        cada serviço do próximo estágio. As versões que nenhum serviço usa mais
+        deixam de ser servidas pelo cache; a verificação fica fora do caminho
+        das requisições.
+        """
+        while not self._stop_version_checks.wait(self.version_check_interval):
+            versions = []
+            for target in self.next_lb.services:
+                try:
+                    reply = self.next_lb.pool.request(target, encode_request(b'', {'type': 'stats'}))
+                    versions.append(json.loads(bytes(reply))['model']['key'][:16])
+                except Exception as e:
+                    logger.debug(f"Não foi possível consultar a versão do modelo em {target}: {str(e)}")
+            if not versions:
+                continue  # Nenhuma resposta: mantém as versões conhecidas
+            if set(versions) != set(self.result_cache.model_versions):
+                logger.info(f"Versões do modelo no próximo estágio: {', '.join(sorted(set(versions)))}")
+            self.result_cache.set_model_versions(versions)
+    
+    def _cached_response(self, header: Dict[str, Any], cached: Tuple[str, float, str]) -> Dict[str, Any]:
+        """Resposta a partir do cache de resultados (sem decodificar, encaminhar ou classificar)."""
+        class_name, confidence, model_version = cached
+        start_time = stamp(header, f'{self.stage}_process_start')
+        processing_time = stamp(header, f'{self.stage}_process_end') - start_time
+        logger.info(f"Classificação (cache): {class_name} (Confiança: {confidence:.2f})")
+        return {
+            "status": "success",
+            "class": class_name,
+            "confidence": confidence,
+            "processing_time": processing_time,
+            "model_version": model_version,
+            "cached": True,
+            "stamps": header['stamps']
+        }
+    
+    def _forward(self, header: Dict[str, Any], body: memoryview) -> Dict[str, Any]:
+        """Estágio intermediário: pré-processa a imagem e encaminha o tensor ao próximo estágio."""
+        try:
+            if self.worker_pool:
+                tensor = self.worker_pool.preprocess(header.get('payload'), body)
+            else:
+                tensor = self._features(header, body).tobytes()
+            header['payload'] = PAYLOAD_TENSOR
+            header['accept'] = RESPONSE_BINARY
             
-            # Envia a resposta
-            response_data = json.dumps(response).encode()
-            response_size = len(response_data)
-            logger.info(f"Enviando resposta de {response_size} bytes")
-            
-            # Envia o tamanho da resposta primeiro
-            size_bytes = response_size.to_bytes(8, 'big')
-            client_socket.sendall(size_bytes)
-            
-            # Envia a resposta
-            client_socket.sendall(response_data)
-            logger.info("Resposta enviada com sucesso")
+            stamp(header, f'{self.stage}_forward')
+            target, reply = self.next_lb.forward(encode_request(tensor, header))
             
+            response = decode_response(reply)
+            stamp(response, f'{self.stage}_reply_recv')
+            return response
         except Exception as e:
-            logger.error(f"Erro ao processar requisição: {str(e)}")
-            try:
-                # Tenta enviar uma mensagem de erro
-                error_response = {
-                    "status": "error",
-                    "error": str(e)
-                }
-                error_data = json.dumps(error_response).encode()
-                error_size = len(error_data)
-                size_bytes = error_size.to_bytes(8, 'big')
-                client_socket.sendall(size_bytes)
-                client_socket.sendall(error_data)
-            except:
-                pass
-        finally:
-            client_socket.close()
-            logger.info(f"Conexão com {address} fechada")
+            logger.error(f"Erro ao encaminhar requisição para o próximo estágio: {str(e)}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "stamps": header['stamps']
+            }
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas do serviço, consultadas com uma requisição do tipo 'stats'."""
+        stats = {'status': 'success', 'service': self.name, 'server': self.server_mode,
+                 'model': {'key': self.classifier.model_key, 'loaded_models': loaded_models()}}
+        if self.batcher:
+            stats['batching'] = self.batcher.stats()
+        if self.admission:
+            stats['admission'] = self.admission.stats()
+        if self.max_connections:
+            with self._connections_lock:
+                stats['connections'] = {'active': self.active_connections, 'max': self.max_connections,
+                                        'rejected': self.rejected_connections}
+        if self.result_cache:
+            stats['result_cache'] = self.result_cache.stats()
+        if self.worker_pool:
+            stats['process_pool'] = {'size': self.worker_pool.size, 'start_method': self.worker_pool.start_method}
+        return stats
     
     def stop(self):
         """Para o servidor do serviço."""
         self.running = False
+        self._stop_version_checks.set()
         if self.server_socket:
             self.server_socket.close()
+        if self._async_server:
+            self._loop.call_soon_threadsafe(self._async_server.close)
+        if self.next_lb:
+            self.next_lb.close()
+        if self.worker_pool:
+            self.worker_pool.shutdown()
         logger.info("Serviço finalizado") 
\ No newline at end of file
@@ -1,11 +1,21 @@
 import time
 import yaml
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import matplotlib.pyplot as plt
 import numpy as np
 from .load_balancer_proxy import LoadBalancerProxy
 from .service_proxy import ServiceProxy
 from .network_manager import NetworkManager
+from .connection_pool import ConnectionPool
+from .protocol import (encode_request, decode_response, stamp, stamp_times, OverloadedError, OVERLOADED,
+                       PAYLOAD_IMAGE, PAYLOAD_TENSOR, RESPONSE_JSON, RESPONSE_BINARY)
+from .preprocessing import IMAGE_SIZE, decode_features
+from .load_generator import OpenLoopGenerator, LoadReport, ARRIVAL_PROCESSES
+from .latency_histogram import PERCENTILES
+from .measurement import (MeasurementController, STOP_DURATION, STOP_MAX_MESSAGES, STOP_STOPPED,
+                          STOP_TIME_BUDGET)
+from .metrics_store import LatencyRecorder
+from .results_log import ResultsLog, new_run_id, results_path
 import logging
 from datetime import datetime
 import threading
@@ -13,6 +23,7 @@ import json
 import socket
 import cv2
 import os
+import random
 import sys
 
 # Configuração do logging para exibir logs em tempo real
@@ -32,14 +43,64 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.propagate = False
 
+# Etapas medidas em cada requisição e seus nomes no resumo
+METRIC_STAGES = {
+    't1_source_lb1': 'T1 (Source -> LB1)',
+    't2_lb1_service': 'T2 (Pré-processamento Serviço S1)',
+    't3_service_lb2': 'T3 (Serviço S1 -> LB2 -> Serviço S2)',
+    't4_lb2_service': 'T4 (Espera Serviço S2)',
+    't_processamento': 'T5 (Processamento Serviço S2)',
+    't5_service_source': 'T6 (Serviço S2 -> Source)',
+    't5_total': 'MRT (Tempo Total)',
+    't5_total_corrigido': 'MRT Corrigido',
+    'average_intermediate': 'Média dos Tempos Intermediários'
+}
+
 class Source:
     def __init__(self, config_path: str):
         with open(config_path, 'r') as f:
             self.config = yaml.safe_load(f)
         
+        # O número de serviços de cada LB pode vir do ambiente (docker-compose / run_experiments)
+        for lb_id in (1, 2):
+            self._apply_service_count(lb_id)
+        
         self.request_rate = self.config['source']['request_rate']
         self.target = self.config['source']['target']
-        self.metrics_history: List[Dict[str, float]] = []
+        # Latências por etapa em histogramas de memória fixa; as amostras de cada
+        # requisição só são guardadas com metrics.keep_raw (necessárias ao gráfico por requisição)
+        metrics_config = self.config['source'].get('metrics', {})
+        self.latencies = LatencyRecorder(
+            METRIC_STAGES,
+            significant_digits=metrics_config.get('significant_digits', 2),
+            keep_raw=metrics_config.get('keep_raw', False),
+            targets=('lb1_service', 'lb2_service')
+        )
+        
+        # Registro das requisições em JSON-lines no volume de gráficos (lido pelo run_experiments.py);
+        # RUN_ID vem do orquestrador para que ele saiba qual arquivo ler
+        results_config = self.config['source'].get('results', {})
+        self.run_id = os.getenv('RUN_ID') or new_run_id()
+        self.results_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                        results_config.get('directory', os.path.join('graphs', 'results')))
+        self.results_enabled = results_config.get('enabled', True)
+        self.results: Optional[ResultsLog] = None
+        self.running = False
+        
+        # Configuração do gerador de carga (malha aberta ou fechada)
+        self.load_config = self.config['source'].get('load', {})
+        self.load_mode = self.load_config.get('mode', 'closed')
+        self.arrival = self.load_config.get('arrival', 'constant')
+        if self.load_mode not in ('open', 'closed'):
+            raise ValueError(f"Modo de carga desconhecido: {self.load_mode} (use open ou closed)")
+        if self.arrival not in ARRIVAL_PROCESSES:
+            raise ValueError(f"Processo de chegada desconhecido: {self.arrival}")
+        self.load_report: Optional[LoadReport] = None
+        
+        # Duração da execução: descarta o aquecimento e, no modo adaptativo, para quando
+        # os intervalos de confiança da média e do p99 do MRT convergem (ou o tempo acaba)
+        self.measurement_config = self.config['source'].get('measurement', {})
+        self.measurement = MeasurementController.from_config(self.measurement_config)
         
         # Configuração de rede
         self.network_manager = NetworkManager(
@@ -47,15 +108,37 @@ class Source:
             port=self.config['source'].get('port', 0)
         )
         
-        # Inicializa os LoadBalancers
-        self.lb1 = LoadBalancerProxy(self.config['loadbalancer1']['services'])
-        self.lb2 = LoadBalancerProxy(self.config['loadbalancer2']['services'])
+        # Inicializa o LoadBalancer de entrada com seu pool de conexões persistentes;
+        # a escolha do serviço atrás do LB2 é feita pelo serviço S1 (ou pelo processo do LB2)
+        lb1_config = self.config['loadbalancer1']
+        if lb1_config.get('standalone', False):
+            # LB1 em processo próprio (start_load_balancer.py): a Source envia tudo a ele
+            lb1_address = f"{os.getenv('LB1_HOST', lb1_config['host'])}:{os.getenv('LB1_PORT', lb1_config['port'])}"
+            self.lb1 = LoadBalancerProxy([lb1_address], pool=self._create_pool(), algorithm='round-robin')
+        else:
+            self.lb1 = LoadBalancerProxy(lb1_config['services'], pool=self._create_pool(),
+                                         algorithm=lb1_config.get('algorithm', 'round-robin'))
+        
+        # Formato enviado aos serviços: 'image' (JPEG) ou 'tensor' (64x64 já pré-processado pela Source)
+        self.payload = self.config['source'].get('payload', PAYLOAD_IMAGE)
+        if self.payload not in (PAYLOAD_IMAGE, PAYLOAD_TENSOR):
+            raise ValueError(f"Tipo de payload desconhecido: {self.payload} (use {PAYLOAD_IMAGE} ou {PAYLOAD_TENSOR})")
+        
+        # Formato das respostas pedido aos serviços: 'binary' (estrutura compacta) ou 'json'
+        self.response_format = self.config['source'].get('response_format', RESPONSE_JSON)
+        if self.response_format not in (RESPONSE_JSON, RESPONSE_BINARY):
+            raise ValueError(f"Formato de resposta desconhecido: {self.response_format} (use {RESPONSE_JSON} ou {RESPONSE_BINARY})")
         
         # Carrega imagens de teste
         self.test_images = self._load_test_images()
+        if self.payload == PAYLOAD_TENSOR:
+            # Pré-processa uma única vez; os serviços não precisam decodificar
+            self.test_images = [decode_features(img_data).tobytes() for img_data in self.test_images]
+            logger.info(f"Imagens de teste enviadas como tensores {IMAGE_SIZE}x{IMAGE_SIZE}")
         
         logger.info("=== Inicialização do Sistema ===")
-        logger.info(f"Source (Nó 01) configurado com taxa de {self.request_rate} req/s")
+        logger.info(f"Source (Nó 01) configurado com taxa de {self.request_rate} req/s "
+                    f"(malha {self.load_mode}, chegadas {self.arrival})")
         logger.info("LoadBalancer1 (Nó 02) configurado com serviços:")
         for service in self.config['loadbalancer1']['services']:
             logger.info(f"  - {service}")
@@ -64,6 +147,29 @@ class Source:
             logger.info(f"  - {service}")
         logger.info("===============================")
 
+    def _apply_service_count(self, lb_id: int):
+        """
+        Ajusta a lista de serviços do LB a partir de NUM_SERVICES_LB{n} e BASE_PORT_LB{n}, se definidos
+        (SERVICES_HOST troca o host, como na execução local sem Docker).
+        """
+        count = os.getenv(f'NUM_SERVICES_LB{lb_id}')
+        if count is None:
+            return
+        lb_config = self.config[f'loadbalancer{lb_id}']
+        host, port = lb_config['services'][0].split(':')
+        host = os.getenv('SERVICES_HOST', host)
+        base_port = int(os.getenv(f'BASE_PORT_LB{lb_id}', port))
+        lb_config['services'] = [f"{host}:{base_port + i}" for i in range(int(count))]
+
+    def _create_pool(self) -> ConnectionPool:
+        """Cria um pool de conexões a partir de source.connection."""
+        connection = self.config['source'].get('connection', {})
+        return ConnectionPool(
+            max_per_target=connection.get('pool_size', 8),
+            timeout=connection.get('timeout', 10),
+            retry_attempts=connection.get('retry_attempts', 3)
+        )
+
     def _load_test_images(self) -> List[bytes]:
         """Carrega imagens de teste do diretório data/test."""
         test_images = []
@@ -186,77 +292,119 @@ class Source:
         except Exception as e:
             logger.error(f"Erro ao processar mensagem: {str(e)}")
 
-    def run_experiment(self, duration: int = 30):
-        """Executa o experimento por um determinado tempo."""
+    def run_experiment(self, duration: Optional[float] = None):
+        """
+        Executa o experimento. No modo adaptativo `duration` é o orçamento de tempo
+        (measurement.time_budget) e a execução termina antes se as medidas convergirem;
+        no modo fixo roda por `duration` segundos (measurement.duration) ou max_messages.
+        """
         if not self.test_images:
             logger.error("Nenhuma imagem de teste disponível. Adicione imagens em data/test/")
             return
-            
+        
+        if self.measurement.adaptive:
+            duration = duration or self.measurement.time_budget
+            # O limite passa a ser o número de amostras medidas (measurement.max_samples)
+            max_messages = sys.maxsize
+            mode = f"até {duration:g}s, adaptativo"
+        else:
+            duration = duration or self.measurement_config.get('duration', 30)
+            max_messages = self.config['source'].get('max_messages', 100)
+            mode = f"{duration:g}s"
+        self.running = True  # Flag para controlar o estado do experimento
+        
+        logger.info(f"\n=== Iniciando Experimento ({mode}, aquecimento {self.measurement.warmup}, "
+                    f"malha {self.load_mode}, chegadas {self.arrival}) ===")
+        if self.results_enabled:
+            self.results = ResultsLog(results_path(self.results_dir, self.run_id), self.run_id)
+            self.results.start({
+                'request_rate': self.request_rate,
+                'duration': duration,
+                'max_messages': None if self.measurement.adaptive else max_messages,
+                'measurement': self.measurement_config,
+                'load_mode': self.load_mode,
+                'arrival': self.arrival,
+                'payload': self.payload,
+                'lb1_services': len(self.config['loadbalancer1']['services']),
+                'lb2_services': len(self.config['loadbalancer2']['services'])
+            })
+            logger.info(f"Resultados da execução {self.run_id} em {self.results.path}")
+        
+        self.measurement.start()
+        if self.load_mode == 'open':
+            # Malha aberta: dispara no cronograma, sem esperar as respostas
+            generator = OpenLoopGenerator(
+                rate=self.request_rate,
+                arrival=self.arrival,
+                max_workers=self.load_config.get('max_outstanding', 256),
+                seed=self.load_config.get('seed')
+            )
+            self.load_report = generator.run(
+                self._execute_request,
+                duration=duration,
+                max_requests=max_messages,
+                should_continue=lambda: self.running and not self.measurement.done
+            )
+            request_count = self.load_report.dispatched
+        else:
+            request_count = self._run_closed_loop(duration, max_messages)
+        # Motivo do fim da carga (a medição mantém o seu se já tinha convergido ou atingido max_samples)
+        if not self.running:
+            reason = STOP_STOPPED
+        elif request_count >= max_messages:
+            reason = STOP_MAX_MESSAGES
+        else:
+            reason = STOP_TIME_BUDGET if self.measurement.adaptive else STOP_DURATION
+        self.measurement.finish(reason)
+        
+        logger.info(f"\n=== Experimento Concluído ===")
+        logger.info(f"Total de requisições: {request_count}")
+        self._print_summary()
+        self._finish_results(request_count)
+        self.generate_graphs()
+    
+    def _finish_results(self, request_count: int):
+        """Escreve o registro de fim da execução (com o resumo) e fecha o arquivo de resultados."""
+        if not self.results:
+            return
+        report = self.load_report
+        self.results.end({
+            'requests': request_count,
+            'completed': report.completed if report else self.latencies.count,
+            'errors': report.errors if report else 0,
+            'rejected': report.rejected if report else 0,
+            'offered_rate': report.offered_rate if report else None,
+            'throughput': report.throughput if report else None,
+            'measurement': self.measurement.summary(),
+            'stages': self.latencies.summary()
+        })
+        self.results.close()
+
+    def _run_closed_loop(self, duration: int, max_messages: int) -> int:
+        """Malha fechada: cada envio aguarda a resposta anterior e o intervalo da taxa."""
         start_time = time.time()
         end_time = start_time + duration
+        report = LoadReport(target_rate=self.request_rate)
         request_count = 0
-        self.running = True  # Flag para controlar o estado do experimento
-        
-        logger.info(f"\n=== Iniciando Experimento ({duration}s) ===")
         
-        while time.time() < end_time and self.running:
+        while time.time() < end_time and self.running and not self.measurement.done:
             # Verifica se atingiu o limite máximo de mensagens
-            if request_count >= self.config['source']['max_messages']:
-                logger.info(f"Limite máximo de {self.config['source']['max_messages']} mensagens atingido")
+            if request_count >= max_messages:
+                logger.info(f"Limite máximo de {max_messages} mensagens atingido")
                 break
                 
             request_count += 1
-            # Seleciona uma imagem aleatória
-            image_data = np.random.choice(self.test_images)
-            
-            # Registra o tempo inicial
-            t1_start = time.time()
+            # Instante em que a requisição deveria sair se a taxa configurada fosse respeitada
+            intended_time = start_time + (request_count - 1) / self.request_rate
+            report.dispatched += 1
             
             try:
-                # Envia a requisição
-                response = self.send_request(image_data, request_count)
-                
-                # Registra os tempos
-                metrics = {
-                    "t1_source_lb1": response.get("t1", 0),
-                    "t2_lb1_service": response.get("t2", 0),
-                    "t3_service_lb2": response.get("t3", 0),
-                    "t4_lb2_service": response.get("t4", 0),
-                    "t_processamento": response.get("t5", 0),
-                    "t5_service_source": response.get("t6", 0),
-                    "t5_total": response.get("mrt", 0),
-                    "average_intermediate": response.get("mrt", 0) / 6.0
-                }
-                
-                self.metrics_history.append(metrics)
-                
-                # Log do fluxo da requisição
-                logger.info(f"---> Fluxo Req {request_count}:")
-                logger.info(f"     Nó 01 (Source) -> Nó 02 (LB1) [{metrics['t1_source_lb1']:.3f}s]")
-                logger.info(f"     Nó 02 (LB1) -> Serviço (escolhido: {response.get('lb1_service', 'unknown')}) [{metrics['t2_lb1_service']:.3f}s]")
-                logger.info(f"     Serviço ({response.get('lb1_service', 'unknown')}) -> Nó 03 (LB2) [{metrics['t3_service_lb2']:.3f}s]")
-                logger.info(f"     Nó 03 (LB2) -> Serviço (escolhido: {response.get('lb2_service', 'unknown')}) [{metrics['t4_lb2_service']:.3f}s]")
-                logger.info(f"     Serviço ({response.get('lb2_service', 'unknown')}) Processamento [{metrics['t_processamento']:.3f}s]")
-                logger.info(f"     Serviço ({response.get('lb2_service', 'unknown')}) -> Nó 01 (Source) [{metrics['t5_service_source']:.3f}s]")
-                logger.info("<---")
-                logger.info(f"     Média dos Tempos Intermediários: {metrics['average_intermediate']:.3f}s")
-                logger.info("")
-                
-                # Log do resumo da requisição
-                logger.info(f"=== Resumo da Requisição {request_count} ===")
-                logger.info("Tempos:")
-                logger.info(f"  T1 (Source -> LB1): {metrics['t1_source_lb1']:.3f}s")
-                logger.info(f"  T2 (LB1 -> Serviço): {metrics['t2_lb1_service']:.3f}s")
-                logger.info(f"  T3 (Serviço S1 -> LB2): {metrics['t3_service_lb2']:.3f}s")
-                logger.info(f"  T4 (LB2 -> Serviço): {metrics['t4_lb2_service']:.3f}s")
-                logger.info(f"  T5 (Processamento Serviço): {metrics['t_processamento']:.3f}s")
-                logger.info(f"  T5 (Serviço S2 -> Source): {metrics['t5_service_source']:.3f}s")
-                logger.info(f"  T5 (Tempo Total): {metrics['t5_total']:.3f}s")
-                logger.info(f"  Média dos Tempos Intermediários: {metrics['average_intermediate']:.3f}s")
-                logger.info("=============================")
-                
+                self._execute_request(request_count, intended_time)
+                report.completed += 1
+            except OverloadedError:
+                report.rejected += 1
             except Exception as e:
-                logger.error(f"Erro na requisição {request_count}: {str(e)}")
+                report.errors += 1
                 if not self.running:  # Se o erro ocorreu porque o serviço está parando
                     break
             
@@ -264,157 +412,124 @@ class Source:
             if self.running:  # Só aguarda se ainda estiver rodando
                 time.sleep(1.0 / self.request_rate)
         
-        logger.info(f"\n=== Experimento Concluído ===")
-        logger.info(f"Total de requisições: {request_count}")
-        self._print_summary()
-        self.generate_graphs()
+        report.elapsed = report.total_elapsed = time.time() - start_time
+        self.load_report = report
+        return request_count
 
-    def send_request(self, image_data: bytes, request_num: int) -> Dict[str, Any]:
+    def _execute_request(self, request_count: int, intended_time: float) -> Dict[str, float]:
+        """Envia uma requisição, registra suas métricas e retorna-as."""
+        # Seleciona uma imagem aleatória
+        image_data = self.test_images[random.randrange(len(self.test_images))]
+        
         try:
-            # Seleciona serviços baseado em disponibilidade
-            lb1_service = self.lb1.get_available_service()
-            if not lb1_service:
-                raise Exception("Nenhum serviço disponível no LB1")
-                
-            lb2_service = self.lb2.get_available_service()
-            if not lb2_service:
-                raise Exception("Nenhum serviço disponível no LB2")
+            # Envia a requisição
+            response = self.send_request(image_data, request_count)
+            completed_at = time.time()
             
-            logger.info(f"Request {request_num}: Usando serviços {lb1_service} -> {lb2_service}")
+            # Registra os tempos
+            metrics = {
+                "t1_source_lb1": response.get("t1", 0),
+                "t2_lb1_service": response.get("t2", 0),
+                "t3_service_lb2": response.get("t3", 0),
+                "t4_lb2_service": response.get("t4", 0),
+                "t_processamento": response.get("t5", 0),
+                "t5_service_source": response.get("t6", 0),
+                "t5_total": response.get("mrt", 0),
+                "average_intermediate": response.get("mrt", 0) / 6.0,
+                # Latência medida a partir do instante planejado (corrige a omissão coordenada)
+                "t5_total_corrigido": completed_at - intended_time
+            }
             
-            def try_connect(host: str, port: int, max_retries: int = 3, retry_delay: float = 1.0) -> socket.socket:
-                for attempt in range(max_retries):
-                    try:
-                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                        s.settimeout(10)
-                        s.connect((host, int(port)))
-                        return s
-                    except Exception as e:
-                        if attempt < max_retries - 1:
-                            logger.warning(f"Tentativa {attempt + 1} de {max_retries} falhou ao conectar em {host}:{port}. Aguardando {retry_delay} segundos...")
-                            time.sleep(retry_delay)
-                        else:
-                            raise Exception(f"Não foi possível conectar em {host}:{port} após {max_retries} tentativas: {str(e)}")
+            # Respostas do aquecimento ficam fora das métricas (e marcadas no arquivo de resultados)
+            measured = self.measurement.observe(metrics['t5_total'], intended_time, completed_at)
+            if measured:
+                self.latencies.record(metrics, {'lb1_service': response.get('lb1_service', 'unknown'),
+                                                'lb2_service': response.get('lb2_service', 'unknown')}, completed_at)
+            if self.results:
+                self.results.request(request_count, metrics, response.get('lb1_service', 'unknown'),
+                                     response.get('lb2_service', 'unknown'), intended_time, completed_at,
+                                     warmup=not measured)
             
-            # T1: Source -> LB1
-            start_time = time.time()
-            host, port = lb1_service.split(':')
-            with try_connect(host, port) as s:
-                # Envia o tamanho da imagem primeiro
-                size_bytes = len(image_data).to_bytes(8, 'big')
-                s.sendall(size_bytes)
-                s.sendall(image_data)
-                # Recebe o tamanho da resposta
-                size_data = s.recv(8)
-                size = int.from_bytes(size_data, 'big')
-                response = b''
-                bytes_received = 0
-                while bytes_received < size:
-                    chunk = s.recv(min(size - bytes_received, 8192))
-                    if not chunk:
-                        break
-                    response += chunk
-                    bytes_received += len(chunk)
-            t1 = time.time() - start_time
+            # Log do fluxo da requisição
+            logger.info(f"---> Fluxo Req {request_count}:")
+            logger.info(f"     Nó 01 (Source) -> Nó 02 (LB1) -> Serviço (escolhido: {response.get('lb1_service', 'unknown')}) [{metrics['t1_source_lb1']:.3f}s]")
+            logger.info(f"     Serviço ({response.get('lb1_service', 'unknown')}) Pré-processamento [{metrics['t2_lb1_service']:.3f}s]")
+            logger.info(f"     Serviço ({response.get('lb1_service', 'unknown')}) -> Nó 03 (LB2) -> Serviço (escolhido: {response.get('lb2_service', 'unknown')}) [{metrics['t3_service_lb2']:.3f}s]")
+            logger.info(f"     Serviço ({response.get('lb2_service', 'unknown')}) Espera [{metrics['t4_lb2_service']:.3f}s]")
+            logger.info(f"     Serviço ({response.get('lb2_service', 'unknown')}) Processamento [{metrics['t_processamento']:.3f}s]")
+            logger.info(f"     Serviço ({response.get('lb2_service', 'unknown')}) -> Nó 01 (Source) [{metrics['t5_service_source']:.3f}s]")
+            logger.info("<---")
+            logger.info(f"     Média dos Tempos Intermediários: {metrics['average_intermediate']:.3f}s")
+            logger.info("")
             
-            # T2: LB1 -> Serviço
-            start_time = time.time()
-            host, port = lb1_service.split(':')
-            with try_connect(host, port) as s:
-                size_bytes = len(image_data).to_bytes(8, 'big')
-                s.sendall(size_bytes)
-                s.sendall(image_data)
-                size_data = s.recv(8)
-                size = int.from_bytes(size_data, 'big')
-                response = b''
-                bytes_received = 0
-                while bytes_received < size:
-                    chunk = s.recv(min(size - bytes_received, 8192))
-                    if not chunk:
-                        break
-                    response += chunk
-                    bytes_received += len(chunk)
-            t2 = time.time() - start_time
+            # Log do resumo da requisição
+            logger.info(f"=== Resumo da Requisição {request_count} ===")
+            logger.info("Tempos:")
+            logger.info(f"  T1 (Source -> LB1): {metrics['t1_source_lb1']:.3f}s")
+            logger.info(f"  T2 (Pré-processamento Serviço S1): {metrics['t2_lb1_service']:.3f}s")
+            logger.info(f"  T3 (Serviço S1 -> LB2 -> Serviço S2): {metrics['t3_service_lb2']:.3f}s")
+            logger.info(f"  T4 (Espera Serviço S2): {metrics['t4_lb2_service']:.3f}s")
+            logger.info(f"  T5 (Processamento Serviço): {metrics['t_processamento']:.3f}s")
+            logger.info(f"  T5 (Serviço S2 -> Source): {metrics['t5_service_source']:.3f}s")
+            logger.info(f"  T5 (Tempo Total): {metrics['t5_total']:.3f}s")
+            logger.info(f"  T5 (Tempo Total Corrigido): {metrics['t5_total_corrigido']:.3f}s")
+            logger.info(f"  Média dos Tempos Intermediários: {metrics['average_intermediate']:.3f}s")
+            logger.info("=============================")
             
-            # T3: Serviço S1 -> LB2
-            start_time = time.time()
-            host, port = lb2_service.split(':')
-            with try_connect(host, port) as s:
-                size_bytes = len(image_data).to_bytes(8, 'big')
-                s.sendall(size_bytes)
-                s.sendall(image_data)
-                size_data = s.recv(8)
-                size = int.from_bytes(size_data, 'big')
-                response = b''
-                bytes_received = 0
-                while bytes_received < size:
-                    chunk = s.recv(min(size - bytes_received, 8192))
-                    if not chunk:
-                        break
-                    response += chunk
-                    bytes_received += len(chunk)
-            t3 = time.time() - start_time
+            return metrics
             
-            # T4: LB2 -> Serviço
-            start_time = time.time()
-            host, port = lb2_service.split(':')
-            with try_connect(host, port) as s:
-                size_bytes = len(image_data).to_bytes(8, 'big')
-                s.sendall(size_bytes)
-                s.sendall(image_data)
-                size_data = s.recv(8)
-                size = int.from_bytes(size_data, 'big')
-                response = b''
-                bytes_received = 0
-                while bytes_received < size:
-                    chunk = s.recv(min(size - bytes_received, 8192))
-                    if not chunk:
-                        break
-                    response += chunk
-                    bytes_received += len(chunk)
-            t4 = time.time() - start_time
+        except Exception as e:
+            logger.error(f"Erro na requisição {request_count}: {str(e)}")
+            if self.results:
+                kind = OVERLOADED if isinstance(e, OverloadedError) else 'error'
+                self.results.failure(request_count, kind, str(e), intended_time)
+            raise
+
+    def send_request(self, image_data: bytes, request_num: int) -> Dict[str, Any]:
+        """
+        Envia uma requisição ao pipeline LB1 -> Serviço S1 -> LB2 -> Serviço S2.
+
+        O serviço S1 pré-processa a imagem e a encaminha ao estágio seguinte; o
+        serviço S2 classifica e a resposta retorna pelo mesmo caminho. Cada nó
+        carimba seus instantes na mensagem, e os tempos das etapas são obtidos
+        pela diferença entre carimbos consecutivos.
+        """
+        try:
+            header = {'request_id': request_num, 'payload': self.payload, 'accept': self.response_format}
+            sent_at = stamp(header, 'source_send')
+            # O LB1 escolhe o serviço de entrada pela política configurada e envia a requisição
+            lb1_service, reply = self.lb1.forward(encode_request(image_data, header))
+            received_at = time.time()
+            logger.info(f"Request {request_num}: Usando serviço {lb1_service}")
             
-            # T5: Processamento Serviço
-            start_time = time.time()
-            host, port = lb2_service.split(':')
-            with try_connect(host, port) as s:
-                size_bytes = len(image_data).to_bytes(8, 'big')
-                s.sendall(size_bytes)
-                s.sendall(image_data)
-                size_data = s.recv(8)
-                size = int.from_bytes(size_data, 'big')
-                response = b''
-                bytes_received = 0
-                while bytes_received < size:
-                    chunk = s.recv(min(size - bytes_received, 8192))
-                    if not chunk:
-                        break
-                    response += chunk
-                    bytes_received += len(chunk)
-            t5 = time.time() - start_time
+            response = decode_response(reply)
+            if response.get('error') == OVERLOADED:
+                # Recusa rápida por sobrecarga: o serviço está saudável, apenas no limite
+                raise OverloadedError(f"Requisição recusada por sobrecarga: {response.get('detail', lb1_service)}")
+            if response.get('status') != 'success':
+                self.lb1.mark_service_error(lb1_service)
+                raise Exception(f"Erro no pipeline: {response.get('error', 'Erro desconhecido')}")
             
-            # T6: Serviço S2 -> Source
-            start_time = time.time()
-            host, port = lb2_service.split(':')
-            with try_connect(host, port) as s:
-                size_bytes = len(image_data).to_bytes(8, 'big')
-                s.sendall(size_bytes)
-                s.sendall(image_data)
-                size_data = s.recv(8)
-                size = int.from_bytes(size_data, 'big')
-                response = b''
-                bytes_received = 0
-                while bytes_received < size:
-                    chunk = s.recv(min(size - bytes_received, 8192))
-                    if not chunk:
-                        break
-                    response += chunk
-                    bytes_received += len(chunk)
-            t6 = time.time() - start_time
+            at = stamp_times(response['stamps'])
+            # Respostas do cache de resultados do S1 não passam pelo S2: as etapas não percorridas contam como zero
+            previous = at['s1_recv']
+            for label in ('s1_forward', 's2_recv', 's2_process_start', 's2_process_end'):
+                previous = at.setdefault(label, previous)
+            # T1: Source -> LB1 -> Serviço S1
+            t1 = at['s1_recv'] - sent_at
+            # T2: Pré-processamento no Serviço S1
+            t2 = at['s1_forward'] - at['s1_recv']
+            # T3: Serviço S1 -> LB2 -> Serviço S2
+            t3 = at['s2_recv'] - at['s1_forward']
+            # T4: Espera no Serviço S2
+            t4 = at['s2_process_start'] - at['s2_recv']
+            # T5: Processamento Serviço S2
+            t5 = at['s2_process_end'] - at['s2_process_start']
+            # T6: Serviço S2 -> Serviço S1 -> Source
+            t6 = received_at - at['s2_process_end']
             
-            # Marca os serviços como bem-sucedidos
-            self.lb1.mark_service_success(lb1_service, t1 + t2)
-            self.lb2.mark_service_success(lb2_service, t3 + t4 + t5 + t6)
+            route = response.get('route', [])
+            lb2_service = route[1] if len(route) > 1 else 'unknown'
             
             return {
                 't1': t1,
@@ -423,51 +538,65 @@ class Source:
                 't4': t4,
                 't5': t5,
                 't6': t6,
-                'mrt': t1 + t2 + t3 + t4 + t5 + t6,
-                'response': response.decode(),
+                'mrt': received_at - sent_at,
+                'response': response,
                 'lb1_service': lb1_service,
                 'lb2_service': lb2_service
             }
         except Exception as e:
+            # Erros de conexão já foram contabilizados no serviço pelo LB1
             logger.error(f"Erro ao processar request {request_num}: {str(e)}")
-            # Marca os serviços como com erro
-            if 'lb1_service' in locals():
-                self.lb1.mark_service_error(lb1_service)
-            if 'lb2_service' in locals():
-                self.lb2.mark_service_error(lb2_service)
             raise
 
     def _print_summary(self):
-        """Imprime um resumo das métricas coletadas."""
-        if not self.metrics_history:
+        """Imprime um resumo das métricas coletadas: médias e percentis de cada etapa."""
+        if not self.latencies.count:
             return
 
-        t1_avg = np.mean([m["t1_source_lb1"] for m in self.metrics_history])
-        t2_avg = np.mean([m["t2_lb1_service"] for m in self.metrics_history])
-        t3_lb2_avg = np.mean([m["t3_service_lb2"] for m in self.metrics_history])
-        t4_service_avg = np.mean([m["t4_lb2_service"] for m in self.metrics_history])
-        t5_return_avg = np.mean([m["t5_service_source"] for m in self.metrics_history])
-        t_process_avg = np.mean([m["t_processamento"] for m in self.metrics_history])
-        t5_total_avg = np.mean([m["t5_total"] for m in self.metrics_history])
-        average_intermediate_avg = np.mean([m["average_intermediate"] for m in self.metrics_history])
-
+        summary = self.latencies.summary()
         logger.info("\n=== Resumo das Médias ===")
-        logger.info(f"Tempo Médio T1 (Source -> LB1): {t1_avg:.3f}s")
-        logger.info(f"Tempo Médio T2 (LB1 -> Serviço): {t2_avg:.3f}s")
-        logger.info(f"Tempo Médio (Serviço S1 -> LB2): {t3_lb2_avg:.3f}s")
-        logger.info(f"Tempo Médio (LB2 -> Serviço S2): {t4_service_avg:.3f}s")
-        logger.info(f"Tempo Médio (Processamento Serviço S2): {t_process_avg:.3f}s")
-        logger.info(f"Tempo Médio T5 (Serviço S2 -> Source): {t5_return_avg:.3f}s")
-        logger.info(f"MRT (Tempo Total da Requisição): {t5_total_avg:.3f}s")
-        logger.info(f"Média dos Tempos Intermediários: {average_intermediate_avg:.3f}s")
+        for stage, label in METRIC_STAGES.items():
+            logger.info(f"{label}: {summary[stage]['mean']:.3f}s")
+
+        logger.info(f"\n=== Percentis por Etapa ({self.latencies.count} requisições, ms) ===")
+        columns = ['p50'] + [f'p{q:g}' for q in PERCENTILES[1:]] + ['max']
+        logger.info(f"{'Etapa':<38}" + "".join(f"{column:>10}" for column in columns))
+        for stage, label in METRIC_STAGES.items():
+            logger.info(f"{label:<38}" + "".join(f"{summary[stage][column] * 1000:>10.2f}" for column in columns))
+        
+        if self.latencies.store is not None:
+            for level, name in (('lb1_service', 'S1'), ('lb2_service', 'S2')):
+                for service, mrt in self.latencies.store.mean_by_target(level, 't5_total').items():
+                    logger.info(f"MRT médio via serviço {name} {service}: {mrt:.3f}s")
+        if self.load_report:
+            report = self.load_report
+            logger.info(f"Taxa configurada: {report.target_rate:.2f} req/s")
+            logger.info(f"Taxa de envio alcançada: {report.offered_rate:.2f} req/s")
+            logger.info(f"Vazão (respostas/s): {report.throughput:.2f} req/s")
+            logger.info(f"Requisições com erro: {report.errors}")
+            logger.info(f"Requisições recusadas por sobrecarga: {report.rejected}")
+        measurement = self.measurement.summary()
+        if measurement['warmup_seconds'] is not None:
+            logger.info(f"Aquecimento descartado: {measurement['warmup_requests']} requisições "
+                        f"({measurement['warmup_seconds']:.2f}s)")
+        else:
+            logger.info(f"Aquecimento não concluído: {measurement['warmup_requests']} requisições descartadas")
+        if 'mean_ci' in measurement:
+            logger.info(f"MRT médio: {measurement['mean']:.4f}s ± {measurement['mean_ci']:.4f}s "
+                        f"({measurement['confidence']:.0%} de confiança, {measurement['samples']} amostras)")
+        if 'p99_ci' in measurement:
+            logger.info(f"MRT p99: {measurement['p99']:.4f}s (IC {measurement['p99_ci'][0]:.4f}s .. "
+                        f"{measurement['p99_ci'][1]:.4f}s)")
+        logger.info(f"Encerramento da medição: {measurement['stop_reason']}")
+        logger.info(f"Conexões TCP abertas: {self.lb1.pool.connects}")
         logger.info("===========================")
 
     def generate_graphs(self):
         """Gera gráficos de desempenho."""
         logger.info("Iniciando geração de gráficos...")
-        logger.info(f"Número de métricas coletadas: {len(self.metrics_history)}")
+        logger.info(f"Número de métricas coletadas: {self.latencies.count}")
         
-        if not self.metrics_history:
+        if not self.latencies.count:
             logger.warning("Não há dados para gerar gráficos")
             return
 
@@ -477,16 +606,8 @@ class Source:
             logger.info(f"Criando diretório para gráficos: {graphs_dir}")
             os.makedirs(graphs_dir, exist_ok=True)
             
-            # Prepara os dados
-            times = np.array([m["t5_total"] for m in self.metrics_history])
-            processing_times = np.array([m["t_processamento"] for m in self.metrics_history])
-            network_times = np.array([m["t1_source_lb1"] + m["t2_lb1_service"] + m["t3_service_lb2"] + m["t4_lb2_service"] + m["t5_service_source"] for m in self.metrics_history])
-            
-            logger.info(f"Tamanho dos arrays: times={times.size}, processing={processing_times.size}, network={network_times.size}")
-            
-            # Calcula o MRT médio geral
-            if times.size > 0:
-                mrt_medio_geral_seg = np.mean(times)
+            if self.latencies.count > 0:
+                mrt_medio_geral_seg = self.latencies.mean('t5_total')
                 mrt_medio_geral_ms = mrt_medio_geral_seg * 1000
                 logger.info(f"MRT médio: {mrt_medio_geral_ms:.2f}ms")
                 
@@ -511,26 +632,53 @@ class Source:
                 plt.savefig(mrt_path)
                 plt.close()
                 
-                # Gráfico 2: Tempos de Processamento vs. Rede
-                plt.figure(figsize=(10, 6))
-                x = np.arange(len(times))
-                plt.plot(x, processing_times * 1000, 'r-', label='Tempo de Processamento')
-                plt.plot(x, network_times * 1000, 'b-', label='Tempo de Rede')
-                plt.xlabel('Número da Requisição')
+                # Gráfico 2: Percentis de cada etapa (a partir dos histogramas)
+                summary = self.latencies.summary()
+                columns = ['p50'] + [f'p{q:g}' for q in PERCENTILES[1:]]
+                plt.figure(figsize=(12, 6))
+                x = np.arange(len(METRIC_STAGES))
+                width = 0.8 / len(columns)
+                for i, column in enumerate(columns):
+                    plt.bar(x + i * width, [summary[stage][column] * 1000 for stage in METRIC_STAGES],
+                            width, label=column)
+                plt.xticks(x + width * (len(columns) - 1) / 2, [label.split(' (')[0] for label in METRIC_STAGES.values()],
+                           rotation=30, ha='right')
                 plt.ylabel('Tempo (ms)')
-                plt.title('Tempos de Processamento vs. Rede')
+                plt.yscale('log')
+                plt.title('Percentis de Latência por Etapa')
                 plt.legend()
-                plt.grid(True)
-                
-                # Salva o segundo gráfico
-                processing_path = os.path.join(graphs_dir, 'processing_vs_network.png')
-                logger.info(f"Salvando gráfico de processamento em: {processing_path}")
-                plt.savefig(processing_path)
+                plt.grid(True, axis='y')
+                plt.tight_layout()
+                percentiles_path = os.path.join(graphs_dir, 'latency_percentiles.png')
+                logger.info(f"Salvando gráfico de percentis em: {percentiles_path}")
+                plt.savefig(percentiles_path)
                 plt.close()
+                generated = [mrt_path, percentiles_path]
+                
+                # Gráfico 3: Tempos de Processamento vs. Rede por requisição (requer as amostras, metrics.keep_raw)
+                if self.latencies.keep_raw:
+                    store = self.latencies.store
+                    processing_times = store.sum_of(('t2_lb1_service', 't_processamento'))
+                    network_times = store.sum_of(('t1_source_lb1', 't3_service_lb2', 't4_lb2_service', 't5_service_source'))
+                    plt.figure(figsize=(10, 6))
+                    x = np.arange(len(processing_times))
+                    plt.plot(x, processing_times * 1000, 'r-', label='Tempo de Processamento')
+                    plt.plot(x, network_times * 1000, 'b-', label='Tempo de Rede')
+                    plt.xlabel('Número da Requisição')
+                    plt.ylabel('Tempo (ms)')
+                    plt.title('Tempos de Processamento vs. Rede')
+                    plt.legend()
+                    plt.grid(True)
+                    
+                    processing_path = os.path.join(graphs_dir, 'processing_vs_network.png')
+                    logger.info(f"Salvando gráfico de processamento em: {processing_path}")
+                    plt.savefig(processing_path)
+                    plt.close()
+                    generated.append(processing_path)
                 
                 logger.info("\n=== Gráficos Gerados ===")
-                logger.info(f"Arquivo: {mrt_path}")
-                logger.info(f"Arquivo: {processing_path}")
+                for path in generated:
+                    logger.info(f"Arquivo: {path}")
                 logger.info("=====================")
             else:
                 logger.warning("Não há dados suficientes para gerar gráficos")
@@ -555,8 +703,11 @@ class Source:
             logger.info("Aguardando requisições em andamento terminarem...")
             time.sleep(2)  # Aguarda 2 segundos para as requisições terminarem
             
-            # Para o servidor
+            # Para o servidor e fecha as conexões persistentes
             self.network_manager.stop()
+            self.lb1.close()
+            if self.results:
+                self.results.close()
             
             # Força o flush dos logs novamente
             for handler in logger.handlers:
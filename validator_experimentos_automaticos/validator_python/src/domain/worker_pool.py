@@ -0,0 +1,68 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from .model_registry import get_classifier_for_artifact
+from .protocol import PAYLOAD_TENSOR
+
+logger = logging.getLogger(__name__)
+
+# Classificador do processo worker, carregado uma única vez na inicialização
+_classifier = None
+
+
+def _init_worker(artifact: str):
+    """Inicializa um processo worker com o modelo do artefato (herdado via fork ou mapeado em memória)."""
+    global _classifier
+    _classifier = get_classifier_for_artifact(artifact)
+    logger.info(f"Worker {os.getpid()} pronto")
+
+
+def _features(payload: Optional[str], body: bytes):
+    if payload == PAYLOAD_TENSOR:
+        return _classifier.features_from_tensor(body)
+    return _classifier.preprocess(body)
+
+
+def _preprocess(payload: Optional[str], body: bytes) -> bytes:
+    return _features(payload, body).tobytes()
+
+
+def _classify(payload: Optional[str], body: bytes) -> Tuple[str, float]:
+    class_name, confidence = _classifier.classify_features(_features(payload, body))
+    return class_name, float(confidence)
+
+
+class ProcessWorkerPool:
+    """
+    Pool de processos que executa a decodificação e a classificação.
+
+    Cada worker tem seu próprio interpretador (sem disputa pelo GIL) e carrega
+    o modelo uma vez. O processo do serviço continua responsável por aceitar
+    conexões e trocar mensagens; apenas o trabalho de CPU é enviado ao pool.
+    """
+
+    def __init__(self, artifact: str, size: int = 0, start_method: str = 'spawn'):
+        self.size = size or os.cpu_count() or 1
+        self.start_method = start_method
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(artifact,)
+        )
+        logger.info(f"Pool de {self.size} processos iniciado ({start_method})")
+
+    def preprocess(self, payload: Optional[str], body: memoryview) -> bytes:
+        """Decodifica a imagem em um worker e retorna o tensor 64x64."""
+        # O corpo pode ser uma view sobre o buffer da conexão; os workers recebem uma cópia serializável
+        return self._executor.submit(_preprocess, payload, bytes(body)).result()
+
+    def classify(self, payload: Optional[str], body: memoryview) -> Tuple[str, float]:
+        """Decodifica e classifica a imagem em um worker."""
+        return self._executor.submit(_classify, payload, bytes(body)).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -28,6 +28,9 @@ def main():
         # Obtém o caminho do diretório atual
         current_dir = os.path.dirname(os.path.abspath(__file__))
         config_path = os.path.join(current_dir, '..', 'config', 'source.yaml')
+        # SOURCE_CONFIG: configuração gerada para a execução (relativa à raiz do projeto)
+        if os.getenv('SOURCE_CONFIG'):
+            config_path = os.path.join(current_dir, '..', os.getenv('SOURCE_CONFIG'))
         
         # Inicializa o Source
         logger.info("Inicializando o Source...")
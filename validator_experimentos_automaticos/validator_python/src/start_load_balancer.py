@@ -0,0 +1,61 @@
+import os
+import sys
+import yaml
+import logging
+import signal
+from domain.load_balancer_server import LoadBalancerServer
+
+# Configuração de logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_balancer_config(lb_id: str) -> dict:
+    """
+    Lê a seção loadbalancer{LB_ID} do source.yaml. NUM_SERVICES e BASE_PORT,
+    se definidos, substituem a lista de serviços (mesmo padrão dos containers).
+    """
+    config_path = os.getenv('LB_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'source.yaml'))
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)[f'loadbalancer{lb_id}']
+
+    count = os.getenv('NUM_SERVICES')
+    if count is not None:
+        host, port = config['services'][0].split(':')
+        host = os.getenv('SERVICES_HOST', host)
+        base_port = int(os.getenv('BASE_PORT', port))
+        config['services'] = [f"{host}:{base_port + i}" for i in range(int(count))]
+    if os.getenv('LB_ALGORITHM'):
+        config['algorithm'] = os.getenv('LB_ALGORITHM')
+    return config
+
+
+def main():
+    """Inicia o load balancer LB_ID como um proxy TCP."""
+    lb_id = os.getenv('LB_ID', '1')
+    config = load_balancer_config(lb_id)
+    server = LoadBalancerServer(
+        host='0.0.0.0',
+        port=int(os.getenv('LB_PORT', config['port'])),
+        services=config['services'],
+        algorithm=config.get('algorithm', 'round-robin'),
+        max_connections=config.get('max_connections', 1000),
+        pool_size=config.get('pool_size', 32),
+        name=f"LB{lb_id}"
+    )
+
+    def handle_signal(signum, frame):
+        logger.info("Recebido sinal para encerrar o load balancer")
+        server.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    server.start()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import signal
 import time
 from datetime import datetime
 from domain.service import Service
+from domain.model_registry import get_classifier
 
 # Configuração de logging
 logging.basicConfig(
@@ -37,18 +38,52 @@ class ServiceManager:
             'num_services': int(os.getenv('NUM_SERVICES_LB2', 2)),
             'base_port': int(os.getenv('BASE_PORT_LB2', 8085))
         }
+        
+        # Opções comuns a todos os serviços (config/service.yaml)
+        self.service_defaults = self.load_service_defaults()
+        
+        # Os serviços do LB1 encaminham para os serviços atrás do LB2
+        next_host = os.getenv('NEXT_LB_HOST', 'localhost')
+        next_port = int(os.getenv('NEXT_LB_PORT', self.lb2_config['base_port']))
+        # NEXT_NUM_SERVICES vazio (docker-compose sem LB2 em processo próprio) = serviços atrás do LB2
+        next_count = int(os.getenv('NEXT_NUM_SERVICES') or self.lb2_config['num_services'])
+        self.next_hop = [f"{next_host}:{next_port + i}" for i in range(next_count)]
+        
+        # Em um container de load balancer (LB_ID definido) apenas o seu estágio é iniciado
+        lb_id = os.getenv('LB_ID')
+        if lb_id:
+            own_config = self.lb1_config if lb_id == '1' else self.lb2_config
+            other_config = self.lb2_config if lb_id == '1' else self.lb1_config
+            own_config['num_services'] = int(os.getenv('NUM_SERVICES', own_config['num_services']))
+            own_config['base_port'] = int(os.getenv('BASE_PORT', own_config['base_port']))
+            other_config['num_services'] = 0
+    
+    def load_service_defaults(self) -> dict:
+        """Carrega as opções comuns dos serviços, se o arquivo existir."""
+        defaults_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'service.yaml')
+        if not os.path.exists(defaults_path):
+            return {}
+        with open(defaults_path, 'r') as f:
+            return (yaml.safe_load(f) or {}).get('service', {})
     
     def create_service_config(self, port: int, lb_id: int) -> str:
         """Cria um arquivo de configuração temporário para o serviço."""
-        config = {
-            'service': {
-                'host': '0.0.0.0',
-                'port': port,
-                'lb_id': lb_id
-            }
-        }
+        config = {'service': dict(self.service_defaults)}
+        config['service'].update({
+            'host': '0.0.0.0',
+            'port': port,
+            'lb_id': lb_id
+        })
+        if lb_id == 1:
+            config['service']['next_hop'] = self.next_hop
+        # Modelo do servidor ('threaded' ou 'asyncio') e backlog de conexões
+        if os.getenv('SERVICE_SERVER'):
+            config['service']['server'] = os.getenv('SERVICE_SERVER')
+        if os.getenv('SERVICE_BACKLOG'):
+            config['service']['backlog'] = int(os.getenv('SERVICE_BACKLOG'))
         
-        config_path = f"validator_python/config/service_{port}.yaml"
+        # SERVICE_CONFIG_DIR: diretório das configurações geradas (modo local do run_experiments.py)
+        config_path = os.path.join(os.getenv('SERVICE_CONFIG_DIR', 'validator_python/config'), f"service_{port}.yaml")
         os.makedirs(os.path.dirname(config_path), exist_ok=True)
         
         with open(config_path, 'w') as f:
@@ -94,6 +129,10 @@ class ServiceManager:
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         
+        # Carrega (ou treina) o modelo uma única vez; todos os serviços o compartilham
+        if self.lb1_config['num_services'] + self.lb2_config['num_services'] > 0:
+            get_classifier(train_workers=self.service_defaults.get('train_workers', 0))
+        
         # Inicia serviços do Load Balancer 1
         for i in range(self.lb1_config['num_services']):
             port = self.lb1_config['base_port'] + i
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos são importados como nos serviços e benchmarks (domain.*, a partir de src/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
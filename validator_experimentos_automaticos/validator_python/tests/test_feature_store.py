@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pytest
+
+from domain.feature_store import FeatureStore
+
+PARAMS = {'size': 16}
+
+
+def _process(path: str) -> np.ndarray:
+    """Características determinísticas a partir do conteúdo do arquivo."""
+    with open(path, 'rb') as f:
+        return np.frombuffer(f.read().ljust(PARAMS['size'], b'\0')[:PARAMS['size']], dtype=np.uint8).copy()
+
+
+def _unexpected(path: str) -> np.ndarray:
+    raise AssertionError(f"{path} não deveria ser reprocessada")
+
+
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / 'images'
+    directory.mkdir()
+    files = []
+    for i in range(12):
+        path = directory / f'img_{i:02d}.jpg'
+        path.write_bytes(bytes([i, 255 - i]) * 8)
+        files.append((str(path), i % 2))
+    return files
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Linhas de cada gravação completa da matriz (FeatureStore._save) no armazenamento testado."""
+    calls = []
+    original = FeatureStore._save
+
+    def save(self, features, entries):
+        if os.path.basename(self.directory) == 'store':
+            calls.append(len(entries))
+        original(self, features, entries)
+
+    monkeypatch.setattr(FeatureStore, '_save', save)
+    return calls
+
+
+def _rebuild(tmp_path, files):
+    return FeatureStore(str(tmp_path / 'rebuild'), PARAMS).sync(files, _process)
+
+
+def test_append_twice_matches_full_rebuild(tmp_path, images, saves):
+    store = FeatureStore(str(tmp_path / 'store'), PARAMS, workers=2)
+    store.sync(images[:6], _process)
+    store.sync(images[:9], _process)
+    X, y = store.sync(images, _process)
+    assert saves == [6]  # Só a primeira sincronização grava a matriz inteira
+
+    expected_X, expected_y = _rebuild(tmp_path, images)
+    np.testing.assert_array_equal(X, expected_X)
+    np.testing.assert_array_equal(y, expected_y)
+
+    # Recarregada do disco, sem reprocessar nenhuma imagem
+    X, y = FeatureStore(str(tmp_path / 'store'), PARAMS).sync(images, _unexpected)
+    np.testing.assert_array_equal(X, expected_X)
+    np.testing.assert_array_equal(y, expected_y)
+    assert np.load(store.features_path).shape == (len(images), PARAMS['size'])
+
+
+def _strip_header_padding(path: str):
+    """Regrava o .npy com o cabeçalho sem nenhum espaço livre para uma forma maior."""
+    array = np.load(path)
+    header = repr({'descr': np.lib.format.dtype_to_descr(array.dtype), 'fortran_order': False,
+                   'shape': array.shape}) + '\n'
+    with open(path, 'wb') as f:
+        f.write(np.lib.format.magic(1, 0))
+        f.write(len(header).to_bytes(2, 'little'))
+        f.write(header.encode('latin1'))
+        f.write(array.tobytes())
+
+
+def test_append_falls_back_to_full_rewrite_when_header_is_full(tmp_path, images, saves):
+    store = FeatureStore(str(tmp_path / 'store'), PARAMS)
+    store.sync(images[:9], _process)
+    _strip_header_padding(store.features_path)
+    np.testing.assert_array_equal(np.load(store.features_path), _rebuild(tmp_path, images[:9])[0])
+
+    # (9, 16) -> (12, 16) não cabe no cabeçalho: a matriz é regravada
+    X, y = store.sync(images, _process)
+    assert saves == [9, 12]
+
+    expected_X, expected_y = _rebuild(tmp_path, images)
+    np.testing.assert_array_equal(X, expected_X)
+    np.testing.assert_array_equal(y, expected_y)
+    X, y = FeatureStore(str(tmp_path / 'store'), PARAMS).sync(images, _unexpected)
+    np.testing.assert_array_equal(X, expected_X)
+    np.testing.assert_array_equal(y, expected_y)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from domain.protocol import (RESPONSE_BINARY, RESPONSE_JSON, RESPONSE_MAGIC, decode_response, encode_response,
+                             overloaded_response)
+
+
+def _response(**changes):
+    response = {
+        'status': 'success',
+        'class': 'Moto',
+        'confidence': 0.75,
+        'processing_time': 0.001234,
+        'model_version': '0123456789abcdef',
+        'request_id': 42,
+        'route': ['service-1:8083', 'service-2:8085'],
+        'stamps': [['source_send', 1700000000.125], ['s1_recv', 1700000000.25], ['s2_reply', 1700000000.5]]
+    }
+    response.update(changes)
+    return response
+
+
+@pytest.mark.parametrize('changes', [
+    {},
+    {'class': 'Carro', 'cached': True},
+    {'request_id': None, 'route': [], 'stamps': []},
+])
+def test_binary_response_round_trip(changes):
+    response = _response(**changes)
+    data = encode_response(response, RESPONSE_BINARY)
+    assert data[:len(RESPONSE_MAGIC)] == RESPONSE_MAGIC
+
+    decoded = decode_response(memoryview(data))
+    assert decoded['confidence'] == pytest.approx(response['confidence'], rel=1e-6)  # float32
+    assert decoded['processing_time'] == pytest.approx(response['processing_time'], abs=1e-9)
+    for key in ('status', 'class', 'model_version', 'request_id', 'route', 'stamps'):
+        assert decoded[key] == response[key], key
+    assert decoded.get('cached', False) == response.get('cached', False)
+
+
+def test_binary_response_without_model_version():
+    response = _response()
+    del response['model_version']
+    assert 'model_version' not in decode_response(encode_response(response, RESPONSE_BINARY))
+
+
+def test_json_response_round_trip():
+    response = _response(cached=True)
+    data = encode_response(response, RESPONSE_JSON)
+    assert json.loads(data) == response
+    assert decode_response(data) == response
+
+
+@pytest.mark.parametrize('response', [
+    overloaded_response([['s1_recv', 1.0]], 'limite'),
+    {'status': 'error', 'error': 'falha', 'stamps': []},
+    _response(stamps=[['desconhecido', 1.0]]),
+    _response(**{'class': 'Caminhão'}),
+])
+def test_binary_falls_back_to_json(response):
+    data = encode_response(response, RESPONSE_BINARY)
+    assert data[:len(RESPONSE_MAGIC)] != RESPONSE_MAGIC
+    assert decode_response(data) == response